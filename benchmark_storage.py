@@ -0,0 +1,75 @@
+import os
+import sys
+import threading
+import time
+
+import main_pb2
+from setup import reset_database, structure_tables
+from storage_helpers import Storage
+
+"""
+SAVE_GAME throughput of the storage layer.
+
+Several threads save games concurrently, like the Main server's request
+threads, while one thread keeps reading VIEW_HISTORY. Each configuration
+runs on a fresh database.
+
+Usage: python benchmark_storage.py [writers] [games per writer]
+"""
+
+DB_PATH = "data/r1/bench_poker.db"
+
+CONFIGS = [
+    ("rollback journal, commit per write", dict(wal=False, commit_window=None)),
+    ("WAL, commit per write", dict(wal=True, commit_window=None)),
+    ("WAL, group commit", dict(wal=True, commit_window=0)),
+    ("WAL, group commit, 2 ms window", dict(wal=True, commit_window=0.002)),
+]
+
+
+def run(config, writers, games):
+    reset_database([DB_PATH])
+    structure_tables(DB_PATH)
+    storage = Storage(DB_PATH, **config)
+    for i in range(writers):
+        storage.register(f"p{i}", "hash")
+    commits_before = storage.commits
+
+    done = threading.Event()
+    reads = [0]
+
+    def save(i):
+        entry = main_pb2.GameHistoryEntry(game_type=main_pb2.TEXAS, money_won=1, player=f"p{i}")
+        for _ in range(games):
+            storage.save_games([entry])
+
+    def read():
+        while not done.is_set():
+            storage.history_page(1)
+            reads[0] += 1
+
+    reader = threading.Thread(target=read)
+    threads = [threading.Thread(target=save, args=(i,)) for i in range(writers)]
+    reader.start()
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    done.set()
+    reader.join()
+
+    reset_database([DB_PATH])
+    return writers * games / elapsed, storage.commits - commits_before, reads[0] / elapsed
+
+
+if __name__ == "__main__":
+    writers = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+    games = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
+
+    print(f"{writers} writers x {games} SAVE_GAME, 1 VIEW_HISTORY reader")
+    for name, config in CONFIGS:
+        saves, commits, reads = run(config, writers, games)
+        print(f"{name:36} {saves:8.0f} saves/s {commits:6} commits {reads:8.0f} reads/s")
@@ -0,0 +1,191 @@
+import hashlib
+import logging
+import math
+import threading
+import time
+from collections import OrderedDict
+
+
+class UserCache:
+    """
+    Bounded LRU cache of users: username -> (user_id, passhash, moolah).
+
+    Filled on read misses and kept up to date by Storage with the changes of
+    every committed write (write-through), so a hit is always current and
+    costs a dict lookup. user_id is indexed too, since sessions carry it.
+    """
+
+    def __init__(self, capacity=10000):
+        """
+        Parameters:
+        - capacity:
+            most users kept, the least recently used is evicted beyond it
+        """
+        self.capacity = capacity
+        self.users = OrderedDict()
+        self.usernames = {}
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # bumped by every write-through, see fill()
+        self.version = 0
+        self.thread = None
+
+    def get(self, username):
+        """
+        (user_id, passhash, moolah) of a cached user, or None on a miss.
+        """
+        with self.lock:
+            user = self.users.get(username)
+            if user is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.users.move_to_end(username)
+            return user
+
+    def get_by_id(self, user_id):
+        """
+        (username, passhash, moolah) of a cached user, or None on a miss.
+        """
+        with self.lock:
+            username = self.usernames.get(user_id)
+            if username is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.users.move_to_end(username)
+            user_id, passhash, moolah = self.users[username]
+            return username, passhash, moolah
+
+    def put(self, username, user_id, passhash, moolah):
+        with self.lock:
+            self.store(username, user_id, passhash, moolah)
+
+    def store(self, username, user_id, passhash, moolah):
+        """
+        Add or refresh a user, evicting the least recently used. The caller holds self.lock.
+        """
+        self.users[username] = (user_id, passhash, moolah)
+        self.users.move_to_end(username)
+        self.usernames[user_id] = username
+        while len(self.users) > self.capacity:
+            evicted, (evicted_id, _, _) = self.users.popitem(last=False)
+            del self.usernames[evicted_id]
+            self.evictions += 1
+
+    def fill(self, username, user_id, passhash, moolah, version):
+        """
+        Cache a user read from the database after a miss.
+
+        version is self.version from before the read. If a write was applied
+        since, the row read may predate it, so it is not cached.
+        """
+        with self.lock:
+            if version == self.version:
+                self.store(username, user_id, passhash, moolah)
+
+    def remove(self, username):
+        with self.lock:
+            user = self.users.pop(username, None)
+            if user is not None:
+                del self.usernames[user[0]]
+
+    def clear(self):
+        with self.lock:
+            self.users.clear()
+            self.usernames.clear()
+            self.version += 1
+
+    def apply(self, changes):
+        """
+        Write through the changes of a committed write, as recorded for the leaderboard.
+        Balances of users that are not cached are left for the next miss.
+        """
+        with self.lock:
+            self.version += 1
+        for change in changes:
+            if change[0] == "user":
+                self.put(*change[1:])
+            elif change[0] == "moolah":
+                with self.lock:
+                    user = self.users.get(change[1])
+                    if user is not None:
+                        self.users[change[1]] = (user[0], user[1], change[2])
+            elif change[0] == "remove":
+                self.remove(change[1])
+
+    def stats(self):
+        """
+        Hit rate and size of the cache.
+        """
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self.users),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+    def run(self, interval):
+        while True:
+            time.sleep(interval)
+            stats = self.stats()
+            logging.info(
+                f"[CACHE] users={stats['size']}, hits={stats['hits']}, misses={stats['misses']}, "
+                f"evictions={stats['evictions']}, hit_rate={stats['hit_rate']:.2%}"
+            )
+
+    def start(self, interval=60):
+        """
+        Log the cache metrics every interval seconds on a background thread.
+        """
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.run, args=(interval,), daemon=True)
+            self.thread.start()
+
+
+class BloomFilter:
+    """
+    Set membership with no false negatives and a small rate of false positives.
+
+    Each item sets num_hashes bits of a bit array, derived from one blake2b
+    digest by double hashing. Items cannot be removed, so a deleted item
+    stays a possible positive.
+    """
+
+    def __init__(self, capacity=1000, error_rate=0.01, items=()):
+        """
+        Parameters:
+        - capacity:
+            items the filter is sized for, beyond it false positives grow
+        - error_rate:
+            false positive rate at capacity
+        - items:
+            initial items
+        """
+        self.capacity = max(capacity, 1)
+        self.num_bits = math.ceil(-self.capacity * math.log(error_rate) / math.log(2) ** 2)
+        self.num_hashes = max(1, round(self.num_bits / self.capacity * math.log(2)))
+        self.bits = bytearray((self.num_bits + 7) // 8)
+        self.count = 0
+        for item in items:
+            self.add(item)
+
+    def positions(self, item):
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        # odd, so the probes cover the array
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.num_bits for i in range(self.num_hashes)]
+
+    def add(self, item):
+        for position in self.positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, item):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self.positions(item))
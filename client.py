@@ -1,3 +1,4 @@
+import collections
 import os
 import queue
 import sys
@@ -6,19 +7,22 @@ import time
 import tkinter as tk
 import json
 import logging
+import uuid
 
 import grpc
 import numpy as np
 
 import main_pb2_grpc
 import main_pb2
-import raft_pb2_grpc
-import raft_pb2
 import lobby_pb2_grpc
 import lobby_pb2
+from leader_helpers import LeaderDiscovery, ReplicaReads, leader_hint, without_credentials
 
 num_servers = 5
-num_lobbies = 2
+# games fetched per VIEW_HISTORY request, more are fetched on scroll
+history_page_size = 10
+# moolah added by the "Load Moolah" button
+load_money_amount = 100
 
 # log to a file
 log_file = "logs/client.log"
@@ -45,24 +49,36 @@ all_servers = [
     for i in range(num_servers)
 ]
 
-# get names of all lobbies
-all_lobbies = [
-    f"{config['lobbies']['lobby_hosts'][i]}:{config['lobbies']['lobby_ports'][i]}"
-    for i in range(num_lobbies)
-]
+# finds the leader among all servers
+discovery = LeaderDiscovery(all_servers)
+# reads go to every replica in turn, not just the leader
+replica_reads = ReplicaReads(all_servers)
 
 # A thread-safe queue for outgoing MainRequests.
 outgoing_queue = queue.Queue()
 lobby_queue = queue.Queue()
+# requests recently sent to main, to resend a rejected one with its credentials
+sent_requests = collections.deque(maxlen=16)
 
 
 def request_generator():
     """Yield MainRequests from the outgoing_queue."""
     while True:
         req = outgoing_queue.get()
+        sent_requests.append(req)
         yield req
 
 
+def original_request(rejected):
+    """
+    The request we sent that a follower rejected, which it echoes without credentials.
+    """
+    for req in reversed(sent_requests):
+        if without_credentials(req) == rejected:
+            return req
+    return rejected
+
+
 def lobby_request_generator():
     """Yield LobbyRequests from the lobby_queue."""
     while True:
@@ -101,12 +117,22 @@ class ClientUI:
         self.root.geometry("800x600")
 
         self.credentials = None
+        # proves who we are to main and lobbies after logging in
+        self.session_token = None
         self.leader_address = None
         self.stop_main_event = threading.Event()
         self.stop_lobby_event = threading.Event()
         self.players = []
         self.voted = False
-        self.lobby_idx = 0
+        # lobby main found for us, lobbies come and go so main sends the address
+        self.lobby_address = None
+        self.seat_token = None
+        # history screen, filled one page at a time
+        self.history = []
+        self.history_cursor = ""
+        self.history_loading = False
+        self.history_more = False
+        self.history_list = None
 
         # connect to main leader
         self.check_for_leader()
@@ -126,71 +152,94 @@ class ClientUI:
         try:
             # responses = self.stub.Main(request_generator())
             for resp in self.responses_iter:
-                logging.info(f"Size of response: {sys.getsizeof(resp)}")
-                action = resp.action
-                if action == main_pb2.CHECK_USERNAME:
-                    # destroy current screen
-                    self.destroy_user_entry()
-                    # if the username exists, go to login
-                    # if not, go to register
-                    if not resp.result:
-                        self.setup_login()
-                    else:
-                        self.setup_register()
-                elif action == main_pb2.LOGIN:
-                    # if login successful, update users and go to undelivered
-                    # if not, go to login with failed
-                    if resp.result:
-                        self.moolah = resp.moolah
-                        self.credentials = self.login_entry.get()
-                        self.login_frame.destroy()
-                        self.setup_main()
-                    else:
-                        self.login_frame.destroy()
-                        self.setup_login(failed=True)
-                elif action == main_pb2.REGISTER:
-                    # if successful login, update users and go to main
-                    # if not, go to register with failed
-                    if resp.result:
-                        self.moolah = resp.moolah
-                        self.credentials = self.register_entry.get()
-                        self.register_frame.destroy()
-                        self.setup_main()
-                    else:
-                        self.register_username_exists_label.pack()
-                elif action == main_pb2.DELETE_ACCOUNT:
-                    # if successful, reset login vars and go to deleted
-                    # if not, go to settings with failed
-                    if resp.result:
-                        self.reset_login_vars()
-                        self.destroy_settings()
-                        self.setup_deleted()
-                    else:
-                        self.destroy_settings()
-                        self.setup_settings(failed=True)
-                elif action == main_pb2.GET_USER_INFO:
-                    # if successful, update moolah and go to main
-                    if resp.result:
-                        self.moolah = resp.moolah
-                        self.rerender_main()
-                elif action == main_pb2.JOIN_LOBBY:
-                    # if successful, set up lobby
-                    if resp.result:
-                        self.lobby_idx = resp.game_lobby
-                        self.destroy_main()
-                        self.setup_lobby_found()
-                    else:
-                        pass
-                elif action == main_pb2.VIEW_HISTORY:
-                    # if successful, show history
-                    if resp.result:
-                        self.history = resp.game_history
-                        self.destroy_main()
-                        self.setup_history()
+                self.process_response(resp)
         except grpc.RpcError as e:
             logging.error(f"Error receiving response: {e}")
             if not self.stop_main_event.is_set():
-                self.check_for_leader()
+                # a follower tells us where the leader is and what it rejected
+                hint, rejected = leader_hint(e)
+                self.check_for_leader(hint, reconnect=True)
+                if rejected is not None:
+                    outgoing_queue.put(original_request(rejected))
+        else:
+            # main ended the stream cleanly, but the connection is gone all the same
+            if not self.stop_main_event.is_set():
+                logging.error("Main closed the stream, reconnecting to server...")
+                self.check_for_leader(reconnect=True)
+
+    def process_response(self, resp):
+        """
+        Update the UI with a response from main, from the Main stream or a Read.
+        """
+        logging.info(f"Size of response: {sys.getsizeof(resp)}")
+        action = resp.action
+        if action == main_pb2.CHECK_USERNAME:
+            # destroy current screen
+            self.destroy_user_entry()
+            # if the username exists, go to login
+            # if not, go to register
+            if not resp.result:
+                self.setup_login()
+            else:
+                self.setup_register()
+        elif action == main_pb2.LOGIN:
+            # if login successful, update users and go to undelivered
+            # if not, go to login with failed
+            if resp.result:
+                self.moolah = resp.moolah
+                self.credentials = self.login_entry.get()
+                self.session_token = resp.session_token
+                self.login_frame.destroy()
+                self.setup_main()
+            else:
+                self.login_frame.destroy()
+                self.setup_login(failed=True)
+        elif action == main_pb2.REGISTER:
+            # if successful login, update users and go to main
+            # if not, go to register with failed
+            if resp.result:
+                self.moolah = resp.moolah
+                self.credentials = self.register_entry.get()
+                self.session_token = resp.session_token
+                self.register_frame.destroy()
+                self.setup_main()
+            else:
+                self.register_username_exists_label.pack()
+        elif action == main_pb2.DELETE_ACCOUNT:
+            # if successful, reset login vars and go to deleted
+            # if not, go to settings with failed
+            if resp.result:
+                self.reset_login_vars()
+                self.destroy_settings()
+                self.setup_deleted()
+            else:
+                self.destroy_settings()
+                self.setup_settings(failed=True)
+        elif action in (main_pb2.GET_USER_INFO, main_pb2.LOAD_MONEY):
+            # if successful, update moolah and go to main
+            if resp.result:
+                self.moolah = resp.moolah
+                self.rerender_main()
+        elif action in (main_pb2.JOIN_LOBBY, main_pb2.QUEUE):
+            # if successful (or seated by the matchmaker), set up lobby
+            if resp.result:
+                self.lobby_address = resp.lobby_address
+                self.seat_token = resp.seat_token
+                self.destroy_main()
+                self.setup_lobby_found()
+            else:
+                pass
+        elif action == main_pb2.VIEW_HISTORY:
+            # if successful, show history or add the next page to it
+            self.history_loading = False
+            if resp.result:
+                self.history_cursor = resp.next_cursor
+                if self.history_more:
+                    self.add_history(resp.game_history)
+                else:
+                    self.history = list(resp.game_history)
+                    self.destroy_main()
+                    self.setup_history()
 
     def lobby_handle_responses(self):
         """
@@ -206,10 +255,16 @@ class ClientUI:
                         self.destroy_lobby_found()
                         self.setup_lobby()
                     else:
-                        pass
+                        # seat expired or table filled up, go back to main
+                        self.root.after(
+                            0, lambda: self.reconnect_to_server(self.destroy_lobby_found)
+                        )
                 elif action == lobby_pb2.SHOW_LOBBY:
                     # update when players join or vote
-                    self.players = resp.user_info
+                    # the roster is shared by everyone, so filter out self
+                    self.players = [
+                        p for p in resp.user_info if p.username != self.credentials
+                    ]
                     self.destroy_lobby()
                     self.setup_lobby()
                 elif action == lobby_pb2.SEND_VOTE:
@@ -241,42 +296,35 @@ class ClientUI:
             if not self.stop_main_event.is_set():
                 logging.error("Error receiving response, reconnecting to server...")
 
-    def check_for_leader(self, retries=6):
+    def check_for_leader(self, hint=None, reconnect=False):
         """
         Check for the leader of the servers.
-        Retries 6 times by default.
+        Asks all replicas in parallel, retrying with backoff for up to 30 seconds.
+
+        Parameters
+        ----------
+        hint : str
+            Leader address from a NOT_LEADER rejection, tried first.
+        reconnect : bool
+            Open a new stream even if the leader did not change, used once
+            the current stream has ended.
         """
-        if retries <= 0:
-            logging.error("Could not find leader.")
-            sys.exit(1)
         logging.info("Checking for leader...")
-        time.sleep(5)
         # we want to make sure that we are connected to the leader
         # if we are not connected OR we had errors in connecting to the leader
         # we need to ask replicas for new leader
-        no_leader = True
         previous_leader = self.leader_address
-        for server in all_servers:
-            try:
-                channel = grpc.insecure_channel(server)
-                stub = raft_pb2_grpc.RaftServiceStub(channel)
-                response = stub.GetLeader(raft_pb2.GetLeaderRequest(useless=True))
-                if response.leader_address:
-                    logging.info(f"Leader found: {response.leader_address}")
-                    logging.info(f"Info came from: {server}")
-                    self.leader_address = response.leader_address
-                    no_leader = False
-                    break
-            except grpc.RpcError as e:
-                logging.error(f"Error connecting to {server}: {e}")
-
-        if no_leader:
-            self.check_for_leader(retries - 1)
-            return
-        if self.leader_address != previous_leader:
-            # new leader
+        leader = discovery.discover(hint=hint)
+        if leader is None:
+            logging.error("Could not find leader.")
+            sys.exit(1)
+        self.leader_address = leader
+        if reconnect or self.leader_address != previous_leader:
+            # new leader, or the old stream ended
             try:
-                self.request_thread.join()
+                # the response thread itself reconnects when its stream ends
+                if self.request_thread is not threading.current_thread():
+                    self.request_thread.join()
                 self.channel.close()
             except:
                 pass
@@ -293,6 +341,21 @@ class ClientUI:
             self.send_connect_request()
             self.send_user_info_request()
 
+    def send_read(self, request):
+        """
+        Send a read to the next replica on a background thread.
+        Falls back to the leader if the replica cannot answer it.
+        """
+
+        def read():
+            resp = replica_reads.read(request)
+            if resp is None:
+                outgoing_queue.put(request)
+            else:
+                self.process_response(resp)
+
+        threading.Thread(target=read, daemon=True).start()
+
     def send_connect_request(self):
         """
         When a new leader is found, send a connect request to the server.
@@ -309,15 +372,16 @@ class ClientUI:
         Reset the login variables.
         """
         self.credentials = None
+        self.session_token = None
 
-    def connect_to_lobby(self, lobby=0):
+    def connect_to_lobby(self, lobby):
         """
         Connect to a lobby.
 
         Parameters
         ----------
         lobby : str
-            The lobby to connect to.
+            Address ("host:port") of the lobby to connect to, sent by main.
         """
         self.lobby = lobby
 
@@ -329,7 +393,7 @@ class ClientUI:
         self.leader_address = None
         self.stop_main_event.clear()
 
-        self.lobby_channel = grpc.insecure_channel(all_lobbies[lobby])
+        self.lobby_channel = grpc.insecure_channel(lobby)
         self.lobby_stub = lobby_pb2_grpc.LobbyServiceStub(self.lobby_channel)
         self.lobby_responses_iter = self.lobby_stub.Lobby(lobby_request_generator())
         self.lobby_request_thread = threading.Thread(
@@ -340,14 +404,22 @@ class ClientUI:
 
         # KG: for some reason this needs to be done twice
         request = lobby_pb2.LobbyRequest(
-            action=lobby_pb2.JOIN_LOBBY, username=self.credentials
+            action=lobby_pb2.JOIN_LOBBY,
+            username=self.credentials,
+            session_token=self.session_token,
+            seat_token=self.seat_token,
         )
 
         lobby_queue.put(request)
 
-    def reconnect_to_server(self):
+    def reconnect_to_server(self, destroy_screen=None):
         """
         Reconnect to the server.
+
+        Parameters
+        ----------
+        destroy_screen : callable
+            Closes the current screen, the lobby screen by default.
         """
         # close lobby channel
         self.stop_lobby_event.set()
@@ -358,7 +430,7 @@ class ClientUI:
         self.stop_lobby_event.clear()
 
         self.check_for_leader()
-        self.destroy_lobby()
+        (destroy_screen or self.destroy_lobby)()
         self.setup_main()
 
     """
@@ -407,7 +479,7 @@ class ClientUI:
             username=username,
         )
 
-        outgoing_queue.put(request)
+        self.send_read(request)
 
     def send_delete_request(self, password):
         """
@@ -430,6 +502,7 @@ class ClientUI:
         request = main_pb2.MainRequest(
             action=main_pb2.JOIN_LOBBY,
             username=self.credentials,
+            session_token=self.session_token,
         )
 
         outgoing_queue.put(request)
@@ -501,6 +574,21 @@ class ClientUI:
         request = main_pb2.MainRequest(
             action=main_pb2.GET_USER_INFO,
             username=self.credentials,
+            session_token=self.session_token,
+        )
+
+        self.send_read(request)
+
+    def send_load_money_request(self, amount=load_money_amount):
+        """
+        Send a request to add moolah to the account.
+        The request_id stays the same if it is resent, so it is only added once.
+        """
+        request = main_pb2.MainRequest(
+            action=main_pb2.LOAD_MONEY,
+            session_token=self.session_token,
+            money_to_add=amount,
+            request_id=uuid.uuid4().hex,
         )
 
         outgoing_queue.put(request)
@@ -511,22 +599,52 @@ class ClientUI:
         """
         request = main_pb2.MainRequest(
             action=main_pb2.JOIN_LOBBY,
+            username=self.credentials,
+            session_token=self.session_token,
             game_type=game_type,
         )
 
         outgoing_queue.put(request)
     
-    def send_view_history_request(self):
+    def send_queue_request(self, game_type=main_pb2.TEXAS):
         """
-        Send a request to view the history of the user.
+        Wait in the matchmaking queue for a seat at a table.
         """
         request = main_pb2.MainRequest(
-            action=main_pb2.VIEW_HISTORY,
+            action=main_pb2.QUEUE,
             username=self.credentials,
+            session_token=self.session_token,
+            game_type=game_type,
+            # every lobby has the same buy-in
+            stake=100,
         )
 
         outgoing_queue.put(request)
 
+    def send_view_history_request(self, cursor=""):
+        """
+        Send a request for a page of the history of the user.
+        An empty cursor asks for the first page, which opens the history screen.
+        """
+        self.history_loading = True
+        self.history_more = bool(cursor)
+        request = main_pb2.MainRequest(
+            action=main_pb2.VIEW_HISTORY,
+            username=self.credentials,
+            session_token=self.session_token,
+            page_size=history_page_size,
+            cursor=cursor,
+        )
+
+        self.send_read(request)
+
+    def load_more_history(self):
+        """
+        Ask for the next page of history, unless all of it is shown or a page is on its way.
+        """
+        if self.history_cursor and not self.history_loading:
+            self.send_view_history_request(self.history_cursor)
+
 
     """
     Functions starting with "setup_" are used to set up the state of the tkinter window.
@@ -726,18 +844,26 @@ class ClientUI:
         )
         self.moolah_label.pack(side=tk.BOTTOM)
 
+        # add "Load Moolah" button
+        self.load_money_button = tk.Button(
+            self.main_frame,
+            text=f"Load {load_money_amount} Moolah",
+            command=lambda: self.send_load_money_request(),
+        )
+        self.load_money_button.pack(side=tk.BOTTOM)
+
         # add button for connecting to lobby 1
         self.lobby1_button = tk.Button(
             self.main_frame,
             text="Connect to Texas Hold Em Lobby",
-            command=lambda: self.send_join_lobby_request(main_pb2.TEXAS),
+            command=lambda: self.send_queue_request(main_pb2.TEXAS),
         )
         self.lobby1_button.pack(side=tk.BOTTOM)
         # add button for connecting to lobby 2
         self.lobby2_button = tk.Button(
             self.main_frame,
             text="Connect to 5 Card Draw Lobby",
-            command=lambda: self.send_join_lobby_request(main_pb2.FIVE_HAND),
+            command=lambda: self.send_queue_request(main_pb2.FIVE_HAND),
         )
         self.lobby2_button.pack(side=tk.BOTTOM)
 
@@ -913,7 +1039,7 @@ class ClientUI:
         self.join_lobby_button = tk.Button(
             self.lobby_found_frame,
             text="Join Lobby",
-            command=lambda: [self.connect_to_lobby(self.lobby_idx)],
+            command=lambda: [self.connect_to_lobby(self.lobby_address)],
         )
 
         self.join_lobby_button.pack()
@@ -1100,6 +1226,8 @@ class ClientUI:
 
         Has:
         - A label that says "History"
+        - A scrollable list of games, the next page is loaded when scrolled to the bottom
+        - A button that says "Load more" to load the next page
         - A button that says "Back" to go back to the main screen.
         """
         self.history_frame = tk.Frame(self.root)
@@ -1109,18 +1237,28 @@ class ClientUI:
         self.history_label.pack()
 
         # show history
+        list_frame = tk.Frame(self.history_frame)
+        list_frame.pack()
+        self.history_scrollbar = tk.Scrollbar(list_frame)
+        self.history_scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.history_list = tk.Listbox(
+            list_frame,
+            width=60,
+            height=15,
+            yscrollcommand=self.on_history_scroll,
+        )
+        self.history_list.pack(side=tk.LEFT)
+        self.history_scrollbar.config(command=self.history_list.yview)
+
+        self.load_more_button = tk.Button(
+            self.history_frame,
+            text="Load more",
+            command=lambda: self.load_more_history(),
+        )
+        self.load_more_button.pack()
+        self.add_history([])
         for game in self.history:
-            game_type = game.game_type
-            money_won = game.money_won
-            # setup label
-            game_label = tk.Label(
-                self.history_frame,
-                text=f"Game Type: {'TEXAS HOLD EM' if game_type == lobby_pb2.TEXAS else '5 CARD'}\nMoney Won: {money_won}",
-            )
-            game_label.pack()
-            # setup line
-            line = tk.Label(self.history_frame, text="---------------------")
-            line.pack()
+            self.show_game(game)
 
         self.back_button_history = tk.Button(
             self.history_frame,
@@ -1129,11 +1267,41 @@ class ClientUI:
         )
         self.back_button_history.pack()
 
+    def show_game(self, game):
+        """
+        Add a game to the end of the history list.
+        """
+        game_type = "TEXAS HOLD EM" if game.game_type == lobby_pb2.TEXAS else "5 CARD"
+        self.history_list.insert(
+            tk.END, f"{game.date}    Game Type: {game_type}    Money Won: {game.money_won}"
+        )
+
+    def add_history(self, games):
+        """
+        Add a page of games to the history screen.
+        """
+        if self.history_list is None:
+            # left the history screen before the page arrived
+            return
+        self.history.extend(games)
+        for game in games:
+            self.show_game(game)
+        self.load_more_button.config(state=tk.NORMAL if self.history_cursor else tk.DISABLED)
+
+    def on_history_scroll(self, first, last):
+        """
+        Move the scrollbar, and load the next page once the bottom of the list is visible.
+        """
+        self.history_scrollbar.set(first, last)
+        if float(last) >= 1.0:
+            self.load_more_history()
+
     def destroy_history(self):
         """
         Destroy the history screen.
         """
         self.history_frame.destroy()
+        self.history_list = None
 
     def rerender_main(self):
         """
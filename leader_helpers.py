@@ -0,0 +1,342 @@
+import logging
+import threading
+import time
+import uuid
+from concurrent import futures
+
+import grpc
+
+import main_pb2
+import main_pb2_grpc
+import raft_pb2
+import raft_pb2_grpc
+
+# writes, the only requests the leader appends to the Raft log
+MUTATING_ACTIONS = {
+    main_pb2.REGISTER,
+    main_pb2.DELETE_ACCOUNT,
+    main_pb2.LOAD_MONEY,
+    main_pb2.SAVE_GAME,
+    main_pb2.SAVE_GAME_BATCH,
+}
+
+# writes applied once per request_id, so a replayed log entry or a retry is
+# not applied twice
+IDEMPOTENT_ACTIONS = {
+    main_pb2.LOAD_MONEY,
+    main_pb2.SAVE_GAME,
+    main_pb2.SAVE_GAME_BATCH,
+}
+
+
+def assign_request_id(request):
+    """
+    Give an idempotent write a request_id before it is logged, if the
+    caller did not send one, so every replica applies it under the same id.
+    """
+    if request.action in IDEMPOTENT_ACTIONS and not request.request_id:
+        request.request_id = uuid.uuid4().hex
+    return request
+
+# reads followers may serve themselves
+# linearizable reads first learn the leader's log index (ReadIndex) and wait
+# until this replica has applied it, so they see every write acknowledged
+# before the read began
+LINEARIZABLE_READS = {
+    main_pb2.VIEW_HISTORY,
+    main_pb2.GET_USER_INFO,
+    main_pb2.GET_STATS,
+}
+# these may lag the leader by the time since its last heartbeat, at most
+# max_staleness, since REGISTER checks the username again on the leader
+STALE_READS = {
+    main_pb2.CHECK_USERNAME,
+    main_pb2.GET_LEADERBOARD,
+}
+
+READ_ACTIONS = LINEARIZABLE_READS | STALE_READS
+
+# status details and trailing metadata of a NOT_LEADER rejection
+NOT_LEADER = "NOT_LEADER"
+LEADER_ADDRESS_KEY = "leader-address"
+REJECTED_REQUEST_KEY = "rejected-request-bin"
+# never echoed back in a rejection, the caller restores them from its own copy
+CREDENTIAL_FIELDS = ("passhash", "session_token")
+
+
+def without_credentials(request):
+    """
+    Copy of a MainRequest without its password hash and session token.
+    """
+    stripped = main_pb2.MainRequest()
+    stripped.CopyFrom(request)
+    for field in CREDENTIAL_FIELDS:
+        stripped.ClearField(field)
+    return stripped
+
+
+def reject_not_leader(context, leader_address, request):
+    """
+    End a Main stream on a follower, telling the caller where the leader is.
+
+    Parameters:
+    - context:
+        the servicer context of the stream
+    - leader_address:
+        the leader this follower knows of, or None during an election
+    - request:
+        the rejected MainRequest, handed back without credentials so the
+        caller can find and resend it
+    """
+    context.set_trailing_metadata(
+        (
+            (LEADER_ADDRESS_KEY, leader_address or ""),
+            (REJECTED_REQUEST_KEY, without_credentials(request).SerializeToString()),
+        )
+    )
+    context.abort(grpc.StatusCode.FAILED_PRECONDITION, NOT_LEADER)
+
+
+def leader_hint(error):
+    """
+    Read a NOT_LEADER rejection from a failed Main stream.
+
+    Returns (leader address, rejected MainRequest without credentials), or
+    (None, None) if the stream failed for another reason. The address is None if the follower
+    did not know the leader either.
+    """
+    if error.code() != grpc.StatusCode.FAILED_PRECONDITION or error.details() != NOT_LEADER:
+        return None, None
+    metadata = dict(error.trailing_metadata() or ())
+    request = None
+    if metadata.get(REJECTED_REQUEST_KEY):
+        request = main_pb2.MainRequest.FromString(metadata[REJECTED_REQUEST_KEY])
+    return metadata.get(LEADER_ADDRESS_KEY) or None, request
+
+
+class LeaderDiscovery:
+    """
+    Finds the Raft leader for clients and lobbies.
+
+    All replicas are asked for the leader in parallel with a short deadline.
+    Only an answer from the leader itself counts, since followers keep
+    reporting a crashed leader until a new one is elected. The last known
+    leader is cached, and failed rounds are retried with exponential backoff
+    starting in milliseconds.
+    """
+
+    def __init__(self, servers, probe_timeout=0.5, initial_backoff=0.05, max_backoff=2):
+        """
+        Parameters:
+        - servers:
+            addresses ("host:port") of all replicas
+        - probe_timeout:
+            deadline in seconds for each GetLeader call
+        - initial_backoff:
+            seconds to wait after the first failed round
+        - max_backoff:
+            cap on the wait between rounds
+        """
+        self.servers = list(servers)
+        self.probe_timeout = probe_timeout
+        self.initial_backoff = initial_backoff
+        self.max_backoff = max_backoff
+        self.leader = None
+        self.channels = {server: grpc.insecure_channel(server) for server in self.servers}
+        self.executor = futures.ThreadPoolExecutor(max_workers=len(self.servers))
+
+    def probe(self, server):
+        """
+        Ask one replica for the leader. Returns "" if it does not answer.
+        """
+        try:
+            stub = raft_pb2_grpc.RaftServiceStub(self.channels[server])
+            response = stub.GetLeader(
+                raft_pb2.GetLeaderRequest(useless=True), timeout=self.probe_timeout
+            )
+            return response.leader_address
+        except grpc.RpcError as e:
+            logging.error(f"Error connecting to {server}: {e.code()}")
+            return ""
+
+    def find_leader(self):
+        """
+        Probe every replica in parallel once. Returns the leader or None.
+        """
+        # the cached leader is usually still in charge, so try it alone first
+        if self.leader is not None and self.probe(self.leader) == self.leader:
+            return self.leader
+        probes = {self.executor.submit(self.probe, server): server for server in self.servers}
+        for probe in futures.as_completed(probes):
+            server = probes[probe]
+            leader = probe.result()
+            # the leader confirms itself, followers may still point at a dead leader
+            if leader and leader == server:
+                logging.info(f"Leader found: {leader}")
+                self.leader = leader
+                return leader
+        return None
+
+    def discover(self, deadline=30, hint=None):
+        """
+        Find the leader, retrying with exponential backoff for up to deadline seconds.
+        A hint from a NOT_LEADER rejection is tried before any other replica,
+        unless it names an address that is not one of the replicas.
+        Returns the leader or None if none was found in time.
+        """
+        if hint in self.servers:
+            self.leader = hint
+        elif hint:
+            logging.error(f"Ignoring leader hint {hint}, not a known replica.")
+        give_up = time.monotonic() + deadline
+        backoff = self.initial_backoff
+        while True:
+            leader = self.find_leader()
+            if leader is not None:
+                return leader
+            if time.monotonic() + backoff > give_up:
+                return None
+            time.sleep(backoff)
+            backoff = min(backoff * 2, self.max_backoff)
+
+
+class LeaderLease:
+    """
+    Time during which the leader knows no other leader can have been elected.
+
+    Renewed when a majority acknowledges a heartbeat round, starting from
+    when the round began. It must be shorter than the followers' shortest
+    election timeout, so a new leader cannot be elected while it is valid.
+    """
+
+    def __init__(self, duration):
+        self.duration = duration
+        self.expires = 0
+
+    def renew(self, round_start):
+        self.expires = round_start + self.duration
+
+    def revoke(self):
+        self.expires = 0
+
+    def valid(self, now=None):
+        return (now if now is not None else time.monotonic()) < self.expires
+
+
+def missing_entries(log, entries):
+    """
+    Entries a follower has yet to append, given the leader's whole log.
+
+    A follower that missed heartbeats is behind by more than the last round,
+    so it appends everything past its own log rather than past the leader's
+    commit index. Its log must be a prefix of the leader's: entries at the
+    same index with the same term hold the same history before them, so only
+    its last entry is compared. Returns None if the logs diverged, since
+    entries already applied to the database cannot be taken back.
+    """
+    if len(log) > len(entries):
+        return None
+    if log and log[-1] != entries[len(log) - 1]:
+        return None
+    return entries[len(log) :]
+
+
+class FollowerReads:
+    """
+    Decides whether a follower can serve a read from its own database.
+
+    Stale reads are served while the last heartbeat from the leader is at
+    most max_staleness seconds old. Linearizable reads ask the leader for its
+    read index, answered from its lease, and wait for this replica to apply
+    the log up to it.
+    """
+
+    def __init__(self, max_staleness=1, read_timeout=0.5):
+        """
+        Parameters:
+        - max_staleness:
+            oldest heartbeat, in seconds, a stale read may be served after
+        - read_timeout:
+            seconds a linearizable read may wait for the read index and the log
+        """
+        self.max_staleness = max_staleness
+        self.read_timeout = read_timeout
+        self.applied_index = -1
+        self.last_heartbeat = None
+        self.applied = threading.Condition()
+
+    def heard_from_leader(self, applied_index, now=None):
+        """
+        Record a heartbeat, after its entries were applied to the database.
+        """
+        with self.applied:
+            self.applied_index = applied_index
+            self.last_heartbeat = now if now is not None else time.monotonic()
+            self.applied.notify_all()
+
+    def can_read(self, action, read_index, now=None):
+        """
+        Whether the read can be served here.
+
+        Parameters:
+        - action:
+            action of the read, see LINEARIZABLE_READS and STALE_READS
+        - read_index:
+            function asking the leader for its read index, returning None if
+            it cannot give one (no leader, lease expired, timeout)
+        """
+        now = now if now is not None else time.monotonic()
+        if action in STALE_READS:
+            with self.applied:
+                return (
+                    self.last_heartbeat is not None
+                    and now - self.last_heartbeat <= self.max_staleness
+                )
+        if action in LINEARIZABLE_READS:
+            index = read_index()
+            if index is None:
+                return False
+            with self.applied:
+                return self.applied.wait_for(
+                    lambda: self.applied_index >= index, timeout=self.read_timeout
+                )
+        return False
+
+
+class ReplicaReads:
+    """
+    Sends reads to all replicas in turn, so followers share the read load
+    with the leader.
+
+    A replica that cannot serve the read consistently rejects it, and the
+    caller falls back to the leader's Main stream.
+    """
+
+    def __init__(self, servers, timeout=2):
+        """
+        Parameters:
+        - servers:
+            addresses ("host:port") of all replicas
+        - timeout:
+            deadline in seconds for each Read call
+        """
+        self.servers = list(servers)
+        self.timeout = timeout
+        self.channels = {server: grpc.insecure_channel(server) for server in self.servers}
+        self.next = 0
+        self.lock = threading.Lock()
+
+    def read(self, request):
+        """
+        Send a read to the next replica. Returns its MainResponse, or None if
+        it rejected the read or did not answer.
+        """
+        with self.lock:
+            server = self.servers[self.next % len(self.servers)]
+            self.next += 1
+        try:
+            stub = main_pb2_grpc.MainServiceStub(self.channels[server])
+            return stub.Read(request, timeout=self.timeout)
+        except grpc.RpcError as e:
+            logging.info(f"Read {request.action} on {server} failed: {e.code()}")
+            return None
@@ -0,0 +1,150 @@
+import bisect
+import threading
+
+import main_pb2
+
+# players shown when the client does not ask for a number, and the most allowed
+DEFAULT_TOP_K = 10
+MAX_TOP_K = 100
+
+
+class Ranking:
+    """
+    Players sorted by one score, highest first, ties by username.
+
+    A sorted list of (-score, username) kept in order with bisect, plus each
+    player's current score to find their entry. Reading the top K is a slice,
+    O(K); moving a player is a binary search and a list insert.
+    """
+
+    def __init__(self, scores=()):
+        """
+        Parameters:
+        - scores:
+            initial (username, score) pairs, sorted once instead of inserted one by one
+        """
+        self.scores = dict(scores)
+        self.order = sorted((-score, username) for username, score in self.scores.items())
+
+    def set(self, username, score):
+        """
+        Set a player's score, adding them if they are not ranked yet.
+        """
+        self.remove(username)
+        self.scores[username] = score
+        bisect.insort(self.order, (-score, username))
+
+    def remove(self, username):
+        score = self.scores.pop(username, None)
+        if score is None:
+            return
+        i = bisect.bisect_left(self.order, (-score, username))
+        del self.order[i]
+
+    def top(self, k):
+        """
+        The k best players as (username, score).
+        """
+        return [(username, -score) for score, username in self.order[:k]]
+
+    def __len__(self):
+        return len(self.order)
+
+
+class Leaderboard:
+    """
+    Rankings by moolah, and by net winnings overall and per game type.
+
+    Storage keeps it up to date with every committed balance change, and it
+    is rebuilt from the database when a replica starts, so top-K queries
+    never touch SQLite.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.moolah = Ranking()
+        # game type NONE ranks net winnings over all game types
+        self.net_winnings = {
+            game_type: Ranking() for game_type in (main_pb2.NONE, main_pb2.TEXAS, main_pb2.FIVE_HAND)
+        }
+
+    def load(self, moolah, net_winnings):
+        """
+        Replace every ranking.
+
+        Parameters:
+        - moolah:
+            (username, moolah) of every player
+        - net_winnings:
+            (username, game_type, net_winnings) of every player per game type played
+        """
+        by_game_type = {game_type: {} for game_type in self.net_winnings}
+        for username, game_type, won in net_winnings:
+            by_game_type[game_type][username] = won
+            total = by_game_type[main_pb2.NONE]
+            total[username] = total.get(username, 0) + won
+
+        with self.lock:
+            self.moolah = Ranking(moolah)
+            self.net_winnings = {
+                game_type: Ranking(scores.items()) for game_type, scores in by_game_type.items()
+            }
+
+    def apply(self, changes):
+        """
+        Apply changes recorded by a committed write, in commit order.
+
+        Parameters:
+        - changes:
+            ("moolah", username, moolah), ("net_winnings", username, game_type, net_winnings)
+            or ("remove", username)
+        """
+        with self.lock:
+            for change in changes:
+                if change[0] == "moolah":
+                    self.moolah.set(change[1], change[2])
+                elif change[0] == "net_winnings":
+                    self.net_winnings[change[2]].set(change[1], change[3])
+                elif change[0] == "remove":
+                    self.moolah.remove(change[1])
+                    for ranking in self.net_winnings.values():
+                        ranking.remove(change[1])
+
+    def top(self, board, game_type=main_pb2.NONE, k=0):
+        """
+        The k best players as (username, score), or None if there is no such ranking.
+
+        Parameters:
+        - board:
+            main_pb2.MOOLAH or main_pb2.NET_WINNINGS
+        - game_type:
+            NONE for all game types, moolah is only ranked overall
+        - k:
+            players to return, DEFAULT_TOP_K if not positive, at most MAX_TOP_K
+        """
+        if k <= 0:
+            k = DEFAULT_TOP_K
+        k = min(k, MAX_TOP_K)
+        with self.lock:
+            if board == main_pb2.MOOLAH and game_type == main_pb2.NONE:
+                return self.moolah.top(k)
+            if board == main_pb2.NET_WINNINGS and game_type in self.net_winnings:
+                return self.net_winnings[game_type].top(k)
+        return None
+
+
+def leaderboard_response(leaderboard, board, game_type=main_pb2.NONE, k=0):
+    """
+    GET_LEADERBOARD response with the top k players of a ranking.
+    """
+    top = leaderboard.top(board, game_type, k)
+    if top is None:
+        return main_pb2.MainResponse(action=main_pb2.GET_LEADERBOARD, result=False)
+    return main_pb2.MainResponse(
+        action=main_pb2.GET_LEADERBOARD,
+        result=True,
+        leaderboard=[
+            main_pb2.LeaderboardEntry(rank=rank, username=username, score=score)
+            for rank, (username, score) in enumerate(top, start=1)
+        ],
+    )
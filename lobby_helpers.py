@@ -0,0 +1,731 @@
+import collections
+import heapq
+import itertools
+import logging
+import math
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+import lobby_pb2
+import main_pb2
+from stream_helpers import LatestMailbox, broadcast
+
+
+class RosterService:
+    """
+    Keeps a versioned roster of the players in a lobby.
+
+    Joins, votes and disconnects mark the roster dirty. Bursts of changes are
+    coalesced into a single SHOW_LOBBY update per window, and that update is
+    serialized once and shared by every player (clients filter out themselves).
+    """
+
+    def __init__(self, get_players, window=0.05):
+        """
+        Parameters:
+        - get_players:
+            callable returning the players that should receive the roster
+        - window:
+            seconds to wait for more changes before sending an update
+        """
+        self.get_players = get_players
+        self.window = window
+        self.version = 0
+        self.sent_version = 0
+        self.lock = threading.Lock()
+        self.timer = None
+
+    def mark_dirty(self):
+        """
+        Record a change to the roster, scheduling an update if none is pending.
+        """
+        with self.lock:
+            self.version += 1
+            if self.timer is None:
+                self.timer = threading.Timer(self.window, self.flush)
+                self.timer.daemon = True
+                self.timer.start()
+
+    def flush(self):
+        """
+        Send any pending roster update immediately.
+
+        Returns the version that was sent, or None if nothing was pending.
+        """
+        with self.lock:
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+            if self.version == self.sent_version:
+                return None
+            version = self.version
+            self.sent_version = version
+
+        players = list(self.get_players())
+        broadcast(
+            lobby_pb2.LobbyResponse(
+                action=lobby_pb2.SHOW_LOBBY,
+                result=True,
+                user_info=[player.get_user_information() for player in players],
+                roster_version=version,
+            ),
+            players,
+            key=lobby_pb2.SHOW_LOBBY,
+        )
+        return version
+
+
+class SpectatorFeed:
+    """
+    Fans public table state out to any number of spectators.
+
+    Each spectator reads from a LatestMailbox, so slow watchers skip stale
+    states instead of queueing them, and the players at the table never wait.
+    """
+
+    def __init__(self):
+        self.subscribers = set()
+        self.lock = threading.Lock()
+        # most recent public state, sent to new spectators on subscribe
+        self.latest = None
+
+    def subscribe(self):
+        """
+        Add a spectator, returning the mailbox it should read updates from.
+        """
+        mailbox = LatestMailbox()
+        with self.lock:
+            if self.latest is not None:
+                mailbox.send_message(self.latest.SerializeToString())
+            self.subscribers.add(mailbox)
+        return mailbox
+
+    def unsubscribe(self, mailbox):
+        with self.lock:
+            self.subscribers.discard(mailbox)
+        mailbox.close()
+
+    def publish(self, message):
+        """
+        Record the latest public state and send it to every spectator.
+        """
+        with self.lock:
+            self.latest = message
+            subscribers = list(self.subscribers)
+        # only pay for serialization when someone is watching
+        if subscribers:
+            broadcast(message, subscribers)
+
+    def end(self, message):
+        """
+        Send a last message to every spectator when the game ends, and forget
+        its state so new spectators wait for the next game.
+        Spectators stay subscribed for the next game.
+        """
+        with self.lock:
+            self.latest = None
+            subscribers = list(self.subscribers)
+        if subscribers:
+            broadcast(message, subscribers)
+
+    def __len__(self):
+        return len(self.subscribers)
+
+
+class TimerWheel:
+    """
+    Hashed timer wheel shared by every table in the lobby process.
+
+    Timers are hashed into one of a fixed number of slots by their expiry tick.
+    Scheduling and cancelling are O(1), and each tick only visits one slot, so
+    thousands of turn clocks cost the same as one background thread.
+    """
+
+    def __init__(self, tick=0.1, num_slots=512):
+        """
+        Parameters:
+        - tick:
+            seconds per tick (timer resolution)
+        - num_slots:
+            number of slots in the wheel
+        """
+        self.tick = tick
+        self.slots = [{} for _ in range(num_slots)]
+        self.current = 0
+        self.ids = itertools.count()
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def schedule(self, delay, callback):
+        """
+        Run callback after delay seconds. Returns a handle for cancel.
+        """
+        ticks = max(1, math.ceil(delay / self.tick))
+        with self.lock:
+            slot = (self.current + ticks) % len(self.slots)
+            # number of full turns of the wheel before the timer is due
+            rounds = (ticks - 1) // len(self.slots)
+            timer_id = next(self.ids)
+            self.slots[slot][timer_id] = [rounds, callback]
+        return (slot, timer_id)
+
+    def cancel(self, handle):
+        """
+        Cancel a scheduled timer. Cancelling a fired or missing timer is a no-op.
+        """
+        if handle is None:
+            return
+        slot, timer_id = handle
+        with self.lock:
+            self.slots[slot].pop(timer_id, None)
+
+    def advance(self):
+        """
+        Move the wheel forward one tick and run every timer that is due.
+        """
+        expired = []
+        with self.lock:
+            self.current = (self.current + 1) % len(self.slots)
+            bucket = self.slots[self.current]
+            for timer_id, entry in list(bucket.items()):
+                if entry[0] == 0:
+                    expired.append(entry[1])
+                    del bucket[timer_id]
+                else:
+                    entry[0] -= 1
+
+        # callbacks may schedule new timers, so run them outside the lock
+        for callback in expired:
+            try:
+                callback()
+            except Exception as e:
+                logging.error(f"[TIMER] Error running timer: {e}")
+
+    def run(self):
+        next_tick = time.monotonic()
+        while True:
+            next_tick += self.tick
+            time.sleep(max(0, next_tick - time.monotonic()))
+            self.advance()
+
+    def start(self):
+        """
+        Start ticking on a background thread.
+        """
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.run, daemon=True)
+            self.thread.start()
+
+
+class GameOutbox:
+    """
+    Durable outbox for finished game results, stored in the lobby's database.
+
+    Results are written locally first, so finishing a game never waits on main.
+    A background thread drains pending batches to the main leader, resending
+    with exponential backoff until main acknowledges the batch's request id.
+    Main skips request ids it already saved, so resending is safe.
+    """
+
+    def __init__(self, db_path, send, retry_after=2, max_retry_after=60, batch_size=32):
+        """
+        Parameters:
+        - db_path:
+            path to the lobby's SQLite database
+        - send:
+            callable that sends a MainRequest to the main leader
+        - retry_after:
+            seconds to wait for an acknowledgement before the first resend
+        - max_retry_after:
+            cap on the backoff between resends
+        - batch_size:
+            most batches sent per drain
+        """
+        if os.path.dirname(db_path):
+            os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self.sqlcon = sqlite3.connect(db_path, check_same_thread=False)
+        self.sqlcon.execute("PRAGMA journal_mode=WAL")
+        self.sqlcon.execute(
+            """
+            CREATE TABLE IF NOT EXISTS outbox (
+                request_id TEXT PRIMARY KEY,
+                payload BLOB NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                next_attempt REAL NOT NULL DEFAULT 0
+            );
+            """
+        )
+        self.sqlcon.commit()
+        self.send = send
+        self.retry_after = retry_after
+        self.max_retry_after = max_retry_after
+        self.batch_size = batch_size
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.thread = None
+
+    def add(self, request):
+        """
+        Store a SAVE_GAME_BATCH request, giving it an idempotency key.
+        Returns the request id.
+        """
+        if not request.request_id:
+            request.request_id = uuid.uuid4().hex
+        with self.lock, self.sqlcon:
+            self.sqlcon.execute(
+                "INSERT OR IGNORE INTO outbox (request_id, payload) VALUES (?, ?)",
+                (request.request_id, request.SerializeToString()),
+            )
+        self.wakeup.set()
+        return request.request_id
+
+    def ack(self, request_id):
+        """
+        Main saved the batch, remove it from the outbox.
+        """
+        with self.lock, self.sqlcon:
+            self.sqlcon.execute("DELETE FROM outbox WHERE request_id=?", (request_id,))
+
+    def retry_all(self):
+        """
+        Resend everything on the next drain, e.g. after connecting to a new leader.
+        """
+        with self.lock, self.sqlcon:
+            self.sqlcon.execute("UPDATE outbox SET next_attempt=0")
+        self.wakeup.set()
+
+    def pending(self):
+        with self.lock:
+            return self.sqlcon.execute("SELECT COUNT(*) FROM outbox").fetchone()[0]
+
+    def drain(self):
+        """
+        Send batches that are due. Returns how many were sent.
+        """
+        now = time.time()
+        with self.lock, self.sqlcon:
+            rows = self.sqlcon.execute(
+                "SELECT request_id, payload, attempts FROM outbox "
+                "WHERE next_attempt <= ? ORDER BY rowid LIMIT ?",
+                (now, self.batch_size),
+            ).fetchall()
+            for request_id, _, attempts in rows:
+                backoff = min(self.max_retry_after, self.retry_after * 2 ** attempts)
+                self.sqlcon.execute(
+                    "UPDATE outbox SET attempts=?, next_attempt=? WHERE request_id=?",
+                    (attempts + 1, now + backoff, request_id),
+                )
+
+        for _, payload, _ in rows:
+            self.send(main_pb2.MainRequest.FromString(payload))
+        return len(rows)
+
+    def run(self, interval):
+        while True:
+            self.wakeup.clear()
+            try:
+                self.drain()
+            except Exception as e:
+                logging.error(f"[OUTBOX] Error draining outbox: {e}")
+            self.wakeup.wait(interval)
+
+    def start(self, interval=1):
+        """
+        Drain the outbox on a background thread.
+        """
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.run, args=(interval,), daemon=True)
+            self.thread.start()
+
+
+class Heartbeat:
+    """
+    Pushes this lobby's status to main.
+
+    The status is sent every interval seconds, so main can evict lobbies that
+    died, and right after every change (players joining or leaving, a game
+    starting or ending), so main can answer JOIN_LOBBY from its own registry.
+    """
+
+    def __init__(self, get_status, send, interval=2):
+        """
+        Parameters:
+        - get_status:
+            callable returning the lobby's current LobbyStatus
+        - send:
+            callable that sends a LobbyStatus to the main leader
+        - interval:
+            seconds between heartbeats when nothing changes
+        """
+        self.get_status = get_status
+        self.send = send
+        self.interval = interval
+        self.wakeup = threading.Event()
+        self.thread = None
+
+    def changed(self):
+        """
+        Send the status now instead of waiting for the next heartbeat.
+        """
+        self.wakeup.set()
+
+    def beat(self):
+        """
+        Send the current status once. Returns False if main could not be reached.
+        """
+        try:
+            self.send(self.get_status())
+            return True
+        except Exception as e:
+            logging.error(f"[HEARTBEAT] Error sending heartbeat: {e}")
+            return False
+
+    def run(self):
+        while True:
+            self.wakeup.clear()
+            self.beat()
+            self.wakeup.wait(self.interval)
+
+    def start(self):
+        """
+        Send heartbeats on a background thread.
+        """
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.run, daemon=True)
+            self.thread.start()
+
+
+class LobbyRegistry:
+    """
+    Main's view of the running lobbies, kept up to date by their heartbeats.
+
+    Lobbies with a free seat and no game in progress are kept per game type,
+    ordered by their last heartbeat. Finding a lobby to join looks at the
+    front of that order only, and lobbies that stopped sending heartbeats
+    collect at the front, where they are evicted as they are found.
+
+    Seats handed out by main are reserved until the player shows up in the
+    lobby's heartbeat or the reservation expires, so heartbeats sent before
+    the player connects do not free the seat again.
+    """
+
+    def __init__(self, ttl=10):
+        """
+        Parameters:
+        - ttl:
+            seconds without a heartbeat before a lobby is considered gone
+        """
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        # lobby_id -> [status, time of last heartbeat]
+        self.lobbies = {}
+        # game type -> lobby ids of joinable lobbies, oldest heartbeat first
+        self.joinable = collections.defaultdict(collections.OrderedDict)
+        # lobby_id -> {username: expiry} for seats handed out but not yet taken
+        self.reservations = collections.defaultdict(dict)
+        self.thread = None
+
+    def heartbeat(self, status, now=None):
+        """
+        Record the status a lobby sent.
+        """
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            self.unlink(status.lobby_id)
+            # players who took their seat are counted by the lobby now
+            reservations = self.reservations[status.lobby_id]
+            for username in status.players:
+                reservations.pop(username, None)
+            self.lobbies[status.lobby_id] = [status, now]
+            if self.seats_free(status.lobby_id, now) > 0 and not status.active:
+                self.joinable[status.game_type][status.lobby_id] = now
+
+    def unlink(self, lobby_id):
+        # caller holds the lock
+        entry = self.lobbies.get(lobby_id)
+        if entry is not None:
+            self.joinable[entry[0].game_type].pop(lobby_id, None)
+
+    def remove(self, lobby_id):
+        # caller holds the lock
+        self.unlink(lobby_id)
+        self.lobbies.pop(lobby_id, None)
+        self.reservations.pop(lobby_id, None)
+
+    def seats_free(self, lobby_id, now):
+        """
+        Seats the lobby reported free, less the ones reserved since. Caller holds the lock.
+        """
+        reservations = self.reservations[lobby_id]
+        for username, expiry in list(reservations.items()):
+            if now > expiry:
+                del reservations[username]
+        return self.lobbies[lobby_id][0].seats_free - len(reservations)
+
+    def reserve(self, lobby_id, username, ttl, now=None):
+        """
+        Hold a seat in a lobby for username for ttl seconds.
+        Returns False if the lobby is gone or has no free seat.
+        """
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            if lobby_id not in self.lobbies or self.seats_free(lobby_id, now) <= 0:
+                return False
+            self.reservations[lobby_id][username] = now + ttl
+            if self.seats_free(lobby_id, now) <= 0:
+                self.unlink(lobby_id)
+            return True
+
+    def find(self, game_type, now=None):
+        """
+        Return the status of a joinable lobby for game_type, or None.
+        Its seats_free already excludes reserved seats.
+        """
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            joinable = self.joinable[game_type]
+            while joinable:
+                lobby_id, last_seen = next(iter(joinable.items()))
+                if now - last_seen > self.ttl:
+                    logging.info(f"[REGISTRY] Lobby {lobby_id} stopped sending heartbeats.")
+                    self.remove(lobby_id)
+                    continue
+                seats_free = self.seats_free(lobby_id, now)
+                if seats_free <= 0:
+                    self.unlink(lobby_id)
+                    continue
+                # statuses are shared, so hand out a copy
+                status = main_pb2.LobbyStatus()
+                status.CopyFrom(self.lobbies[lobby_id][0])
+                status.seats_free = seats_free
+                return status
+            return None
+
+    def sweep(self, now=None):
+        """
+        Evict every lobby that stopped sending heartbeats. Returns how many were evicted.
+        """
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            stale = [
+                lobby_id
+                for lobby_id, (_, last_seen) in self.lobbies.items()
+                if now - last_seen > self.ttl
+            ]
+            for lobby_id in stale:
+                self.remove(lobby_id)
+        return len(stale)
+
+    def __len__(self):
+        return len(self.lobbies)
+
+    def run(self):
+        while True:
+            time.sleep(self.ttl)
+            self.sweep()
+
+    def start(self):
+        """
+        Sweep stale lobbies on a background thread.
+        """
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.run, daemon=True)
+            self.thread.start()
+
+
+def timeout_move(player, min_bet, exchanging=False):
+    """
+    The move made for a player who ran out of time: in an exchange they keep
+    every card, otherwise they check if it is free and fold if it is not.
+
+    Parameters:
+    - player:
+        the player whose turn expired
+    - min_bet:
+        the bet to call
+    - exchanging:
+        whether it is the player's exchange turn (five card draw)
+    """
+    if exchanging:
+        # no card_exchange_idx set, so no card is replaced
+        return lobby_pb2.LobbyRequest(action=lobby_pb2.PLAY_MOVE, player_action=lobby_pb2.EXCHANGE)
+    if player.current_bet >= min_bet:
+        action = lobby_pb2.CHECK_CALL
+    else:
+        action = lobby_pb2.FOLD
+    return lobby_pb2.LobbyRequest(action=lobby_pb2.PLAY_MOVE, player_action=action)
+
+
+def percentile(values, p):
+    """
+    Nearest-rank percentile of values, or 0 if there are none.
+    """
+    if not values:
+        return 0
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+
+class Matchmaker:
+    """
+    Matchmaking queue for players waiting for a table.
+
+    Waiting players are kept in a priority queue per game type and stake,
+    longest waiting first. Every tick, tables are formed in batches: each
+    queue fills the joinable lobbies of its game type, and every player who
+    got a seat is told which lobby to connect to. Seats handed out are
+    reserved in the registry, so a burst of players is spread over the
+    lobbies instead of all being sent to the same one.
+    """
+
+    def __init__(
+        self, registry, notify, tick=0.2, seat_ttl=10, max_players=4, min_players=2, window=1000
+    ):
+        """
+        Parameters:
+        - registry:
+            LobbyRegistry to find lobbies in
+        - notify:
+            callable(username, LobbyStatus) telling a player where they are seated
+        - tick:
+            seconds between batches
+        - seat_ttl:
+            seconds a seated player has to connect to the lobby
+        - max_players:
+            seats at a table
+        - min_players:
+            players needed to start a game, a table is only formed with that many
+        - window:
+            number of recent seatings the time-to-seat percentiles are taken over
+        """
+        self.registry = registry
+        self.notify = notify
+        self.tick = tick
+        self.seat_ttl = seat_ttl
+        self.max_players = max_players
+        self.min_players = min_players
+        self.lock = threading.Lock()
+        # (game type, stake) -> heap of (time queued, sequence number, username)
+        self.queues = collections.defaultdict(list)
+        # (game type, stake) -> players still waiting in that queue
+        self.sizes = collections.Counter()
+        # username -> (queue key, sequence number, time queued)
+        self.waiting = {}
+        self.ids = itertools.count()
+        self.wait_times = collections.deque(maxlen=window)
+        self.seated = 0
+        self.thread = None
+
+    def add(self, username, game_type, stake=0, now=None):
+        """
+        Queue a player. Returns False if they are already waiting.
+        """
+        now = time.monotonic() if now is None else now
+        key = (game_type, stake)
+        with self.lock:
+            if username in self.waiting:
+                return False
+            seq = next(self.ids)
+            self.waiting[username] = (key, seq, now)
+            heapq.heappush(self.queues[key], (now, seq, username))
+            self.sizes[key] += 1
+            return True
+
+    def remove(self, username):
+        """
+        Take a player out of the queue, e.g. when they disconnect.
+        Returns False if they were not waiting.
+        """
+        with self.lock:
+            entry = self.waiting.pop(username, None)
+            if entry is None:
+                return False
+            # the heap entry is skipped when it reaches the front
+            self.sizes[entry[0]] -= 1
+            return True
+
+    def pop(self, key, count):
+        # caller holds the lock
+        heap = self.queues[key]
+        batch = []
+        while heap and len(batch) < count:
+            queued, seq, username = heapq.heappop(heap)
+            entry = self.waiting.get(username)
+            if entry is None or entry[1] != seq:
+                # removed from the queue
+                continue
+            del self.waiting[username]
+            self.sizes[key] -= 1
+            batch.append((username, queued))
+        return batch
+
+    def form_tables(self, now=None):
+        """
+        Seat as many waiting players as the joinable lobbies allow.
+        Returns the list of (username, LobbyStatus) seat assignments.
+        """
+        now = time.monotonic() if now is None else now
+        assignments = []
+        with self.lock:
+            for key in list(self.queues):
+                game_type, _ = key
+                while self.sizes[key]:
+                    lobby = self.registry.find(game_type, now)
+                    if lobby is None:
+                        break
+                    # players already at the table count towards starting a game
+                    needed = self.min_players - (self.max_players - lobby.seats_free)
+                    if self.sizes[key] < needed:
+                        break
+                    batch = self.pop(key, lobby.seats_free)
+                    for username, queued in batch:
+                        self.registry.reserve(lobby.lobby_id, username, self.seat_ttl, now)
+                        self.wait_times.append(now - queued)
+                        assignments.append((username, lobby))
+            self.seated += len(assignments)
+
+        # tell players outside the lock, sending may block
+        for username, lobby in assignments:
+            try:
+                self.notify(username, lobby)
+            except Exception as e:
+                logging.error(f"[MATCH] Error seating {username}: {e}")
+        return assignments
+
+    def stats(self):
+        """
+        Queue length and time-to-seat metrics, in seconds.
+        """
+        with self.lock:
+            wait_times = list(self.wait_times)
+            return {
+                "waiting": len(self.waiting),
+                "seated": self.seated,
+                "p50_time_to_seat": percentile(wait_times, 50),
+                "p99_time_to_seat": percentile(wait_times, 99),
+            }
+
+    def run(self):
+        while True:
+            time.sleep(self.tick)
+            try:
+                if self.form_tables():
+                    stats = self.stats()
+                    logging.info(
+                        f"[MATCH] waiting={stats['waiting']}, seated={stats['seated']}, "
+                        f"p50={stats['p50_time_to_seat']:.2f}s, "
+                        f"p99={stats['p99_time_to_seat']:.2f}s"
+                    )
+            except Exception as e:
+                logging.error(f"[MATCH] Error forming tables: {e}")
+
+    def start(self):
+        """
+        Form tables every tick on a background thread.
+        """
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.run, daemon=True)
+            self.thread.start()
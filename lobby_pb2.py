@@ -24,35 +24,39 @@ _sym_db = _symbol_database.Default()
 
 
 
-DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\x0blobby.proto\x12\x05lobby\"g\n\x10GameHistoryEntry\x12\"\n\tgame_type\x18\x01 \x01(\x0e\x32\x0f.lobby.GameType\x12\x0c\n\x04\x64\x61te\x18\x02 \x01(\t\x12\x0e\n\x06player\x18\x03 \x01(\t\x12\x11\n\tmoney_won\x18\x04 \x01(\x05\"F\n\x0fUserInformation\x12\x10\n\x08username\x18\x01 \x01(\t\x12\x11\n\tvoted_yes\x18\x02 \x01(\x08\x12\x0e\n\x06moolah\x18\x03 \x01(\x05\"\xe4\x01\n\x0cLobbyRequest\x12\"\n\x06\x61\x63tion\x18\x01 \x01(\x0e\x32\x12.lobby.LobbyAction\x12\x10\n\x08username\x18\x02 \x01(\t\x12\x10\n\x08passhash\x18\x03 \x01(\t\x12\x14\n\x0cmoney_to_add\x18\x04 \x01(\x05\x12\x11\n\tgame_type\x18\x05 \x01(\x05\x12\x0c\n\x04vote\x18\x06 \x01(\x08\x12*\n\rplayer_action\x18\x07 \x01(\x0e\x32\x13.lobby.PlayerAction\x12\x0e\n\x06\x61mount\x18\x08 \x01(\x05\x12\x19\n\x11\x63\x61rd_exchange_idx\x18\t \x03(\x05\"V\n\tHandCards\x12\r\n\x05\x63\x61rd1\x18\x01 \x01(\t\x12\r\n\x05\x63\x61rd2\x18\x02 \x01(\t\x12\r\n\x05\x63\x61rd3\x18\x03 \x01(\t\x12\r\n\x05\x63\x61rd4\x18\x04 \x01(\t\x12\r\n\x05\x63\x61rd5\x18\x05 \x01(\t\"\xc3\x02\n\tGameState\x12\x0f\n\x07players\x18\x01 \x03(\t\x12\r\n\x05money\x18\x02 \x03(\x05\x12\x0c\n\x04\x62\x65ts\x18\x03 \x03(\x05\x12\x13\n\x0briver_cards\x18\x04 \x03(\t\x12\x16\n\x0e\x63urrent_player\x18\x05 \x01(\t\x12$\n\nhand_cards\x18\x06 \x03(\x0b\x32\x10.lobby.HandCards\x12\x0b\n\x03pot\x18\x07 \x01(\x05\x12\x11\n\tbig_blind\x18\x08 \x01(\x05\x12\x13\n\x0bsmall_blind\x18\t \x01(\x05\x12\x12\n\ngame_round\x18\n \x01(\x05\x12\"\n\tgame_type\x18\x0b \x01(\x0e\x32\x0f.lobby.GameType\x12\x11\n\tdelta_bet\x18\x0c \x01(\x05\x12\x0e\n\x06\x66olded\x18\r \x03(\x08\x12\x0f\n\x07min_bet\x18\x0e \x01(\x05\x12\x14\n\x0c\x63\x61n_exchange\x18\x0f \x03(\x08\"\xe7\x01\n\rLobbyResponse\x12\"\n\x06\x61\x63tion\x18\x01 \x01(\x0e\x32\x12.lobby.LobbyAction\x12\x0e\n\x06result\x18\x02 \x01(\x08\x12\x12\n\ngame_lobby\x18\x03 \x01(\t\x12-\n\x0cgame_history\x18\x04 \x03(\x0b\x32\x17.lobby.GameHistoryEntry\x12\x0e\n\x06moolah\x18\x05 \x01(\x05\x12)\n\tuser_info\x18\x06 \x03(\x0b\x32\x16.lobby.UserInformation\x12$\n\ngame_state\x18\x07 \x01(\x0b\x32\x10.lobby.GameState\" \n\rServerRequest\x12\x0f\n\x07useless\x18\x01 \x01(\t\"Y\n\x0eServerResponse\x12\x0e\n\x06\x61\x63tive\x18\x01 \x01(\x08\x12\x13\n\x0bnum_players\x18\x02 \x01(\x05\x12\"\n\tgame_type\x18\x03 \x01(\x0e\x32\x0f.lobby.GameType*x\n\x0bLobbyAction\x12\x0b\n\x07UNKNOWN\x10\x00\x12\x0e\n\nJOIN_LOBBY\x10\x01\x12\x0e\n\nSHOW_LOBBY\x10\x02\x12\r\n\tSEND_VOTE\x10\x03\x12\r\n\tSHOW_GAME\x10\x04\x12\r\n\tPLAY_MOVE\x10\x05\x12\x0f\n\x0bKICK_PLAYER\x10\x06*.\n\x08GameType\x12\x08\n\x04NONE\x10\x00\x12\t\n\x05TEXAS\x10\x01\x12\r\n\tFIVE_HAND\x10\x02*A\n\x0cPlayerAction\x12\x0e\n\nCHECK_CALL\x10\x00\x12\t\n\x05RAISE\x10\x01\x12\x08\n\x04\x46OLD\x10\x02\x12\x0c\n\x08\x45XCHANGE\x10\x03\x32\x83\x01\n\x0cLobbyService\x12\x36\n\x05Lobby\x12\x13.lobby.LobbyRequest\x1a\x14.lobby.LobbyResponse(\x01\x30\x01\x12;\n\x0cGetLobbyInfo\x12\x14.lobby.ServerRequest\x1a\x15.lobby.ServerResponseb\x06proto3')
+DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\x0blobby.proto\x12\x05lobby\"g\n\x10GameHistoryEntry\x12\"\n\tgame_type\x18\x01 \x01(\x0e\x32\x0f.lobby.GameType\x12\x0c\n\x04\x64\x61te\x18\x02 \x01(\t\x12\x0e\n\x06player\x18\x03 \x01(\t\x12\x11\n\tmoney_won\x18\x04 \x01(\x05\"F\n\x0fUserInformation\x12\x10\n\x08username\x18\x01 \x01(\t\x12\x11\n\tvoted_yes\x18\x02 \x01(\x08\x12\x0e\n\x06moolah\x18\x03 \x01(\x05\"V\n\tHandCards\x12\r\n\x05\x63\x61rd1\x18\x01 \x01(\t\x12\r\n\x05\x63\x61rd2\x18\x02 \x01(\t\x12\r\n\x05\x63\x61rd3\x18\x03 \x01(\t\x12\r\n\x05\x63\x61rd4\x18\x04 \x01(\t\x12\r\n\x05\x63\x61rd5\x18\x05 \x01(\t\"\xc3\x02\n\tGameState\x12\x0f\n\x07players\x18\x01 \x03(\t\x12\r\n\x05money\x18\x02 \x03(\x05\x12\x0c\n\x04\x62\x65ts\x18\x03 \x03(\x05\x12\x13\n\x0briver_cards\x18\x04 \x03(\t\x12\x16\n\x0e\x63urrent_player\x18\x05 \x01(\t\x12$\n\nhand_cards\x18\x06 \x03(\x0b\x32\x10.lobby.HandCards\x12\x0b\n\x03pot\x18\x07 \x01(\x05\x12\x11\n\tbig_blind\x18\x08 \x01(\x05\x12\x13\n\x0bsmall_blind\x18\t \x01(\x05\x12\x12\n\ngame_round\x18\n \x01(\x05\x12\"\n\tgame_type\x18\x0b \x01(\x0e\x32\x0f.lobby.GameType\x12\x11\n\tdelta_bet\x18\x0c \x01(\x05\x12\x0e\n\x06\x66olded\x18\r \x03(\x08\x12\x0f\n\x07min_bet\x18\x0e \x01(\x05\x12\x14\n\x0c\x63\x61n_exchange\x18\x0f \x03(\x08\"\x8f\x02\n\x0cLobbyRequest\x12\"\n\x06\x61\x63tion\x18\x01 \x01(\x0e\x32\x12.lobby.LobbyAction\x12\x10\n\x08username\x18\x02 \x01(\t\x12\x10\n\x08passhash\x18\x03 \x01(\t\x12\x14\n\x0cmoney_to_add\x18\x04 \x01(\x05\x12\x11\n\tgame_type\x18\x05 \x01(\x05\x12\x0c\n\x04vote\x18\x06 \x01(\x08\x12*\n\rplayer_action\x18\x07 \x01(\x0e\x32\x13.lobby.PlayerAction\x12\x0e\n\x06\x61mount\x18\x08 \x01(\x05\x12\x19\n\x11\x63\x61rd_exchange_idx\x18\t \x03(\x05\x12\x12\n\nseat_token\x18\n \x01(\t\x12\x15\n\rsession_token\x18\x0b \x01(\t\"\xff\x01\n\rLobbyResponse\x12\"\n\x06\x61\x63tion\x18\x01 \x01(\x0e\x32\x12.lobby.LobbyAction\x12\x0e\n\x06result\x18\x02 \x01(\x08\x12\x12\n\ngame_lobby\x18\x03 \x01(\t\x12-\n\x0cgame_history\x18\x04 \x03(\x0b\x32\x17.lobby.GameHistoryEntry\x12\x0e\n\x06moolah\x18\x05 \x01(\x05\x12)\n\tuser_info\x18\x06 \x03(\x0b\x32\x16.lobby.UserInformation\x12$\n\ngame_state\x18\x07 \x01(\x0b\x32\x10.lobby.GameState\x12\x16\n\x0eroster_version\x18\x08 \x01(\x05\" \n\rServerRequest\x12\x0f\n\x07useless\x18\x01 \x01(\t\"z\n\x0f\x43onnectionStats\x12\x10\n\x08username\x18\x01 \x01(\t\x12\r\n\x05\x64\x65pth\x18\x02 \x01(\x05\x12\x11\n\tmax_depth\x18\x03 \x01(\x05\x12\x0c\n\x04sent\x18\x04 \x01(\x05\x12\x11\n\tcollapsed\x18\x05 \x01(\x05\x12\x12\n\noverflowed\x18\x06 \x01(\x08\"\xb4\x01\n\x0eServerResponse\x12\x0e\n\x06\x61\x63tive\x18\x01 \x01(\x08\x12\x13\n\x0bnum_players\x18\x02 \x01(\x05\x12\"\n\tgame_type\x18\x03 \x01(\x0e\x32\x0f.lobby.GameType\x12+\n\x0b\x63onnections\x18\x04 \x03(\x0b\x32\x16.lobby.ConnectionStats\x12\x14\n\x0copen_streams\x18\x05 \x01(\x05\x12\x16\n\x0eleaked_streams\x18\x06 \x01(\x05\"#\n\x0fSpectateRequest\x12\x10\n\x08username\x18\x01 \x01(\t*x\n\x0bLobbyAction\x12\x0b\n\x07UNKNOWN\x10\x00\x12\x0e\n\nJOIN_LOBBY\x10\x01\x12\x0e\n\nSHOW_LOBBY\x10\x02\x12\r\n\tSEND_VOTE\x10\x03\x12\r\n\tSHOW_GAME\x10\x04\x12\r\n\tPLAY_MOVE\x10\x05\x12\x0f\n\x0bKICK_PLAYER\x10\x06*.\n\x08GameType\x12\x08\n\x04NONE\x10\x00\x12\t\n\x05TEXAS\x10\x01\x12\r\n\tFIVE_HAND\x10\x02*A\n\x0cPlayerAction\x12\x0e\n\nCHECK_CALL\x10\x00\x12\t\n\x05RAISE\x10\x01\x12\x08\n\x04\x46OLD\x10\x02\x12\x0c\n\x08\x45XCHANGE\x10\x03\x32\xbf\x01\n\x0cLobbyService\x12\x36\n\x05Lobby\x12\x13.lobby.LobbyRequest\x1a\x14.lobby.LobbyResponse(\x01\x30\x01\x12;\n\x0cGetLobbyInfo\x12\x14.lobby.ServerRequest\x1a\x15.lobby.ServerResponse\x12:\n\x08Spectate\x12\x16.lobby.SpectateRequest\x1a\x14.lobby.LobbyResponse0\x01\x62\x06proto3')
 
 _globals = globals()
 _builder.BuildMessageAndEnumDescriptors(DESCRIPTOR, _globals)
 _builder.BuildTopDescriptorsAndMessages(DESCRIPTOR, 'lobby_pb2', _globals)
 if not _descriptor._USE_C_DESCRIPTORS:
   DESCRIPTOR._loaded_options = None
-  _globals['_LOBBYACTION']._serialized_start=1203
-  _globals['_LOBBYACTION']._serialized_end=1323
-  _globals['_GAMETYPE']._serialized_start=1325
-  _globals['_GAMETYPE']._serialized_end=1371
-  _globals['_PLAYERACTION']._serialized_start=1373
-  _globals['_PLAYERACTION']._serialized_end=1438
+  _globals['_LOBBYACTION']._serialized_start=1523
+  _globals['_LOBBYACTION']._serialized_end=1643
+  _globals['_GAMETYPE']._serialized_start=1645
+  _globals['_GAMETYPE']._serialized_end=1691
+  _globals['_PLAYERACTION']._serialized_start=1693
+  _globals['_PLAYERACTION']._serialized_end=1758
   _globals['_GAMEHISTORYENTRY']._serialized_start=22
   _globals['_GAMEHISTORYENTRY']._serialized_end=125
   _globals['_USERINFORMATION']._serialized_start=127
   _globals['_USERINFORMATION']._serialized_end=197
-  _globals['_LOBBYREQUEST']._serialized_start=200
-  _globals['_LOBBYREQUEST']._serialized_end=428
-  _globals['_HANDCARDS']._serialized_start=430
-  _globals['_HANDCARDS']._serialized_end=516
-  _globals['_GAMESTATE']._serialized_start=519
-  _globals['_GAMESTATE']._serialized_end=842
-  _globals['_LOBBYRESPONSE']._serialized_start=845
-  _globals['_LOBBYRESPONSE']._serialized_end=1076
-  _globals['_SERVERREQUEST']._serialized_start=1078
-  _globals['_SERVERREQUEST']._serialized_end=1110
-  _globals['_SERVERRESPONSE']._serialized_start=1112
-  _globals['_SERVERRESPONSE']._serialized_end=1201
-  _globals['_LOBBYSERVICE']._serialized_start=1441
-  _globals['_LOBBYSERVICE']._serialized_end=1572
+  _globals['_HANDCARDS']._serialized_start=199
+  _globals['_HANDCARDS']._serialized_end=285
+  _globals['_GAMESTATE']._serialized_start=288
+  _globals['_GAMESTATE']._serialized_end=611
+  _globals['_LOBBYREQUEST']._serialized_start=614
+  _globals['_LOBBYREQUEST']._serialized_end=885
+  _globals['_LOBBYRESPONSE']._serialized_start=888
+  _globals['_LOBBYRESPONSE']._serialized_end=1143
+  _globals['_SERVERREQUEST']._serialized_start=1145
+  _globals['_SERVERREQUEST']._serialized_end=1177
+  _globals['_CONNECTIONSTATS']._serialized_start=1179
+  _globals['_CONNECTIONSTATS']._serialized_end=1301
+  _globals['_SERVERRESPONSE']._serialized_start=1304
+  _globals['_SERVERRESPONSE']._serialized_end=1484
+  _globals['_SPECTATEREQUEST']._serialized_start=1486
+  _globals['_SPECTATEREQUEST']._serialized_end=1521
+  _globals['_LOBBYSERVICE']._serialized_start=1761
+  _globals['_LOBBYSERVICE']._serialized_end=1952
 # @@protoc_insertion_point(module_scope)
@@ -44,6 +44,11 @@ class LobbyServiceStub(object):
                 request_serializer=lobby__pb2.ServerRequest.SerializeToString,
                 response_deserializer=lobby__pb2.ServerResponse.FromString,
                 _registered_method=True)
+        self.Spectate = channel.unary_stream(
+                '/lobby.LobbyService/Spectate',
+                request_serializer=lobby__pb2.SpectateRequest.SerializeToString,
+                response_deserializer=lobby__pb2.LobbyResponse.FromString,
+                _registered_method=True)
 
 
 class LobbyServiceServicer(object):
@@ -62,6 +67,14 @@ class LobbyServiceServicer(object):
         context.set_details('Method not implemented!')
         raise NotImplementedError('Method not implemented!')
 
+    def Spectate(self, request, context):
+        """Watch the table without a seat (public state only, no hole cards)
+        KICK_PLAYER with the final table marks the end of each game
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
 
 def add_LobbyServiceServicer_to_server(servicer, server):
     rpc_method_handlers = {
@@ -75,6 +88,11 @@ def add_LobbyServiceServicer_to_server(servicer, server):
                     request_deserializer=lobby__pb2.ServerRequest.FromString,
                     response_serializer=lobby__pb2.ServerResponse.SerializeToString,
             ),
+            'Spectate': grpc.unary_stream_rpc_method_handler(
+                    servicer.Spectate,
+                    request_deserializer=lobby__pb2.SpectateRequest.FromString,
+                    response_serializer=lobby__pb2.LobbyResponse.SerializeToString,
+            ),
     }
     generic_handler = grpc.method_handlers_generic_handler(
             'lobby.LobbyService', rpc_method_handlers)
@@ -139,3 +157,30 @@ class LobbyService(object):
             timeout,
             metadata,
             _registered_method=True)
+
+    @staticmethod
+    def Spectate(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_stream(
+            request,
+            target,
+            '/lobby.LobbyService/Spectate',
+            lobby__pb2.SpectateRequest.SerializeToString,
+            lobby__pb2.LobbyResponse.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
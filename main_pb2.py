@@ -24,23 +24,33 @@ _sym_db = _symbol_database.Default()
 
 
 
-DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\nmain.proto\x12\x04main\"f\n\x10GameHistoryEntry\x12!\n\tgame_type\x18\x01 \x01(\x0e\x32\x0e.main.GameType\x12\x0c\n\x04\x64\x61te\x18\x02 \x01(\t\x12\x0e\n\x06player\x18\x03 \x01(\t\x12\x11\n\tmoney_won\x18\x04 \x01(\x05\"\xa6\x01\n\x0bMainRequest\x12\x1c\n\x06\x61\x63tion\x18\x01 \x01(\x0e\x32\x0c.main.Action\x12\x10\n\x08username\x18\x02 \x01(\t\x12\x10\n\x08passhash\x18\x03 \x01(\t\x12\x14\n\x0cmoney_to_add\x18\x04 \x01(\x05\x12\x11\n\tgame_type\x18\x05 \x01(\x05\x12,\n\x0cgame_history\x18\x06 \x01(\x0b\x32\x16.main.GameHistoryEntry\"\x8e\x01\n\x0cMainResponse\x12\x1c\n\x06\x61\x63tion\x18\x01 \x01(\x0e\x32\x0c.main.Action\x12\x0e\n\x06result\x18\x02 \x01(\x08\x12\x12\n\ngame_lobby\x18\x03 \x01(\x05\x12,\n\x0cgame_history\x18\x04 \x03(\x0b\x32\x16.main.GameHistoryEntry\x12\x0e\n\x06moolah\x18\x05 \x01(\x05*\xd5\x01\n\x06\x41\x63tion\x12\x0b\n\x07UNKNOWN\x10\x00\x12\t\n\x05LOGIN\x10\x01\x12\x0c\n\x08REGISTER\x10\x02\x12\x12\n\x0e\x43HECK_USERNAME\x10\x03\x12\x10\n\x0cVIEW_HISTORY\x10\x04\x12\x0e\n\nLOAD_MONEY\x10\x05\x12\t\n\x05QUEUE\x10\x06\x12\x12\n\x0e\x44\x45LETE_ACCOUNT\x10\x07\x12\x0b\n\x07\x43ONNECT\x10\x08\x12\x0e\n\nJOIN_LOBBY\x10\t\x12\x11\n\rCONNECT_LOBBY\x10\n\x12\r\n\tSAVE_GAME\x10\x0b\x12\x11\n\rGET_USER_INFO\x10\x0c*.\n\x08GameType\x12\x08\n\x04NONE\x10\x00\x12\t\n\x05TEXAS\x10\x01\x12\r\n\tFIVE_HAND\x10\x02\x32@\n\x0bMainService\x12\x31\n\x04Main\x12\x11.main.MainRequest\x1a\x12.main.MainResponse(\x01\x30\x01\x62\x06proto3')
+DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\nmain.proto\x12\x04main\"f\n\x10GameHistoryEntry\x12!\n\tgame_type\x18\x01 \x01(\x0e\x32\x0e.main.GameType\x12\x0c\n\x04\x64\x61te\x18\x02 \x01(\t\x12\x0e\n\x06player\x18\x03 \x01(\t\x12\x11\n\tmoney_won\x18\x04 \x01(\x05\"A\n\x10LeaderboardEntry\x12\x0c\n\x04rank\x18\x01 \x01(\x05\x12\x10\n\x08username\x18\x02 \x01(\t\x12\r\n\x05score\x18\x03 \x01(\x05\"x\n\x0bPlayerStats\x12!\n\tgame_type\x18\x01 \x01(\x0e\x32\x0e.main.GameType\x12\r\n\x05games\x18\x02 \x01(\x05\x12\x0c\n\x04wins\x18\x03 \x01(\x05\x12\x14\n\x0cnet_winnings\x18\x04 \x01(\x05\x12\x13\n\x0b\x62iggest_win\x18\x05 \x01(\x05\"\xe6\x02\n\x0bMainRequest\x12\x1c\n\x06\x61\x63tion\x18\x01 \x01(\x0e\x32\x0c.main.Action\x12\x10\n\x08username\x18\x02 \x01(\t\x12\x10\n\x08passhash\x18\x03 \x01(\t\x12\x14\n\x0cmoney_to_add\x18\x04 \x01(\x05\x12\x11\n\tgame_type\x18\x05 \x01(\x05\x12,\n\x0cgame_history\x18\x06 \x01(\x0b\x32\x16.main.GameHistoryEntry\x12,\n\x0cgame_results\x18\x07 \x03(\x0b\x32\x16.main.GameHistoryEntry\x12\x12\n\nrequest_id\x18\x08 \x01(\t\x12\r\n\x05stake\x18\t \x01(\x05\x12\x15\n\rsession_token\x18\n \x01(\t\x12\x11\n\tpage_size\x18\x0b \x01(\x05\x12\x0e\n\x06\x63ursor\x18\x0c \x01(\t\x12$\n\x05\x62oard\x18\r \x01(\x0e\x32\x15.main.LeaderboardType\x12\r\n\x05top_k\x18\x0e \x01(\x05\"\xfa\x02\n\x0cMainResponse\x12\x1c\n\x06\x61\x63tion\x18\x01 \x01(\x0e\x32\x0c.main.Action\x12\x0e\n\x06result\x18\x02 \x01(\x08\x12\x12\n\ngame_lobby\x18\x03 \x01(\x05\x12,\n\x0cgame_history\x18\x04 \x03(\x0b\x32\x16.main.GameHistoryEntry\x12\x0e\n\x06moolah\x18\x05 \x01(\x05\x12\x12\n\nrequest_id\x18\x06 \x01(\t\x12\x15\n\rlobby_address\x18\x07 \x01(\t\x12\x12\n\nseat_token\x18\x08 \x01(\t\x12\x15\n\rsession_token\x18\t \x01(\t\x12\x13\n\x0bnext_cursor\x18\n \x01(\t\x12&\n\x0btotal_stats\x18\x0b \x01(\x0b\x32\x11.main.PlayerStats\x12*\n\x0fgame_type_stats\x18\x0c \x03(\x0b\x32\x11.main.PlayerStats\x12+\n\x0bleaderboard\x18\r \x03(\x0b\x32\x16.main.LeaderboardEntry\"\x88\x01\n\x0bLobbyStatus\x12\x10\n\x08lobby_id\x18\x01 \x01(\x05\x12\x0f\n\x07\x61\x64\x64ress\x18\x02 \x01(\t\x12!\n\tgame_type\x18\x03 \x01(\x0e\x32\x0e.main.GameType\x12\x12\n\nseats_free\x18\x04 \x01(\x05\x12\x0e\n\x06\x61\x63tive\x18\x05 \x01(\x08\x12\x0f\n\x07players\x18\x06 \x03(\t\"\x1a\n\x08LobbyAck\x12\x0e\n\x06result\x18\x01 \x01(\x08*\x8e\x02\n\x06\x41\x63tion\x12\x0b\n\x07UNKNOWN\x10\x00\x12\t\n\x05LOGIN\x10\x01\x12\x0c\n\x08REGISTER\x10\x02\x12\x12\n\x0e\x43HECK_USERNAME\x10\x03\x12\x10\n\x0cVIEW_HISTORY\x10\x04\x12\x0e\n\nLOAD_MONEY\x10\x05\x12\t\n\x05QUEUE\x10\x06\x12\x12\n\x0e\x44\x45LETE_ACCOUNT\x10\x07\x12\x0b\n\x07\x43ONNECT\x10\x08\x12\x0e\n\nJOIN_LOBBY\x10\t\x12\x11\n\rCONNECT_LOBBY\x10\n\x12\r\n\tSAVE_GAME\x10\x0b\x12\x11\n\rGET_USER_INFO\x10\x0c\x12\x13\n\x0fSAVE_GAME_BATCH\x10\r\x12\r\n\tGET_STATS\x10\x0e\x12\x13\n\x0fGET_LEADERBOARD\x10\x0f*.\n\x08GameType\x12\x08\n\x04NONE\x10\x00\x12\t\n\x05TEXAS\x10\x01\x12\r\n\tFIVE_HAND\x10\x02*/\n\x0fLeaderboardType\x12\n\n\x06MOOLAH\x10\x00\x12\x10\n\x0cNET_WINNINGS\x10\x01\x32\xdc\x01\n\x0bMainService\x12\x31\n\x04Main\x12\x11.main.MainRequest\x1a\x12.main.MainResponse(\x01\x30\x01\x12\x33\n\x0eLobbyHeartbeat\x12\x11.main.LobbyStatus\x1a\x0e.main.LobbyAck\x12\x36\n\x0bViewHistory\x12\x11.main.MainRequest\x1a\x12.main.MainResponse0\x01\x12-\n\x04Read\x12\x11.main.MainRequest\x1a\x12.main.MainResponseb\x06proto3')
 
 _globals = globals()
 _builder.BuildMessageAndEnumDescriptors(DESCRIPTOR, _globals)
 _builder.BuildTopDescriptorsAndMessages(DESCRIPTOR, 'main_pb2', _globals)
 if not _descriptor._USE_C_DESCRIPTORS:
   DESCRIPTOR._loaded_options = None
-  _globals['_ACTION']._serialized_start=439
-  _globals['_ACTION']._serialized_end=652
-  _globals['_GAMETYPE']._serialized_start=654
-  _globals['_GAMETYPE']._serialized_end=700
+  _globals['_ACTION']._serialized_start=1223
+  _globals['_ACTION']._serialized_end=1493
+  _globals['_GAMETYPE']._serialized_start=1495
+  _globals['_GAMETYPE']._serialized_end=1541
+  _globals['_LEADERBOARDTYPE']._serialized_start=1543
+  _globals['_LEADERBOARDTYPE']._serialized_end=1590
   _globals['_GAMEHISTORYENTRY']._serialized_start=20
   _globals['_GAMEHISTORYENTRY']._serialized_end=122
-  _globals['_MAINREQUEST']._serialized_start=125
-  _globals['_MAINREQUEST']._serialized_end=291
-  _globals['_MAINRESPONSE']._serialized_start=294
-  _globals['_MAINRESPONSE']._serialized_end=436
-  _globals['_MAINSERVICE']._serialized_start=702
-  _globals['_MAINSERVICE']._serialized_end=766
+  _globals['_LEADERBOARDENTRY']._serialized_start=124
+  _globals['_LEADERBOARDENTRY']._serialized_end=189
+  _globals['_PLAYERSTATS']._serialized_start=191
+  _globals['_PLAYERSTATS']._serialized_end=311
+  _globals['_MAINREQUEST']._serialized_start=314
+  _globals['_MAINREQUEST']._serialized_end=672
+  _globals['_MAINRESPONSE']._serialized_start=675
+  _globals['_MAINRESPONSE']._serialized_end=1053
+  _globals['_LOBBYSTATUS']._serialized_start=1056
+  _globals['_LOBBYSTATUS']._serialized_end=1192
+  _globals['_LOBBYACK']._serialized_start=1194
+  _globals['_LOBBYACK']._serialized_end=1220
+  _globals['_MAINSERVICE']._serialized_start=1593
+  _globals['_MAINSERVICE']._serialized_end=1813
 # @@protoc_insertion_point(module_scope)
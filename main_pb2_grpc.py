@@ -39,6 +39,21 @@ class MainServiceStub(object):
                 request_serializer=main__pb2.MainRequest.SerializeToString,
                 response_deserializer=main__pb2.MainResponse.FromString,
                 _registered_method=True)
+        self.LobbyHeartbeat = channel.unary_unary(
+                '/main.MainService/LobbyHeartbeat',
+                request_serializer=main__pb2.LobbyStatus.SerializeToString,
+                response_deserializer=main__pb2.LobbyAck.FromString,
+                _registered_method=True)
+        self.ViewHistory = channel.unary_stream(
+                '/main.MainService/ViewHistory',
+                request_serializer=main__pb2.MainRequest.SerializeToString,
+                response_deserializer=main__pb2.MainResponse.FromString,
+                _registered_method=True)
+        self.Read = channel.unary_unary(
+                '/main.MainService/Read',
+                request_serializer=main__pb2.MainRequest.SerializeToString,
+                response_deserializer=main__pb2.MainResponse.FromString,
+                _registered_method=True)
 
 
 class MainServiceServicer(object):
@@ -51,6 +66,28 @@ class MainServiceServicer(object):
         context.set_details('Method not implemented!')
         raise NotImplementedError('Method not implemented!')
 
+    def LobbyHeartbeat(self, request, context):
+        """Lobbies push their status so main can answer JOIN_LOBBY without polling
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def ViewHistory(self, request, context):
+        """Streams a player's whole history page by page (VIEW_HISTORY request)
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def Read(self, request, context):
+        """A single read (CHECK_USERNAME, GET_USER_INFO, VIEW_HISTORY, GET_STATS,
+        GET_LEADERBOARD), served by followers too
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
 
 def add_MainServiceServicer_to_server(servicer, server):
     rpc_method_handlers = {
@@ -59,6 +96,21 @@ def add_MainServiceServicer_to_server(servicer, server):
                     request_deserializer=main__pb2.MainRequest.FromString,
                     response_serializer=main__pb2.MainResponse.SerializeToString,
             ),
+            'LobbyHeartbeat': grpc.unary_unary_rpc_method_handler(
+                    servicer.LobbyHeartbeat,
+                    request_deserializer=main__pb2.LobbyStatus.FromString,
+                    response_serializer=main__pb2.LobbyAck.SerializeToString,
+            ),
+            'ViewHistory': grpc.unary_stream_rpc_method_handler(
+                    servicer.ViewHistory,
+                    request_deserializer=main__pb2.MainRequest.FromString,
+                    response_serializer=main__pb2.MainResponse.SerializeToString,
+            ),
+            'Read': grpc.unary_unary_rpc_method_handler(
+                    servicer.Read,
+                    request_deserializer=main__pb2.MainRequest.FromString,
+                    response_serializer=main__pb2.MainResponse.SerializeToString,
+            ),
     }
     generic_handler = grpc.method_handlers_generic_handler(
             'main.MainService', rpc_method_handlers)
@@ -96,3 +148,84 @@ class MainService(object):
             timeout,
             metadata,
             _registered_method=True)
+
+    @staticmethod
+    def LobbyHeartbeat(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(
+            request,
+            target,
+            '/main.MainService/LobbyHeartbeat',
+            main__pb2.LobbyStatus.SerializeToString,
+            main__pb2.LobbyAck.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
+    @staticmethod
+    def ViewHistory(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_stream(
+            request,
+            target,
+            '/main.MainService/ViewHistory',
+            main__pb2.MainRequest.SerializeToString,
+            main__pb2.MainResponse.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
+    @staticmethod
+    def Read(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(
+            request,
+            target,
+            '/main.MainService/Read',
+            main__pb2.MainRequest.SerializeToString,
+            main__pb2.MainResponse.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
@@ -24,17 +24,17 @@ _sym_db = _symbol_database.Default()
 
 
 
-DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\nraft.proto\x12\x04raft\"`\n\x0bVoteRequest\x12\x0c\n\x04term\x18\x01 \x01(\x05\x12\x14\n\x0c\x63\x61ndidate_id\x18\x02 \x01(\x05\x12\x16\n\x0elast_log_index\x18\x03 \x01(\x05\x12\x15\n\rlast_log_term\x18\x04 \x01(\x05\"2\n\x0cVoteResponse\x12\x0c\n\x04term\x18\x01 \x01(\x05\x12\x14\n\x0cvote_granted\x18\x02 \x01(\x08\"\xad\x01\n\x14\x41ppendEntriesRequest\x12\x0c\n\x04term\x18\x01 \x01(\x05\x12\x16\n\x0eleader_address\x18\x02 \x01(\t\x12\x1b\n\x13most_recent_log_idx\x18\x03 \x01(\x05\x12\x1a\n\x12term_of_recent_log\x18\x04 \x01(\x05\x12\x1f\n\x07\x65ntries\x18\x05 \x03(\x0b\x32\x0e.raft.LogEntry\x12\x15\n\rleader_commit\x18\x06 \x01(\x05\"6\n\x15\x41ppendEntriesResponse\x12\x0c\n\x04term\x18\x01 \x01(\x05\x12\x0f\n\x07success\x18\x02 \x01(\x08\"f\n\x10GameHistoryEntry\x12!\n\tgame_type\x18\x01 \x01(\x0e\x32\x0e.raft.GameType\x12\x0c\n\x04\x64\x61te\x18\x02 \x01(\t\x12\x0e\n\x06player\x18\x03 \x01(\t\x12\x11\n\tmoney_won\x18\x04 \x01(\x05\"\xb1\x01\n\x08LogEntry\x12\x1c\n\x06\x61\x63tion\x18\x01 \x01(\x0e\x32\x0c.raft.Action\x12\x10\n\x08username\x18\x02 \x01(\t\x12\x10\n\x08passhash\x18\x03 \x01(\t\x12\x14\n\x0cmoney_to_add\x18\x04 \x01(\x05\x12\x11\n\tgame_type\x18\x05 \x01(\x05\x12,\n\x0cgame_history\x18\x06 \x01(\x0b\x32\x16.raft.GameHistoryEntry\x12\x0c\n\x04term\x18\x07 \x01(\x05\"#\n\x10GetLeaderRequest\x12\x0f\n\x07useless\x18\x01 \x01(\x08\"+\n\x11GetLeaderResponse\x12\x16\n\x0eleader_address\x18\x01 \x01(\t*\xd5\x01\n\x06\x41\x63tion\x12\x0b\n\x07UNKNOWN\x10\x00\x12\t\n\x05LOGIN\x10\x01\x12\x0c\n\x08REGISTER\x10\x02\x12\x12\n\x0e\x43HECK_USERNAME\x10\x03\x12\x10\n\x0cVIEW_HISTORY\x10\x04\x12\x0e\n\nLOAD_MONEY\x10\x05\x12\t\n\x05QUEUE\x10\x06\x12\x12\n\x0e\x44\x45LETE_ACCOUNT\x10\x07\x12\x0b\n\x07\x43ONNECT\x10\x08\x12\x0e\n\nJOIN_LOBBY\x10\t\x12\x11\n\rCONNECT_LOBBY\x10\n\x12\r\n\tSAVE_GAME\x10\x0b\x12\x11\n\rGET_USER_INFO\x10\x0c*.\n\x08GameType\x12\x08\n\x04NONE\x10\x00\x12\t\n\x05TEXAS\x10\x01\x12\r\n\tFIVE_HAND\x10\x02\x32\xc4\x01\n\x0bRaftService\x12-\n\x04Vote\x12\x11.raft.VoteRequest\x1a\x12.raft.VoteResponse\x12H\n\rAppendEntries\x12\x1a.raft.AppendEntriesRequest\x1a\x1b.raft.AppendEntriesResponse\x12<\n\tGetLeader\x12\x16.raft.GetLeaderRequest\x1a\x17.raft.GetLeaderResponseb\x06proto3')
+DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\nraft.proto\x12\x04raft\"`\n\x0bVoteRequest\x12\x0c\n\x04term\x18\x01 \x01(\x05\x12\x14\n\x0c\x63\x61ndidate_id\x18\x02 \x01(\x05\x12\x16\n\x0elast_log_index\x18\x03 \x01(\x05\x12\x15\n\rlast_log_term\x18\x04 \x01(\x05\"2\n\x0cVoteResponse\x12\x0c\n\x04term\x18\x01 \x01(\x05\x12\x14\n\x0cvote_granted\x18\x02 \x01(\x08\"\xad\x01\n\x14\x41ppendEntriesRequest\x12\x0c\n\x04term\x18\x01 \x01(\x05\x12\x16\n\x0eleader_address\x18\x02 \x01(\t\x12\x1b\n\x13most_recent_log_idx\x18\x03 \x01(\x05\x12\x1a\n\x12term_of_recent_log\x18\x04 \x01(\x05\x12\x1f\n\x07\x65ntries\x18\x05 \x03(\x0b\x32\x0e.raft.LogEntry\x12\x15\n\rleader_commit\x18\x06 \x01(\x05\"6\n\x15\x41ppendEntriesResponse\x12\x0c\n\x04term\x18\x01 \x01(\x05\x12\x0f\n\x07success\x18\x02 \x01(\x08\"f\n\x10GameHistoryEntry\x12!\n\tgame_type\x18\x01 \x01(\x0e\x32\x0e.raft.GameType\x12\x0c\n\x04\x64\x61te\x18\x02 \x01(\t\x12\x0e\n\x06player\x18\x03 \x01(\t\x12\x11\n\tmoney_won\x18\x04 \x01(\x05\"\xf3\x01\n\x08LogEntry\x12\x1c\n\x06\x61\x63tion\x18\x01 \x01(\x0e\x32\x0c.raft.Action\x12\x10\n\x08username\x18\x02 \x01(\t\x12\x10\n\x08passhash\x18\x03 \x01(\t\x12\x14\n\x0cmoney_to_add\x18\x04 \x01(\x05\x12\x11\n\tgame_type\x18\x05 \x01(\x05\x12,\n\x0cgame_history\x18\x06 \x01(\x0b\x32\x16.raft.GameHistoryEntry\x12\x0c\n\x04term\x18\x07 \x01(\x05\x12,\n\x0cgame_results\x18\x08 \x03(\x0b\x32\x16.raft.GameHistoryEntry\x12\x12\n\nrequest_id\x18\t \x01(\t\"#\n\x10GetLeaderRequest\x12\x0f\n\x07useless\x18\x01 \x01(\x08\"+\n\x11GetLeaderResponse\x12\x16\n\x0eleader_address\x18\x01 \x01(\t\"\x12\n\x10ReadIndexRequest\"F\n\x11ReadIndexResponse\x12\x0f\n\x07success\x18\x01 \x01(\x08\x12\x0c\n\x04term\x18\x02 \x01(\x05\x12\x12\n\nread_index\x18\x03 \x01(\x05*\x8e\x02\n\x06\x41\x63tion\x12\x0b\n\x07UNKNOWN\x10\x00\x12\t\n\x05LOGIN\x10\x01\x12\x0c\n\x08REGISTER\x10\x02\x12\x12\n\x0e\x43HECK_USERNAME\x10\x03\x12\x10\n\x0cVIEW_HISTORY\x10\x04\x12\x0e\n\nLOAD_MONEY\x10\x05\x12\t\n\x05QUEUE\x10\x06\x12\x12\n\x0e\x44\x45LETE_ACCOUNT\x10\x07\x12\x0b\n\x07\x43ONNECT\x10\x08\x12\x0e\n\nJOIN_LOBBY\x10\t\x12\x11\n\rCONNECT_LOBBY\x10\n\x12\r\n\tSAVE_GAME\x10\x0b\x12\x11\n\rGET_USER_INFO\x10\x0c\x12\x13\n\x0fSAVE_GAME_BATCH\x10\r\x12\r\n\tGET_STATS\x10\x0e\x12\x13\n\x0fGET_LEADERBOARD\x10\x0f*.\n\x08GameType\x12\x08\n\x04NONE\x10\x00\x12\t\n\x05TEXAS\x10\x01\x12\r\n\tFIVE_HAND\x10\x02\x32\x82\x02\n\x0bRaftService\x12-\n\x04Vote\x12\x11.raft.VoteRequest\x1a\x12.raft.VoteResponse\x12H\n\rAppendEntries\x12\x1a.raft.AppendEntriesRequest\x1a\x1b.raft.AppendEntriesResponse\x12<\n\tGetLeader\x12\x16.raft.GetLeaderRequest\x1a\x17.raft.GetLeaderResponse\x12<\n\tReadIndex\x12\x16.raft.ReadIndexRequest\x1a\x17.raft.ReadIndexResponseb\x06proto3')
 
 _globals = globals()
 _builder.BuildMessageAndEnumDescriptors(DESCRIPTOR, _globals)
 _builder.BuildTopDescriptorsAndMessages(DESCRIPTOR, 'raft_pb2', _globals)
 if not _descriptor._USE_C_DESCRIPTORS:
   DESCRIPTOR._loaded_options = None
-  _globals['_ACTION']._serialized_start=769
-  _globals['_ACTION']._serialized_end=982
-  _globals['_GAMETYPE']._serialized_start=984
-  _globals['_GAMETYPE']._serialized_end=1030
+  _globals['_ACTION']._serialized_start=927
+  _globals['_ACTION']._serialized_end=1197
+  _globals['_GAMETYPE']._serialized_start=1199
+  _globals['_GAMETYPE']._serialized_end=1245
   _globals['_VOTEREQUEST']._serialized_start=20
   _globals['_VOTEREQUEST']._serialized_end=116
   _globals['_VOTERESPONSE']._serialized_start=118
@@ -46,11 +46,15 @@ if not _descriptor._USE_C_DESCRIPTORS:
   _globals['_GAMEHISTORYENTRY']._serialized_start=402
   _globals['_GAMEHISTORYENTRY']._serialized_end=504
   _globals['_LOGENTRY']._serialized_start=507
-  _globals['_LOGENTRY']._serialized_end=684
-  _globals['_GETLEADERREQUEST']._serialized_start=686
-  _globals['_GETLEADERREQUEST']._serialized_end=721
-  _globals['_GETLEADERRESPONSE']._serialized_start=723
-  _globals['_GETLEADERRESPONSE']._serialized_end=766
-  _globals['_RAFTSERVICE']._serialized_start=1033
-  _globals['_RAFTSERVICE']._serialized_end=1229
+  _globals['_LOGENTRY']._serialized_end=750
+  _globals['_GETLEADERREQUEST']._serialized_start=752
+  _globals['_GETLEADERREQUEST']._serialized_end=787
+  _globals['_GETLEADERRESPONSE']._serialized_start=789
+  _globals['_GETLEADERRESPONSE']._serialized_end=832
+  _globals['_READINDEXREQUEST']._serialized_start=834
+  _globals['_READINDEXREQUEST']._serialized_end=852
+  _globals['_READINDEXRESPONSE']._serialized_start=854
+  _globals['_READINDEXRESPONSE']._serialized_end=924
+  _globals['_RAFTSERVICE']._serialized_start=1248
+  _globals['_RAFTSERVICE']._serialized_end=1506
 # @@protoc_insertion_point(module_scope)
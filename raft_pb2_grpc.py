@@ -49,6 +49,11 @@ class RaftServiceStub(object):
                 request_serializer=raft__pb2.GetLeaderRequest.SerializeToString,
                 response_deserializer=raft__pb2.GetLeaderResponse.FromString,
                 _registered_method=True)
+        self.ReadIndex = channel.unary_unary(
+                '/raft.RaftService/ReadIndex',
+                request_serializer=raft__pb2.ReadIndexRequest.SerializeToString,
+                response_deserializer=raft__pb2.ReadIndexResponse.FromString,
+                _registered_method=True)
 
 
 class RaftServiceServicer(object):
@@ -72,6 +77,13 @@ class RaftServiceServicer(object):
         context.set_details('Method not implemented!')
         raise NotImplementedError('Method not implemented!')
 
+    def ReadIndex(self, request, context):
+        """asked of the leader by followers serving linearizable reads
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
 
 def add_RaftServiceServicer_to_server(servicer, server):
     rpc_method_handlers = {
@@ -90,6 +102,11 @@ def add_RaftServiceServicer_to_server(servicer, server):
                     request_deserializer=raft__pb2.GetLeaderRequest.FromString,
                     response_serializer=raft__pb2.GetLeaderResponse.SerializeToString,
             ),
+            'ReadIndex': grpc.unary_unary_rpc_method_handler(
+                    servicer.ReadIndex,
+                    request_deserializer=raft__pb2.ReadIndexRequest.FromString,
+                    response_serializer=raft__pb2.ReadIndexResponse.SerializeToString,
+            ),
     }
     generic_handler = grpc.method_handlers_generic_handler(
             'raft.RaftService', rpc_method_handlers)
@@ -181,3 +198,30 @@ class RaftService(object):
             timeout,
             metadata,
             _registered_method=True)
+
+    @staticmethod
+    def ReadIndex(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(
+            request,
+            target,
+            '/raft.RaftService/ReadIndex',
+            raft__pb2.ReadIndexRequest.SerializeToString,
+            raft__pb2.ReadIndexResponse.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
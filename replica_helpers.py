@@ -1,9 +1,8 @@
-import raft_pb2_grpc
 import raft_pb2
-import sqlite3
-import os
 import hashlib
-import grpc
+
+from storage_helpers import get_storage
+
 
 def replicate_action(req, db_path):
     """
@@ -15,86 +14,21 @@ def replicate_action(req, db_path):
     - db_path:
         the path to the database
     """
+    storage = get_storage(db_path)
     if req.action == raft_pb2.REGISTER:
-        sqlcon = sqlite3.connect(db_path)
-        sqlcur = sqlcon.cursor()
-
-        # check to make sure username is not already in use
-        sqlcur.execute(
-            "SELECT * FROM users WHERE username=?", (req.username,)
-        )
-        if sqlcur.fetchone():
-            pass
-        else:
-            # add new user to database
-            new_passhash = hashlib.sha256(
-                req.passhash.encode()
-            ).hexdigest()
-            sqlcur.execute(
-                "INSERT INTO users (username, passhash) VALUES (?, ?)",
-                (req.username, new_passhash),
-            )
-            sqlcon.commit()
-
-        sqlcon.close()
+        # add new user to database, a taken username is skipped
+        new_passhash = hashlib.sha256(
+            req.passhash.encode()
+        ).hexdigest()
+        storage.register(req.username, new_passhash)
     elif req.action == raft_pb2.DELETE_ACCOUNT:
         # delete account if params match
-        sqlcon = sqlite3.connect(db_path)
-        sqlcur = sqlcon.cursor()
-
-        username = req.username
-        passhash = req.passhash
-
-        passhash = hashlib.sha256(passhash.encode()).hexdigest()
-        sqlcur.execute(
-            "SELECT passhash FROM users WHERE username=?", (username,)
-        )
-
-        result = sqlcur.fetchone()
-        if result:
-            # username exists and passhash matches
-            if result[0] == passhash:
-                sqlcur.execute(
-                    "DELETE FROM users WHERE username=?", (username,)
-                )
-                sqlcon.commit()
-
-        sqlcon.close()
+        passhash = hashlib.sha256(req.passhash.encode()).hexdigest()
+        storage.delete_account(req.username, passhash)
     elif req.action == raft_pb2.SAVE_GAME:
-        player_name = req.game_history.player
-        game_type = req.game_history.game_type
-        money_won = req.game_history.money_won
-
-        game_type = "TEXAS HOLD EM" if game_type == raft_pb2.TEXAS else "5 CARD"
-
-        # save game to database
-        sqlcon = sqlite3.connect(db_path)
-        sqlcur = sqlcon.cursor()
-        sqlcur.execute(
-            "SELECT user_id FROM users WHERE username=?", (player_name,)
-        )
-        player_id = sqlcur.fetchone()[0]
-
-        # add game to game history
-        sqlcur.execute(
-            "INSERT INTO game_history (player_id, game_type, money_won) VALUES (?, ?, ?)",
-            (player_id, game_type, money_won),
-        )
-
-        curr_money = sqlcur.execute(
-            "SELECT moolah FROM users WHERE username=?", (player_name,)
-        ).fetchone()[0]
-
-        # update moolah in users table
-        sqlcur.execute(
-            "UPDATE users SET moolah=? WHERE username=?",
-            (curr_money + money_won, player_name),
-        )
-        sqlcur.execute(
-            "SELECT moolah FROM users WHERE username=?", (player_name,)
-        )
-
-        moolah = sqlcur.fetchone()[0]
-
-        sqlcon.commit()
-        sqlcon.close()
\ No newline at end of file
+        storage.save_games([req.game_history], req.request_id)
+    elif req.action == raft_pb2.LOAD_MONEY:
+        # the leader checked the session and named the user
+        storage.load_money(req.username, req.money_to_add, req.request_id)
+    elif req.action == raft_pb2.SAVE_GAME_BATCH:
+        storage.save_games(req.game_results, req.request_id)
@@ -0,0 +1,236 @@
+import logging
+import sqlite3
+
+# ordered migrations of poker.db, (version, description, statements)
+# a database is upgraded by running every migration newer than its version,
+# so existing migrations must never be edited, only new ones appended
+MIGRATIONS = [
+    (
+        1,
+        "create users, game_history and saved_games",
+        [
+            # IF NOT EXISTS so databases made before versioning are adopted as they are
+            """
+            CREATE TABLE IF NOT EXISTS users (
+                user_id INTEGER PRIMARY KEY,
+                username TEXT NOT NULL,
+                passhash TEXT NOT NULL,
+                moolah INTEGER DEFAULT 500
+            )
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS game_history (
+                game_id INTEGER PRIMARY KEY,
+                player_id INTEGER NOT NULL,
+                money_won INTEGER DEFAULT 0,
+                game_type TEXT NOT NULL,
+                game_date DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+            """,
+            # request ids of saved game batches, so retries are only applied once
+            """
+            CREATE TABLE IF NOT EXISTS saved_games (
+                request_id TEXT PRIMARY KEY
+            )
+            """,
+        ],
+    ),
+    (
+        2,
+        "unique index on users.username",
+        [
+            # a racing REGISTER may have left duplicates, the first account wins
+            # and takes over the games of the others, with what they won
+            """
+            UPDATE users SET moolah=moolah + (
+                SELECT COALESCE(SUM(money_won), 0) FROM game_history
+                JOIN users AS duplicate ON duplicate.user_id=game_history.player_id
+                WHERE duplicate.username=users.username AND duplicate.user_id<>users.user_id
+            )
+            WHERE user_id IN (SELECT MIN(user_id) FROM users GROUP BY username)
+            """,
+            """
+            UPDATE game_history SET player_id=(
+                SELECT MIN(first.user_id) FROM users AS duplicate
+                JOIN users AS first ON first.username=duplicate.username
+                WHERE duplicate.user_id=game_history.player_id
+            )
+            WHERE player_id IN (
+                SELECT user_id FROM users WHERE user_id NOT IN (
+                    SELECT MIN(user_id) FROM users GROUP BY username
+                )
+            )
+            """,
+            """
+            DELETE FROM users WHERE user_id NOT IN (
+                SELECT MIN(user_id) FROM users GROUP BY username
+            )
+            """,
+            "CREATE UNIQUE INDEX IF NOT EXISTS users_username ON users (username)",
+        ],
+    ),
+    (
+        3,
+        "index game_history by player and date",
+        [
+            """
+            CREATE INDEX IF NOT EXISTS game_history_player_date
+            ON game_history (player_id, game_date)
+            """,
+        ],
+    ),
+    (
+        4,
+        "index game_history by player and game id for paging",
+        [
+            """
+            CREATE INDEX IF NOT EXISTS game_history_player_game
+            ON game_history (player_id, game_id)
+            """,
+        ],
+    ),
+    (
+        5,
+        "player_stats, totals of game_history per player and game type",
+        [
+            """
+            CREATE TABLE IF NOT EXISTS player_stats (
+                player_id INTEGER NOT NULL,
+                game_type TEXT NOT NULL,
+                games INTEGER DEFAULT 0,
+                wins INTEGER DEFAULT 0,
+                net_winnings INTEGER DEFAULT 0,
+                biggest_win INTEGER DEFAULT 0,
+                PRIMARY KEY (player_id, game_type)
+            ) WITHOUT ROWID
+            """,
+            # games saved before the table existed
+            """
+            INSERT OR IGNORE INTO player_stats
+            SELECT player_id, game_type, COUNT(*), SUM(money_won > 0), SUM(money_won),
+                MAX(MAX(money_won), 0)
+            FROM game_history GROUP BY player_id, game_type
+            """,
+        ],
+    ),
+    (
+        6,
+        "append-only ledger of balance changes",
+        [
+            # one entry per user and transaction, so a transaction applied
+            # twice (a retried request, a replayed log entry) is ignored
+            """
+            CREATE TABLE IF NOT EXISTS ledger (
+                entry_id INTEGER PRIMARY KEY,
+                txn_id TEXT NOT NULL,
+                user_id INTEGER NOT NULL,
+                amount INTEGER NOT NULL,
+                reason TEXT NOT NULL,
+                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                UNIQUE (txn_id, user_id)
+            )
+            """,
+            "CREATE INDEX IF NOT EXISTS ledger_user ON ledger (user_id)",
+            """
+            CREATE TRIGGER IF NOT EXISTS ledger_no_update BEFORE UPDATE ON ledger
+            BEGIN SELECT RAISE(ABORT, 'ledger is append-only'); END
+            """,
+            """
+            CREATE TRIGGER IF NOT EXISTS ledger_no_delete BEFORE DELETE ON ledger
+            BEGIN SELECT RAISE(ABORT, 'ledger is append-only'); END
+            """,
+            # balances from before the ledger, so every user's entries add up to their moolah
+            """
+            INSERT OR IGNORE INTO ledger (txn_id, user_id, amount, reason)
+            SELECT 'opening:' || user_id, user_id, moolah, 'OPENING' FROM users
+            """,
+        ],
+    ),
+    (
+        7,
+        "never reuse user ids",
+        [
+            # without AUTOINCREMENT a deleted user's id went to the next new user,
+            # who then matched the deleted user's session tokens
+            """
+            CREATE TABLE users_autoincrement (
+                user_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                username TEXT NOT NULL,
+                passhash TEXT NOT NULL,
+                moolah INTEGER DEFAULT 500
+            )
+            """,
+            """
+            INSERT INTO users_autoincrement (user_id, username, passhash, moolah)
+            SELECT user_id, username, passhash, moolah FROM users
+            """,
+            "DROP TABLE users",
+            "ALTER TABLE users_autoincrement RENAME TO users",
+            "CREATE UNIQUE INDEX users_username ON users (username)",
+            # ids of users deleted before this migration are still in game_history and ledger
+            """
+            INSERT INTO sqlite_sequence (name, seq)
+            SELECT 'users', 0 WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name='users')
+            """,
+            """
+            UPDATE sqlite_sequence SET seq=MAX(
+                seq,
+                (SELECT COALESCE(MAX(player_id), 0) FROM game_history),
+                (SELECT COALESCE(MAX(user_id), 0) FROM ledger)
+            ) WHERE name='users'
+            """,
+        ],
+    ),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def schema_version(conn):
+    """
+    The version of the database, 0 if it was never migrated.
+    """
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            applied_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+        """
+    )
+    return conn.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version").fetchone()[0]
+
+
+def migrate(db_path):
+    """
+    Upgrade the database at db_path in place to the latest version.
+
+    Each migration runs in its own transaction together with its
+    schema_version row, so a crash leaves the database at the last
+    migration that finished.
+
+    Returns the versions that were applied.
+    """
+    # autocommit, transactions are opened explicitly so DDL is included
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    applied = []
+    try:
+        for version, description, statements in MIGRATIONS:
+            # IMMEDIATE so two processes cannot both apply the same migration
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                if version <= schema_version(conn):
+                    conn.execute("ROLLBACK")
+                    continue
+                for statement in statements:
+                    conn.execute(statement)
+                conn.execute("INSERT INTO schema_version (version) VALUES (?)", (version,))
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            logging.info(f"[SCHEMA] {db_path} migrated to version {version}: {description}")
+            applied.append(version)
+    finally:
+        conn.close()
+    return applied
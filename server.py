@@ -1,7 +1,6 @@
 import hashlib
 import os
 import random
-import sqlite3
 import sys
 import grpc
 from concurrent import futures
@@ -15,17 +14,29 @@ import main_pb2_grpc
 import main_pb2
 import raft_pb2_grpc
 import raft_pb2
-import lobby_pb2_grpc
-import lobby_pb2
 import json
 import traceback
 from replica_helpers import replicate_action
+from schema_helpers import migrate
+from storage_helpers import MAX_LOAD_MONEY, get_storage, history_response, stats_response
+from leaderboard_helpers import leaderboard_response
+from leader_helpers import (
+    MUTATING_ACTIONS,
+    READ_ACTIONS,
+    FollowerReads,
+    LeaderLease,
+    assign_request_id,
+    missing_entries,
+    reject_not_leader,
+)
+from lobby_helpers import LobbyRegistry, Matchmaker
+from token_helpers import make_session_token, make_token, read_session_token
+from stream_helpers import OutboundBuffer, StreamTracker
 
 """
 Making sure the server is started with the correct arguments.
 """
 num_servers = 5
-num_lobbies = 2
 
 if len(sys.argv) != 2:
     logging.error("Usage: python server.py <server_index>")
@@ -47,6 +58,12 @@ with open("config/config.json") as f:
 
 log_path = config["servers"]["log_paths"][idx]
 db_path = config["servers"]["db_paths"][idx]
+# bring an existing database up to the current schema in place
+migrate(db_path)
+# long-lived connections to db_path, one per thread
+storage = get_storage(db_path)
+# leaderboard and username filter are kept in memory from here on
+storage.load()
 
 # setup logging
 if not os.path.exists(log_path):
@@ -81,11 +98,6 @@ all_servers = [
     if i != idx
 ]
 
-all_lobbies = [
-    f"{config['lobbies']['lobby_hosts'][i]}:{config['lobbies']['lobby_ports'][i]}"
-    for i in range(num_lobbies)
-]
-
 # raft params
 raft_state = "FOLLOWER"
 current_term = 0
@@ -97,6 +109,138 @@ num_servers = len(all_servers) + 1
 # timer for election timeout
 timer = random.randint(1, 5)
 commit = 0
+# the leader answers ReadIndex while a majority recently acknowledged it
+# shorter than the 0.3s minimum election timeout of followers
+lease = LeaderLease(config["servers"]["leader_lease"])
+# followers serve reads themselves when it is safe
+follower_reads = FollowerReads(
+    max_staleness=config["servers"]["follower_max_staleness"],
+    read_timeout=config["servers"]["follower_read_timeout"],
+)
+# channels to leaders, reused by ReadIndex calls
+leader_channels = {}
+
+# open client/lobby streams, reaped when their client disconnects
+outbound_buffer_size = config["servers"]["outbound_buffer_size"]
+streams = StreamTracker(idle_timeout=config["servers"]["stream_idle_timeout"])
+
+# lobbies push their status here, JOIN_LOBBY is answered from it
+lobby_registry = LobbyRegistry(ttl=config["servers"]["lobby_ttl"])
+
+
+# signs session tokens and seat reservations, lobbies check them with the same secret
+token_secret = config["tokens"]["secret"]
+seat_ttl = config["tokens"]["seat_ttl"]
+session_ttl = config["tokens"]["session_ttl"]
+
+
+def seat_response(action, username, lobby):
+    """
+    Response sending a player to the lobby their seat is reserved in.
+    """
+    return main_pb2.MainResponse(
+        action=action,
+        result=True,
+        game_lobby=lobby.lobby_id,
+        lobby_address=lobby.address,
+        seat_token=make_token(token_secret, ["seat", lobby.lobby_id, username], seat_ttl),
+    )
+
+
+def send_seat(username, lobby):
+    """
+    Tell a queued player which lobby the matchmaker seated them in.
+    """
+    if username not in clients:
+        logging.info(f"[MATCH] {username} left before being seated.")
+        return
+    clients[username].put(seat_response(main_pb2.QUEUE, username, lobby))
+
+
+def read_session(token):
+    """
+    (username, user_id) of a valid session token whose account still exists, or None.
+    """
+    return storage.check_session(read_session_token(token_secret, token))
+
+
+def read_response(req):
+    """
+    Response to a read (READ_ACTIONS), from this replica's database.
+    """
+    if req.action == main_pb2.CHECK_USERNAME:
+        # if username is already in use, send response with success=False
+        # otherwise, send response with success=True
+        return main_pb2.MainResponse(
+            action=main_pb2.CHECK_USERNAME,
+            result=not storage.username_exists(req.username),
+        )
+
+    if req.action == main_pb2.GET_LEADERBOARD:
+        # served from memory, the database is not read
+        return leaderboard_response(storage.leaderboard, req.board, req.game_type, req.top_k)
+
+    # the session token says who they are, so credentials are not checked again
+    session = read_session(req.session_token)
+    if session is None:
+        return main_pb2.MainResponse(action=req.action, result=False)
+
+    if req.action == main_pb2.GET_USER_INFO:
+        # update user on how much money they have
+        moolah = storage.get_moolah(session[1])
+        if moolah is None:
+            return main_pb2.MainResponse(action=main_pb2.GET_USER_INFO, result=False)
+        return main_pb2.MainResponse(action=main_pb2.GET_USER_INFO, result=True, moolah=moolah)
+
+    if req.action == main_pb2.GET_STATS:
+        # profile stats come from player_stats, not from the whole game history
+        # any signed in player may look at anyone's stats by username
+        return stats_response(storage, session, req.username)
+
+    # VIEW_HISTORY, one page at a time, the client asks for the next one with next_cursor
+    return history_response(storage, session, req.page_size, req.cursor)
+
+
+def leader_read_index():
+    """
+    Ask the leader for its read index. Returns None if it cannot give one.
+    """
+    address = leader_address
+    if not address:
+        return None
+    try:
+        if address not in leader_channels:
+            leader_channels[address] = grpc.insecure_channel(address)
+        stub = raft_pb2_grpc.RaftServiceStub(leader_channels[address])
+        response = stub.ReadIndex(
+            raft_pb2.ReadIndexRequest(), timeout=follower_reads.read_timeout
+        )
+    except grpc.RpcError as e:
+        logging.error(f"[RAFT] Error asking {address} for read index: {e.code()}")
+        return None
+    return response.read_index if response.success else None
+
+
+def can_serve(req):
+    """
+    Whether this replica may answer a request itself.
+    Followers serve reads only, while they are recent enough. Everything else
+    (writes, lobbies, matchmaking, connected clients) lives on the leader.
+    """
+    if raft_state == "LEADER":
+        return True
+    if req.action in READ_ACTIONS:
+        return follower_reads.can_read(req.action, leader_read_index)
+    return False
+
+
+# players waiting for a table, seated in batches
+matchmaker = Matchmaker(
+    lobby_registry,
+    send_seat,
+    tick=config["servers"]["matchmaking_tick"],
+    seat_ttl=seat_ttl,
+)
 
 
 class MainServiceServicer(main_pb2_grpc.MainServiceServicer):
@@ -116,24 +260,50 @@ class MainServiceServicer(main_pb2_grpc.MainServiceServicer):
         request_iterator : iterator
             iterator of requests from client
         context : context
-            All tutorials have this, but it's not used here. Kept for compatibility.
+            used to close the stream as soon as the client disconnects
         """
         username = None
         # indicator for whether the server is connected to a lobby or a client
         connected_to_lobby = False
-        # queue for sending responses to client
-        client_queue = queue.Queue()
+        # bounded buffer for sending responses to client
+        client_queue = OutboundBuffer(maxsize=outbound_buffer_size)
+        streams.open(client_queue, context)
         # queue for sending responses to lobby
         lobby_queue = queue.Queue()
+        # mutating request received while this server is a follower
+        rejected = None
 
         # handle incoming requests
         def handle_requests():
             global log, current_term
-            nonlocal username, connected_to_lobby
+            nonlocal username, connected_to_lobby, rejected
             try:
                 for req in request_iterator:
+                    streams.touch(client_queue)
+                    if not can_serve(req):
+                        # a follower only answers reads it can serve consistently,
+                        # send the caller to the leader for everything else
+                        logging.info(
+                            f"[MAIN] Not leader, redirecting {req.action} to {leader_address}."
+                        )
+                        rejected = req
+                        client_queue.close()
+                        return
                     # log size of req in bytes
                     logging.info(f"[MAIN] Size of request: {sys.getsizeof(req)} bytes")
+                    # the transaction id is logged with the request, so
+                    # replicas replaying it apply it only once
+                    assign_request_id(req)
+                    if req.action == main_pb2.LOAD_MONEY:
+                        # checked before logging, so a rejected load is never replicated
+                        session = read_session(req.session_token)
+                        if session is None or not 0 < req.money_to_add <= MAX_LOAD_MONEY:
+                            client_queue.put(
+                                main_pb2.MainResponse(action=main_pb2.LOAD_MONEY, result=False)
+                            )
+                            continue
+                        # replicas trust the username in the log, so it comes from the session
+                        req.username = session[0]
                     # create a copy of req with different memory
                     log_copy = raft_pb2.LogEntry(
                         action=req.action,
@@ -146,61 +316,47 @@ class MainServiceServicer(main_pb2_grpc.MainServiceServicer):
                             player=req.game_history.player,
                         ),
                         term=current_term,
-                    )
-                    log.append(log_copy)
-
-                    if req.action == main_pb2.CHECK_USERNAME:
-                        # check if username is already in use
-                        sqlcon = sqlite3.connect(db_path)
-                        sqlcur = sqlcon.cursor()
-
-                        sqlcur.execute(
-                            "SELECT * FROM users WHERE username=?", (req.username,)
-                        )
-
-                        # if username is already in use, send response with success=False
-                        # otherwise, send response with success=True
-                        if sqlcur.fetchone():
-                            client_queue.put(
-                                main_pb2.MainResponse(
-                                    action=main_pb2.CHECK_USERNAME, result=False
-                                )
-                            )
-                        else:
-                            client_queue.put(
-                                main_pb2.MainResponse(
-                                    action=main_pb2.CHECK_USERNAME, result=True
-                                )
+                        request_id=req.request_id,
+                        game_results=[
+                            raft_pb2.GameHistoryEntry(
+                                game_type=result.game_type,
+                                money_won=result.money_won,
+                                player=result.player,
                             )
-                        sqlcon.close()
+                            for result in req.game_results
+                        ],
+                    )
+                    # only the leader's log counts, followers receive it in AppendEntries
+                    # reads and session requests change nothing, so they are not replicated
+                    if raft_state == "LEADER" and req.action in MUTATING_ACTIONS:
+                        log.append(log_copy)
+
+                    if req.action in READ_ACTIONS:
+                        # the same on the Read RPC, which followers serve too
+                        if req.action == main_pb2.GET_USER_INFO:
+                            session = read_session(req.session_token)
+                            if session is not None:
+                                username = session[0]
+                        client_queue.put(read_response(req))
 
                     elif req.action == main_pb2.LOGIN:
                         # check if username and password match
-                        sqlcon = sqlite3.connect(db_path)
-                        sqlcur = sqlcon.cursor()
-
                         new_passhash = hashlib.sha256(req.passhash.encode()).hexdigest()
-
-                        sqlcur.execute(
-                            "SELECT * FROM users WHERE username=? AND passhash=?",
-                            (req.username, new_passhash),
-                        )
+                        user = storage.check_login(req.username, new_passhash)
 
                         # if username and password match, send response with success=True
                         # otherwise, send response with success=False
-                        if sqlcur.fetchone():
-
-                            sqlcur.execute(
-                                "SELECT moolah FROM users WHERE username=?",
-                                (req.username,),
-                            )
-
-                            moolah = sqlcur.fetchone()[0]
+                        if user:
+                            user_id, moolah = user
 
+                            # later requests show this token instead of credentials
                             response = main_pb2.MainResponse(
                                 action=main_pb2.LOGIN,
                                 result=True,
                                 moolah=moolah,
+                                session_token=make_session_token(
+                                    token_secret, req.username, user_id, session_ttl
+                                ),
                             )
 
                             client_queue.put(response)
@@ -214,93 +370,61 @@ class MainServiceServicer(main_pb2_grpc.MainServiceServicer):
                                     action=main_pb2.LOGIN, result=False
                                 )
                             )
-                        sqlcon.close()
 
                     elif req.action == main_pb2.REGISTER:
-                        sqlcon = sqlite3.connect(db_path)
-                        sqlcur = sqlcon.cursor()
-
-                        # check to make sure username is not already in use
-                        sqlcur.execute(
-                            "SELECT * FROM users WHERE username=?", (req.username,)
-                        )
-                        if sqlcur.fetchone():
+                        # add new user to database, unless the username is already in use
+                        new_passhash = hashlib.sha256(
+                            req.passhash.encode()
+                        ).hexdigest()
+                        user_id = storage.register(req.username, new_passhash)
+                        if user_id is None:
                             client_queue.put(
                                 main_pb2.MainResponse(
                                     action=main_pb2.REGISTER, result=False
                                 )
                             )
                         else:
-                            # add new user to database
-                            new_passhash = hashlib.sha256(
-                                req.passhash.encode()
-                            ).hexdigest()
-                            sqlcur.execute(
-                                "INSERT INTO users (username, passhash) VALUES (?, ?)",
-                                (req.username, new_passhash),
-                            )
-                            sqlcon.commit()
                             response = main_pb2.MainResponse(
-                                action=main_pb2.REGISTER, result=True, moolah=500
+                                action=main_pb2.REGISTER,
+                                result=True,
+                                moolah=500,
+                                session_token=make_session_token(
+                                    token_secret, req.username, user_id, session_ttl
+                                ),
                             )
 
                             client_queue.put(response)
 
-                        sqlcon.close()
-
                         # add user to clients
                         username = req.username
                         clients[username] = client_queue
 
                     elif req.action == main_pb2.DELETE_ACCOUNT:
                         # delete account if params match
-                        sqlcon = sqlite3.connect(db_path)
-                        sqlcur = sqlcon.cursor()
-
                         username = req.username
-                        passhash = req.passhash
-
-                        passhash = hashlib.sha256(passhash.encode()).hexdigest()
-                        sqlcur.execute(
-                            "SELECT passhash FROM users WHERE username=?", (username,)
-                        )
+                        passhash = hashlib.sha256(req.passhash.encode()).hexdigest()
 
-                        result = sqlcur.fetchone()
-                        if result:
-                            # username exists and passhash matches
-                            if result[0] == passhash:
-                                sqlcur.execute(
-                                    "DELETE FROM users WHERE username=?", (username,)
+                        # username exists and passhash matches
+                        if storage.delete_account(username, passhash):
+                            client_queue.put(
+                                main_pb2.MainResponse(
+                                    action=main_pb2.DELETE_ACCOUNT, result=True
                                 )
-                                sqlcon.commit()
+                            )
+                            # tell server to ping users to update their chat, remove from connected users
 
-                                client_queue.put(
-                                    main_pb2.MainResponse(
-                                        action=main_pb2.DELETE_ACCOUNT, result=True
-                                    )
-                                )
-                                # tell server to ping users to update their chat, remove from connected users
-
-                                # delete user from clients
-                                if username in clients:
-                                    del clients[username]
-
-                            # username exists but passhash is wrong
-                            else:
-                                client_queue.put(
-                                    main_pb2.MainResponse(
-                                        action=main_pb2.DELETE_ACCOUNT, result=False
-                                    )
-                                )
+                            # delete user from clients
+                            if username in clients:
+                                del clients[username]
+
+                        # username doesn't exist or passhash is wrong
                         else:
-                            # username doesn't exist
                             client_queue.put(
                                 main_pb2.MainResponse(
                                     action=main_pb2.DELETE_ACCOUNT, result=False
                                 )
                             )
 
-                        sqlcon.close()
                     elif req.action == main_pb2.CONNECT:
                         # a new leader was chosen, client connected to new leader
                         # add the user to the clients if they are signed in
@@ -315,109 +439,54 @@ class MainServiceServicer(main_pb2_grpc.MainServiceServicer):
                             connected_to_lobby = True
                     elif req.action == main_pb2.SAVE_GAME:
                         # save game to data base
-                        player_name = req.game_history.player
-                        game_type = req.game_history.game_type
-                        money_won = req.game_history.money_won
-
-                        game_type = (
-                            "TEXAS HOLD EM" if game_type == main_pb2.TEXAS else "5 CARD"
-                        )
-
-                        # save game to database
-                        sqlcon = sqlite3.connect(db_path)
-                        sqlcur = sqlcon.cursor()
-                        sqlcur.execute(
-                            "SELECT user_id FROM users WHERE username=?", (player_name,)
-                        )
-                        player_id = sqlcur.fetchone()[0]
-
-                        # add game to game history
-                        sqlcur.execute(
-                            "INSERT INTO game_history (player_id, game_type, money_won) VALUES (?, ?, ?)",
-                            (player_id, game_type, money_won),
-                        )
+                        storage.save_games([req.game_history], req.request_id)
 
-                        curr_money = sqlcur.execute(
-                            "SELECT moolah FROM users WHERE username=?", (player_name,)
-                        ).fetchone()[0]
-
-                        # update moolah in users table
-                        sqlcur.execute(
-                            "UPDATE users SET moolah=? WHERE username=?",
-                            (curr_money + money_won, player_name),
-                        )
-                        sqlcur.execute(
-                            "SELECT moolah FROM users WHERE username=?", (player_name,)
-                        )
-
-                        moolah = sqlcur.fetchone()[0]
-
-                        sqlcon.commit()
-                        sqlcon.close()
-
-                    elif req.action == main_pb2.GET_USER_INFO:
-                        # update user on how much money they have
-                        username = req.username
-                        sqlcon = sqlite3.connect(db_path)
-                        sqlcur = sqlcon.cursor()
-
-                        # check if user exists
-                        sqlcur.execute(
-                            "SELECT * FROM users WHERE username=?", (username,)
-                        )
-                        if not sqlcur.fetchone():
+                    elif req.action == main_pb2.LOAD_MONEY:
+                        # add moolah through the ledger, a retry with the same
+                        # request_id returns the balance without adding again
+                        moolah = storage.load_money(req.username, req.money_to_add, req.request_id)
+                        if moolah is None:
                             client_queue.put(
-                                main_pb2.MainResponse(
-                                    action=main_pb2.GET_USER_INFO, result=False
-                                )
+                                main_pb2.MainResponse(action=main_pb2.LOAD_MONEY, result=False)
                             )
                         else:
-                            sqlcur.execute(
-                                "SELECT moolah FROM users WHERE username=?", (username,)
-                            )
-                            moolah = sqlcur.fetchone()[0]
-
-                            clients[req.username].put(
+                            client_queue.put(
                                 main_pb2.MainResponse(
-                                    action=main_pb2.GET_USER_INFO,
+                                    action=main_pb2.LOAD_MONEY,
                                     result=True,
                                     moolah=moolah,
+                                    request_id=req.request_id,
                                 )
                             )
 
-                    elif req.action == main_pb2.JOIN_LOBBY:
-                        # allow user to find available lobbies
-                        game_type = req.game_type
-                        # check if lobby is open
-                        sent_lobby = False
-                        for idx, lobby in enumerate(all_lobbies):
-                            try:
-                                channel = grpc.insecure_channel(lobby)
-                                stub = lobby_pb2_grpc.LobbyServiceStub(channel)
-                                response = stub.GetLobbyInfo(
-                                    lobby_pb2.ServerRequest(
-                                        useless="",
-                                    )
-                                )
+                    elif req.action == main_pb2.SAVE_GAME_BATCH:
+                        # save every result of a finished game in one transaction
+                        if not storage.save_games(req.game_results, req.request_id):
+                            logging.info(f"[MAIN] Batch {req.request_id} already saved.")
+                        # acknowledge so the lobby can drop it from its outbox
+                        client_queue.put(
+                            main_pb2.MainResponse(
+                                action=main_pb2.SAVE_GAME_BATCH,
+                                result=True,
+                                request_id=req.request_id,
+                            )
+                        )
 
-                                if (
-                                    (not response.active)
-                                    and (response.game_type == game_type)
-                                    and (response.num_players < 4)
-                                ):
-                                    # tell user it can join lobby
-                                    client_queue.put(
-                                        main_pb2.MainResponse(
-                                            action=main_pb2.JOIN_LOBBY,
-                                            result=True,
-                                            game_lobby=idx,
-                                        )
-                                    )
-                                    sent_lobby = True
-                                    break
-                            except Exception as e:
-                                logging.error(f"[MAIN] Error joining lobby: {e}")
-                        if not sent_lobby:
+                    elif req.action == main_pb2.JOIN_LOBBY:
+                        # find an open lobby from the heartbeats lobbies sent
+                        # only signed in players get a seat
+                        session = read_session(req.session_token)
+                        lobby = lobby_registry.find(req.game_type)
+                        if (
+                            session is not None
+                            and lobby is not None
+                            and lobby_registry.reserve(lobby.lobby_id, session[0], seat_ttl)
+                        ):
+                            # tell user it can join lobby, holding a seat for them
+                            client_queue.put(
+                                seat_response(main_pb2.JOIN_LOBBY, session[0], lobby)
+                            )
+                        else:
                             client_queue.put(
                                 main_pb2.MainResponse(
                                     action=main_pb2.JOIN_LOBBY,
@@ -425,41 +494,15 @@ class MainServiceServicer(main_pb2_grpc.MainServiceServicer):
                                 )
                             )
 
-
-                    elif req.action == main_pb2.VIEW_HISTORY:
-                        # send history back to client
-                        curr_username = req.username
-                        sqlcon = sqlite3.connect(db_path)
-                        sqlcur = sqlcon.cursor()
-                        sqlcur.execute(
-                            "SELECT user_id FROM users WHERE username=?", (curr_username,)
-                        )
-                        player_id = sqlcur.fetchone()[0]
-
-                        sqlcur.execute(
-                            "SELECT game_type, money_won FROM game_history WHERE player_id=? ORDER BY game_date DESC",
-                            (player_id,),
-                        )
-
-                        game_history = sqlcur.fetchall()
-
-                        games = []
-                        for i in range(len(game_history)):
-                            game = main_pb2.GameHistoryEntry(
-                                game_type=main_pb2.TEXAS if game_history[i][0] == "TEXAS HOLD EM" else main_pb2.FIVE_HAND,
-                                money_won=game_history[i][1],
-                                player=curr_username,
-                            )
-                            games.append(game)
-                        
-                        client_queue.put(
-                            main_pb2.MainResponse(
-                                action=main_pb2.VIEW_HISTORY,
-                                result=True,
-                                game_history=games,
+                    elif req.action == main_pb2.QUEUE:
+                        # the matchmaker sends the lobby once a table is formed
+                        session = read_session(req.session_token)
+                        if session is None or not matchmaker.add(
+                            session[0], req.game_type, req.stake
+                        ):
+                            client_queue.put(
+                                main_pb2.MainResponse(action=main_pb2.QUEUE, result=False)
                             )
-                        )
-                        sqlcon.close()
 
                     else:
                         logging.error(f"[MAIN] Invalid action: {req.action}")
@@ -471,23 +514,104 @@ class MainServiceServicer(main_pb2_grpc.MainServiceServicer):
                     f"[MAIN] Error handling requests at line {line_number}: {traceback.format_exc()}"
                 )
             finally:
+                if username is not None:
+                    matchmaker.remove(username)
                 if username in clients:
                     del clients[username]
                     if connected_to_lobby:
                         logging.info(f"[MAIN] Lobby {username} disconnected.")
                     else:
                         logging.info(f"[MAIN] {username} disconnected.")
+                # wake the response loop so its worker is released
+                streams.requests_done(client_queue)
 
         # run request handling in a separate thread.
         threading.Thread(target=handle_requests, daemon=True).start()
 
         # continuously yield responses from the client's queue.
-        while True:
-            try:
+        try:
+            while True:
                 response = client_queue.get()
+                if response is None:
+                    break
+                # receiving counts as activity too, not only sending requests
+                streams.touch(client_queue)
                 yield response
-            except Exception as e:
-                break
+        finally:
+            streams.close(client_queue)
+
+        if rejected is not None:
+            reject_not_leader(context, leader_address, rejected)
+        # a retryable status, so the client reconnects instead of taking the end as final
+        if client_queue.overflowed:
+            logging.error(f"[MAIN] {username} cannot keep up, disconnecting.")
+            context.abort(grpc.StatusCode.UNAVAILABLE, "Too many unsent messages.")
+        if client_queue.reaped:
+            logging.info(f"[MAIN] {username} was idle, disconnecting.")
+            context.abort(grpc.StatusCode.UNAVAILABLE, "Stream was idle.")
+
+    def LobbyHeartbeat(self, request, context):
+        """
+        Records the status a lobby pushed, used to answer JOIN_LOBBY.
+
+        Parameters:
+        ----------
+        request : LobbyStatus
+            the lobby's game type, free seats and whether a game is running
+        context : context
+            unused
+        """
+        lobby_registry.heartbeat(request)
+        # the lobby's Main stream only carries game results, so its
+        # heartbeats keep that stream from being reaped as idle
+        lobby_stream = clients.get(str(request.lobby_id))
+        if lobby_stream is not None:
+            streams.touch(lobby_stream)
+        return main_pb2.LobbyAck(result=True)
+
+    def Read(self, request, context):
+        """
+        Answers a single read. Followers answer it too, while they can do so
+        consistently, and otherwise redirect the caller to the leader.
+
+        Parameters:
+        ----------
+        request : MainRequest
+            a read, one of READ_ACTIONS
+        context : context
+            used to reject the read
+        """
+        if request.action not in READ_ACTIONS:
+            context.abort(grpc.StatusCode.INVALID_ARGUMENT, f"Not a read: {request.action}")
+        if not can_serve(request):
+            reject_not_leader(context, leader_address, request)
+        return read_response(request)
+
+    def ViewHistory(self, request, context):
+        """
+        Streams a player's whole history, one VIEW_HISTORY response per page.
+
+        Parameters:
+        ----------
+        request : MainRequest
+            session_token of the player, page_size and an optional cursor to start from
+        context : context
+            stops the stream early if the client goes away
+        """
+        # a follower streams it once caught up with the leader, like a Read
+        if not can_serve(main_pb2.MainRequest(action=main_pb2.VIEW_HISTORY)):
+            reject_not_leader(context, leader_address, request)
+        session = read_session(request.session_token)
+        if session is None:
+            yield main_pb2.MainResponse(action=main_pb2.VIEW_HISTORY, result=False)
+            return
+        cursor = request.cursor
+        while context.is_active():
+            response = history_response(storage, session, request.page_size, cursor)
+            yield response
+            if not response.result or not response.next_cursor:
+                return
+            cursor = response.next_cursor
 
 
 class RaftServiceServicer(raft_pb2_grpc.RaftServiceServicer):
@@ -547,6 +671,7 @@ class RaftServiceServicer(raft_pb2_grpc.RaftServiceServicer):
 
         if raft_state == "LEADER":
             logging.info(f"[RAFT] Lost majority. Server {idx} is leader.")
+            lease.revoke()
         raft_state = "FOLLOWER"
 
         # update leader address if it has changed
@@ -556,18 +681,22 @@ class RaftServiceServicer(raft_pb2_grpc.RaftServiceServicer):
             )
             leader_address = request.leader_address
 
-        # check if no new entries
-        # if so, just return current term
-        if len(log) - 1 == request.most_recent_log_idx:
-            response = raft_pb2.AppendEntriesResponse(term=current_term, success=True)
-            return response
+        # the leader sends its whole log, append what this replica is missing
+        new_entries = missing_entries(log, request.entries)
+        if new_entries is None:
+            logging.error(
+                f"[RAFT] Log of {len(log)} entries is not a prefix of the leader's "
+                f"{len(request.entries)}, not applying."
+            )
+            return raft_pb2.AppendEntriesResponse(term=current_term, success=False)
 
         # log all new entries and replicate action
-        new_entries = request.entries[request.leader_commit + 1 :]
         for entry in new_entries:
             # add to log and replicate action
             log.append(entry)
             replicate_action(entry, db_path)
+        # reads waiting for these entries can go ahead
+        follower_reads.heard_from_leader(len(log) - 1)
 
         response = raft_pb2.AppendEntriesResponse(term=request.term, success=True)
         return response
@@ -581,6 +710,19 @@ class RaftServiceServicer(raft_pb2_grpc.RaftServiceServicer):
         global leader_address
         return raft_pb2.GetLeaderResponse(leader_address=leader_address)
 
+    def ReadIndex(self, request, context):
+        """
+        Returns the index a follower must apply before serving a linearizable read.
+
+        Answered only by a leader holding its lease, so no newer leader can
+        have committed entries beyond it.
+        """
+        if raft_state == "LEADER" and lease.valid():
+            return raft_pb2.ReadIndexResponse(
+                success=True, term=current_term, read_index=len(log) - 1
+            )
+        return raft_pb2.ReadIndexResponse(success=False, term=current_term)
+
 
 # act defines how each server should act
 def act():
@@ -659,6 +801,8 @@ def act():
     elif raft_state == "LEADER":
         # send out heartbeats to all other servers
         successes = 0
+        # the lease runs from before the first heartbeat was sent
+        round_start = time.monotonic()
         for other_server in all_servers:
             try:
                 channel = grpc.insecure_channel(other_server)
@@ -687,8 +831,10 @@ def act():
             logging.info(f"[RAFT] Leader {idx} lost majority. Stepping down.")
             raft_state = "FOLLOWER"
             leader_address = None
+            lease.revoke()
         else:
             commit = len(log) - 1
+            lease.renew(round_start)
     else:
         logging.error(f"[RAFT] Invalid state: {raft_state}")
 
@@ -706,6 +852,10 @@ def serve():
     print(f"{host}:{port}")
     server.add_insecure_port(f"{host}:{port}")
     server.start()
+    streams.start(prefix="[MAIN]")
+    lobby_registry.start()
+    matchmaker.start()
+    storage.users.start()
 
     # make sure all servers are running before starting
     for other_server in all_servers:
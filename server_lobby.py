@@ -17,11 +17,20 @@ import lobby_pb2_grpc
 import lobby_pb2
 import main_pb2_grpc
 import main_pb2
-import raft_pb2_grpc
-import raft_pb2
 
 import json
 import traceback
+from stream_helpers import OutboundBuffer, StreamTracker, add_servicer_to_server, broadcast
+from leader_helpers import LeaderDiscovery, leader_hint
+from lobby_helpers import (
+    GameOutbox,
+    Heartbeat,
+    RosterService,
+    SpectatorFeed,
+    TimerWheel,
+    timeout_move,
+)
+from token_helpers import read_session_token, read_token
 
 '''
 Making sure the server is started with the correct arguments.
@@ -29,13 +38,14 @@ Making sure the server is started with the correct arguments.
 
 num_servers = 5
 
-if len(sys.argv) != 2:
-    logging.error("Usage: python server_lobby.py <lobby_index>")
+# lobbies in config only need their index, extra lobbies give their address and game type
+if len(sys.argv) not in (2, 5):
+    logging.error("Usage: python server_lobby.py <lobby_index> [<host> <port> <TEXAS|FIVE>]")
     sys.exit(1)
 
-# if it is and the argument is NOT an integer between 0 and 1, exit
-if not (0 <= int(sys.argv[1]) <= 1):
-    logging.error("Invalid argument. Please enter an integer between 0 and 1")
+# if the argument is NOT a non-negative integer, exit
+if not (sys.argv[1].isdigit()):
+    logging.error("Invalid argument. Please enter a non-negative integer")
     sys.exit(1)
 
 idx = int(sys.argv[1])
@@ -47,18 +57,32 @@ if not os.path.exists("config/config.json"):
 with open("config/config.json") as f:
     config = json.load(f)
 
-log_path = config["lobbies"]["lobby_log_paths"][idx]
-db_path = config["lobbies"]["lobby_db_paths"][idx]
+# a lobby not listed in config must say where it runs and what it plays
+in_config = idx < len(config["lobbies"]["lobby_ports"])
+if not in_config and len(sys.argv) != 5:
+    logging.error(f"Lobby {idx} is not in config. Please give its host, port and game type")
+    sys.exit(1)
+
+if in_config:
+    log_path = config["lobbies"]["lobby_log_paths"][idx]
+    db_path = config["lobbies"]["lobby_db_paths"][idx]
+else:
+    log_path = f"logs/lobby_logs/lobby{idx + 1}.log"
+    db_path = f"data/lobbies/lobby{idx + 1}.db"
 
 # get names of all servers
 all_servers = [
     f"{config['servers']['hosts'][i]}:{config['servers']['ports'][i]}" for i in range(num_servers)
 ]
 
+# finds the leader among all servers
+discovery = LeaderDiscovery(all_servers)
+
 credentials = None
 leader_address = None
 channel = None
 stub = None
+request_thread = None
 
 # setup logging
 if not os.path.exists(log_path):
@@ -72,12 +96,16 @@ logging.basicConfig(
     datefmt="%Y-%m-%d %H:%M:%S",
 )
 
-try:
-    host = config["lobbies"]["lobby_hosts"][idx]
-    port = config["lobbies"]["lobby_ports"][idx]
-except KeyError as e:
-    logging.error(f"KeyError for config: {e}")
-    exit(1)
+if len(sys.argv) == 5:
+    host = sys.argv[2]
+    port = int(sys.argv[3])
+else:
+    try:
+        host = config["lobbies"]["lobby_hosts"][idx]
+        port = config["lobbies"]["lobby_ports"][idx]
+    except KeyError as e:
+        logging.error(f"KeyError for config: {e}")
+        exit(1)
 
 """
 The following are parameters that the server
@@ -93,13 +121,51 @@ RANKS = ['2', '3', '4', '5', '6', '7', '8', '9', 'T', 'J', 'Q', 'K', 'A']
 RANK_VALUE = {r: i + 2 for i, r in enumerate(RANKS)}
 game_started = False
 game_type = None
-game_type_string = config["lobbies"]["game_types"][idx]
+game_type_string = sys.argv[4] if len(sys.argv) == 5 else config["lobbies"]["game_types"][idx]
 if game_type_string == "TEXAS":
     game_type = lobby_pb2.TEXAS
 else:
     game_type = lobby_pb2.FIVE_HAND
 game = None
 
+
+def end_spectating():
+    """
+    Tell spectators the game is over with KICK_PLAYER, carrying the last
+    public state of the table.
+    """
+    message = lobby_pb2.LobbyResponse(action=lobby_pb2.KICK_PLAYER, result=True)
+    if spectator_feed.latest is not None:
+        message.game_state.CopyFrom(spectator_feed.latest.game_state)
+    spectator_feed.end(message)
+
+
+def roster_players():
+    """
+    Players to send the roster to, copied under game_lock since the roster
+    is sent from its own timer thread while players join and leave.
+    """
+    with game_lock:
+        # roster updates are only shown in the waiting room, not during a game
+        return [] if game_started else list(players.values())
+
+
+roster = RosterService(roster_players)
+# public table state for spectators
+spectator_feed = SpectatorFeed()
+# turn clocks for every table share one timer wheel
+turn_wheel = TimerWheel()
+turn_timeout = config["lobbies"]["turn_timeout"]
+# games are played from client threads and the timer wheel
+game_lock = threading.RLock()
+# outbound buffers of every open client stream, reaped when the client disconnects
+outbound_buffer_size = config["lobbies"]["outbound_buffer_size"]
+streams = StreamTracker(idle_timeout=config["lobbies"]["stream_idle_timeout"])
+# seats at a table
+max_players = 4
+# session tokens and seat reservations from main are signed with this secret
+token_secret = config["tokens"]["secret"]
+
 class Deck:
     """Standard 52‑card deck"""
 
@@ -142,9 +208,9 @@ class Player:
         self.folded = False
         self.current_bet = 0
 
-    def send_message(self, message):
-        # send a message to client
-        self.queue.put(message)
+    def send_message(self, message, key=None):
+        # send a message to client, keyed messages are snapshots that can be collapsed
+        self.queue.send_message(message, key)
 
     def reset_for_round(self):
         self.hand = []
@@ -159,16 +225,6 @@ class Player:
             moolah=self.money,
         )
     
-    def send_game_state(self, game_state):
-        # update player on the game
-        self.queue.put(
-            lobby_pb2.LobbyResponse(
-                action=lobby_pb2.SHOW_GAME,
-                result=True,
-                game_state=game_state
-            )
-        )
-    
 
 class TexasHoldem:
     """
@@ -193,6 +249,9 @@ class TexasHoldem:
         self.check_count = 0
         self.active_players = 0
         self.river = []
+        # turn clock
+        self.turn = 0
+        self.turn_timer = None
     
     def reset_params(self):
         self.deck = Deck()
@@ -364,6 +423,7 @@ class TexasHoldem:
     def start(self):
         global game_started
         game_started = True
+        heartbeat.changed()
         self.load_players(players)
         self.reset_for_round()
         self.start_round()
@@ -381,11 +441,9 @@ class TexasHoldem:
                 card1=cards[0],
                 card2=cards[1]
             )
-        for player in self.players:
-            # give all players the current game state
-            player.send_game_state(
-                self.get_game_state()
-            )
+        # give all players the current game state
+        self.tell_all_players()
+        self.arm_turn_clock()
 
     def advance_phase(self):
         self.check_count = 0
@@ -436,11 +494,49 @@ class TexasHoldem:
 
 
     def tell_all_players(self):
-        # send game state to all players
-        for player in self.players:
-            player.send_game_state(
-                self.get_game_state()
+        # build the game state once and send the same bytes to all players
+        if not self.players:
+            return
+        game_state = self.get_game_state()
+        broadcast(
+            lobby_pb2.LobbyResponse(
+                action=lobby_pb2.SHOW_GAME,
+                result=True,
+                game_state=game_state,
+            ),
+            self.players,
+            key=lobby_pb2.SHOW_GAME,
+        )
+        # spectators never see hole cards
+        game_state.ClearField("hand_cards")
+        spectator_feed.publish(
+            lobby_pb2.LobbyResponse(
+                action=lobby_pb2.SHOW_GAME,
+                result=True,
+                game_state=game_state,
             )
+        )
+
+    def arm_turn_clock(self):
+        # restart the clock for the player whose turn it is
+        turn_wheel.cancel(self.turn_timer)
+        self.turn_timer = None
+        self.turn += 1
+        if not self.players:
+            return
+        turn = self.turn
+        self.turn_timer = turn_wheel.schedule(
+            turn_timeout, lambda: self.expire_turn(turn)
+        )
+
+    def expire_turn(self, turn):
+        # the current player ran out of time: check if it is free, otherwise fold
+        with game_lock:
+            if turn != self.turn or not self.players:
+                return
+            player = self.players[self.player_pointer]
+            logging.info(f"[MAIN] {player.username} ran out of time.")
+            self.play_next(timeout_move(player, self.min_bet))
     
     def play_next(self, play):
         # play is conducted by the current player
@@ -488,33 +584,42 @@ class TexasHoldem:
             self.advance_phase()
         
         self.tell_all_players()
+        self.arm_turn_clock()
 
     def end(self):
         # game has ended, update main and kick all players
-        global game_started, outgoing_queue, game_type
+        global game_started, outbox, game_type
         game_started = False
+        heartbeat.changed()
+        turn_wheel.cancel(self.turn_timer)
+        self.turn_timer = None
         # close connections to all players
-        for player in self.players:
-            player.send_message(
-                lobby_pb2.LobbyResponse(
-                    action=lobby_pb2.KICK_PLAYER,
-                    result=True,
-                    )
-                )
-            outgoing_queue.put(
-                main_pb2.MainRequest(
-                    action=main_pb2.SAVE_GAME,
-                    game_history=main_pb2.GameHistoryEntry(
+        broadcast(
+            lobby_pb2.LobbyResponse(
+                action=lobby_pb2.KICK_PLAYER,
+                result=True,
+            ),
+            self.players,
+        )
+        # store all results locally, the outbox sends them to main as one entry
+        outbox.add(
+            main_pb2.MainRequest(
+                action=main_pb2.SAVE_GAME_BATCH,
+                game_results=[
+                    main_pb2.GameHistoryEntry(
                         game_type=game_type,
                         player=player.username,
                         money_won = player.money - 100,
                     )
-                )
+                    for player in self.players
+                ],
             )
+        )
 
         # clear players
         global players
         players = {}
+        end_spectating()
         
         self.reset_params()
 
@@ -543,6 +648,9 @@ class FiveCardDraw:
         self.active_players = 0
         self.river = []
         self.can_exchange = []
+        # turn clock
+        self.turn = 0
+        self.turn_timer = None
     
     def reset_params(self):
         self.deck = Deck()
@@ -705,6 +813,7 @@ class FiveCardDraw:
     def start(self):
         global game_started
         game_started = True
+        heartbeat.changed()
         self.load_players(players)
         self.reset_for_round()
         self.start_round()
@@ -725,11 +834,9 @@ class FiveCardDraw:
                 card4=cards[3],
                 card5=cards[4]
             )
-        for player in self.players:
-            # give all players the current game state
-            player.send_game_state(
-                self.get_game_state()
-            )
+        # give all players the current game state
+        self.tell_all_players()
+        self.arm_turn_clock()
 
     def advance_phase(self):
         self.check_count = 0
@@ -774,11 +881,52 @@ class FiveCardDraw:
 
 
     def tell_all_players(self):
-        # send game state to all players
-        for player in self.players:
-            player.send_game_state(
-                self.get_game_state()
+        # build the game state once and send the same bytes to all players
+        if not self.players:
+            return
+        game_state = self.get_game_state()
+        broadcast(
+            lobby_pb2.LobbyResponse(
+                action=lobby_pb2.SHOW_GAME,
+                result=True,
+                game_state=game_state,
+            ),
+            self.players,
+            key=lobby_pb2.SHOW_GAME,
+        )
+        # spectators never see hole cards
+        game_state.ClearField("hand_cards")
+        spectator_feed.publish(
+            lobby_pb2.LobbyResponse(
+                action=lobby_pb2.SHOW_GAME,
+                result=True,
+                game_state=game_state,
             )
+        )
+
+    def arm_turn_clock(self):
+        # restart the clock for the player whose turn it is
+        turn_wheel.cancel(self.turn_timer)
+        self.turn_timer = None
+        self.turn += 1
+        if not self.players:
+            return
+        turn = self.turn
+        self.turn_timer = turn_wheel.schedule(
+            turn_timeout, lambda: self.expire_turn(turn)
+        )
+
+    def expire_turn(self, turn):
+        # the current player ran out of time: keep their cards in an exchange,
+        # otherwise check if it is free and fold if not
+        with game_lock:
+            if turn != self.turn or not self.players:
+                return
+            player = self.players[self.player_pointer]
+            logging.info(f"[MAIN] {player.username} ran out of time.")
+            # an unfinished exchange keeps every card, so the exchange turn ends
+            exchanging = self.phase == 1 and self.can_exchange[self.player_pointer]
+            self.play_next(timeout_move(player, self.min_bet, exchanging))
     
     def play_next(self, play):
         # play is conducted by the current player
@@ -837,31 +985,40 @@ class FiveCardDraw:
             self.advance_phase()
         
         self.tell_all_players()
+        self.arm_turn_clock()
 
     def end(self):
-        global game_started, outgoing_queue, game_type
+        global game_started, outbox, game_type
         game_started = False
+        heartbeat.changed()
+        turn_wheel.cancel(self.turn_timer)
+        self.turn_timer = None
         # close connections to all players
-        for player in self.players:
-            player.send_message(
-                lobby_pb2.LobbyResponse(
-                    action=lobby_pb2.KICK_PLAYER,
-                    result=True,
-                    )
-                )
-            outgoing_queue.put(
-                main_pb2.MainRequest(
-                    action=main_pb2.SAVE_GAME,
-                    game_history=main_pb2.GameHistoryEntry(
+        broadcast(
+            lobby_pb2.LobbyResponse(
+                action=lobby_pb2.KICK_PLAYER,
+                result=True,
+            ),
+            self.players,
+        )
+        # store all results locally, the outbox sends them to main as one entry
+        outbox.add(
+            main_pb2.MainRequest(
+                action=main_pb2.SAVE_GAME_BATCH,
+                game_results=[
+                    main_pb2.GameHistoryEntry(
                         game_type=game_type,
                         player=player.username,
                         money_won = player.money - 100,
                     )
-                )
+                    for player in self.players
+                ],
             )
+        )
 
         global players
         players = {}
+        end_spectating()
         '''
         send game result to main server
         '''
@@ -888,11 +1045,12 @@ class LobbyServiceServicer(lobby_pb2_grpc.LobbyServiceServicer):
         request_iterator : iterator
             iterator of requests from client
         context : context
-            All tutorials have this, but it's not used here. Kept for compatibility.
+            used to close the stream as soon as the client disconnects
         """
         username = None
-        # queue for sending responses to client
-        client_queue = queue.Queue()
+        # bounded buffer for sending responses to client
+        client_queue = OutboundBuffer(maxsize=outbound_buffer_size)
+        streams.open(client_queue, context)
 
         # handle incoming requests
         def handle_requests():
@@ -900,34 +1058,35 @@ class LobbyServiceServicer(lobby_pb2_grpc.LobbyServiceServicer):
             nonlocal username
             try:
                 for req in request_iterator:
+                    streams.touch(client_queue)
                     # print size of req in bytes
                     logging.info(f"[MAIN] Size of request: {sys.getsizeof(req)} bytes")
                     # log the request
                     logging.info(f"[MAIN] Received request: {req}")
 
                     if req.action == lobby_pb2.JOIN_LOBBY:
+                        if not can_join(req):
+                            logging.info(f"[MAIN] {req.username} turned away.")
+                            client_queue.put(
+                                lobby_pb2.LobbyResponse(
+                                    action=lobby_pb2.JOIN_LOBBY, result=False
+                                )
+                            )
+                            continue
                         logging.info(f"[MAIN] {req.username} connected.")
+                        client_queue.name = req.username
                         new_player = Player(req.username, client_queue)
-                        if (req.username != "") and (req.username not in players):
-                            players[new_player.username] = new_player
-                            username = req.username
+                        with game_lock:
+                            if (req.username != "") and (req.username not in players):
+                                players[new_player.username] = new_player
+                                username = req.username
                         client_queue.put(
                             lobby_pb2.LobbyResponse(
                                 action=lobby_pb2.JOIN_LOBBY, result=True
                             )
                         )
-                        for player in players.values():
-                            other_users = [
-                                p.get_user_information() for p in players.values() if p.username != player.username
-                            ]
-
-                            player.send_message(
-                                lobby_pb2.LobbyResponse(
-                                    action=lobby_pb2.SHOW_LOBBY,
-                                    result=True,
-                                    user_info=other_users,
-                                )
-                            )
+                        roster.mark_dirty()
+                        heartbeat.changed()
                     elif req.action == lobby_pb2.SEND_VOTE:
                         if username in players:
                             player = players[username]
@@ -941,28 +1100,22 @@ class LobbyServiceServicer(lobby_pb2_grpc.LobbyServiceServicer):
                             )
 
                             # update all players
-                            for player in players.values():
-                                other_users = [
-                                    p.get_user_information() for p in players.values() if p.username != player.username
-                                ]
-                                player.send_message(
-                                    lobby_pb2.LobbyResponse(
-                                        action=lobby_pb2.SHOW_LOBBY,
-                                        result=True,
-                                        user_info=other_users,
-                                    )
-                                )
+                            roster.mark_dirty()
                             if all(p.voted_yes for p in players.values()) and len(players) >= 2:
+                                # send the final roster before the game screen
+                                roster.flush()
                                 # start the game
                                 global game_type
-                                if game_type == lobby_pb2.TEXAS:
-                                    game = TexasHoldem()
-                                    game.start()
-                                else:
-                                    game = FiveCardDraw()
-                                    game.start()
+                                with game_lock:
+                                    if game_type == lobby_pb2.TEXAS:
+                                        game = TexasHoldem()
+                                        game.start()
+                                    else:
+                                        game = FiveCardDraw()
+                                        game.start()
                     elif req.action == lobby_pb2.PLAY_MOVE:
-                        game.play_next(req)
+                        with game_lock:
+                            game.play_next(req)
 
 
                     else:
@@ -974,39 +1127,84 @@ class LobbyServiceServicer(lobby_pb2_grpc.LobbyServiceServicer):
                     f"[MAIN] Error handling requests at line {line_number}: {traceback.format_exc()}"
                 )
             finally:
-                if username in players:
-                    del players[username]
+                with game_lock:
+                    left = players.pop(username, None) is not None
+                if left:
                     # update all players
-                    for player in players.values():
-                        other_users = [
-                            p.get_user_information() for p in players.values() if p.username != player.username
-                        ]
-                        
-                        player.send_message(
-                            lobby_pb2.LobbyResponse(
-                                action=lobby_pb2.SHOW_LOBBY,
-                                result=True,
-                                user_info=other_users,
-                            )
-                        )
+                    roster.mark_dirty()
+                    heartbeat.changed()
                     logging.info(f"[MAIN] {username} disconnected.")
+                # wake the response loop so its worker is released
+                streams.requests_done(client_queue)
 
         # run request handling in a separate thread.
         threading.Thread(target=handle_requests, daemon=True).start()
 
         # continuously yield responses from the client's queue.
-        while True:
-            try:
+        try:
+            while True:
                 response = client_queue.get()
+                if response is None:
+                    break
+                # receiving counts as activity too, not only sending requests
+                streams.touch(client_queue)
                 yield response
-            except Exception as e:
-                break
+        finally:
+            streams.close(client_queue)
+
+        # a retryable status, so the client reconnects instead of taking the end as final
+        if client_queue.overflowed:
+            logging.error(f"[MAIN] {username} cannot keep up, disconnecting.")
+            context.abort(grpc.StatusCode.UNAVAILABLE, "Too many unsent messages.")
+        if client_queue.reaped:
+            logging.info(f"[MAIN] {username} was idle, disconnecting.")
+            context.abort(grpc.StatusCode.UNAVAILABLE, "Stream was idle.")
     
+    def Spectate(self, request, context):
+        """
+        Stream public table state to a spectator.
+
+        Parameters:
+        ----------
+        request : lobby_pb2.SpectateRequest
+            request from the spectator
+        context : context
+            used to stop streaming once the spectator disconnects
+        """
+        mailbox = spectator_feed.subscribe()
+        context.add_callback(mailbox.close)
+        logging.info(
+            f"[MAIN] Spectator {request.username} connected ({len(spectator_feed)} watching)."
+        )
+        try:
+            while True:
+                update = mailbox.get()
+                if update is None:
+                    break
+                yield update
+        finally:
+            spectator_feed.unsubscribe(mailbox)
+            logging.info(f"[MAIN] Spectator {request.username} disconnected.")
+
     def GetLobbyInfo(self, request, context):
+        gauge = streams.gauge()
         return lobby_pb2.ServerResponse(
             active = game_started,
             num_players = len(players),
             game_type = game_type,
+            connections = [
+                lobby_pb2.ConnectionStats(
+                    username=stats["name"],
+                    depth=stats["depth"],
+                    max_depth=stats["max_depth"],
+                    sent=stats["sent"],
+                    collapsed=stats["collapsed"],
+                    overflowed=stats["overflowed"],
+                )
+                for stats in (buffer.stats() for buffer in streams.buffers())
+            ],
+            open_streams = gauge["open"],
+            leaked_streams = gauge["leaked"],
         )
 
 def serve():
@@ -1014,10 +1212,15 @@ def serve():
     Main loop for lobby server. Runs server on separate thread.
     """
     server = grpc.server(futures.ThreadPoolExecutor(max_workers=10))
-    lobby_pb2_grpc.add_LobbyServiceServicer_to_server(LobbyServiceServicer(), server)
+    # responses may be pre-serialized bytes shared by every subscriber
+    add_servicer_to_server(
+        lobby_pb2_grpc.add_LobbyServiceServicer_to_server, LobbyServiceServicer(), server
+    )
     print(f"{host}:{port}")
     server.add_insecure_port(f"{host}:{port}")
     server.start()
+    turn_wheel.start()
+    streams.start(prefix="[MAIN]")
 
     logging.info(f"[SETUP] Lobby server started on port {port}")
     # wait for random time from 1 to 5 seconds before starting, to allow one server to become leader
@@ -1037,47 +1240,43 @@ def handle_responses(responses_iter):
             action = resp.action
             if action == main_pb2.CHECK_USERNAME:
                 pass
+            elif action == main_pb2.SAVE_GAME_BATCH:
+                # main saved the game, no need to resend it
+                outbox.ack(resp.request_id)
     except grpc.RpcError as e:
         logging.error(f"Error receiving response: {e}")
-        check_for_leader()
-
-def check_for_leader(retries=6):
+        # a follower tells us where the leader is, the outbox resends what it rejected
+        hint, _ = leader_hint(e)
+        check_for_leader(hint, reconnect=True)
+    else:
+        # main ended the stream cleanly, but the connection is gone all the same
+        logging.error("Main closed the stream, reconnecting...")
+        check_for_leader(reconnect=True)
+
+def check_for_leader(hint=None, reconnect=False):
     '''
     Check for the leader of the servers.
-    Retries 6 times by default.
+    Asks all replicas in parallel, retrying with backoff for up to 30 seconds.
+    A hint from a NOT_LEADER rejection is tried first. With reconnect, a new
+    stream is opened even if the leader did not change.
     '''
-    global channel, stub, leader_address
-    if retries <= 0:
-        logging.error("Could not find leader.")
-        sys.exit(1)
+    global channel, stub, leader_address, request_thread
     logging.info("Checking for leader...")
-    time.sleep(5)
     # we want to make sure that we are connected to the leader
     # if we are not connected OR we had errors in connecting to the leader
     # we need to ask replicas for new leader
-    no_leader = True
     previous_leader = leader_address
-    for server in all_servers:
-        try:
-            channel = grpc.insecure_channel(server)
-            stub = raft_pb2_grpc.RaftServiceStub(channel)
-            response = stub.GetLeader(raft_pb2.GetLeaderRequest(useless=True))
-            if response.leader_address:
-                logging.info(f"Leader found: {response.leader_address}")
-                logging.info(f"Info came from: {server}")
-                leader_address = response.leader_address
-                no_leader = False
-                break
-        except grpc.RpcError as e:
-            logging.error(f"Error connecting to {server}: {e}")
-
-    if no_leader:
-        check_for_leader(retries - 1)
-        return
-    if leader_address != previous_leader:
-        # new leader
+    leader = discovery.discover(hint=hint)
+    if leader is None:
+        logging.error("Could not find leader.")
+        sys.exit(1)
+    leader_address = leader
+    if reconnect or leader_address != previous_leader:
+        # new leader, or the old stream ended
         try:
-            request_thread.join()
+            # the response thread itself reconnects when its stream ends
+            if request_thread is not threading.current_thread():
+                request_thread.join()
             channel.close()
         except:
             pass
@@ -1092,8 +1291,52 @@ def check_for_leader(retries=6):
         # this NEEDS to happen twice due to multiple threads
         send_connect_request()
         send_connect_request()
+        # resend unacknowledged games to the new leader
+        outbox.retry_all()
+        # register with the new leader
+        heartbeat.changed()
 
 outgoing_queue = queue.Queue()
+# game results wait here until main acknowledges them
+outbox = GameOutbox(db_path, outgoing_queue.put)
+def can_join(req):
+    """
+    A signed in player may join with a seat main reserved for them in this
+    lobby, as long as no game is running and the table is not full.
+    Both tokens are checked here, without asking main.
+    """
+    session = read_session_token(token_secret, req.session_token)
+    if session is None or session[0] != req.username:
+        return False
+    if read_token(token_secret, req.seat_token) != ["seat", idx, req.username]:
+        return False
+    if req.username in players:
+        # joining again on the same seat
+        return True
+    return not game_started and len(players) < max_players
+
+def lobby_status():
+    """
+    Status pushed to main so it can send players to this lobby.
+    """
+    return main_pb2.LobbyStatus(
+        lobby_id=idx,
+        address=f"{host}:{port}",
+        game_type=game_type,
+        seats_free=max(0, max_players - len(players)),
+        active=game_started,
+        players=list(players),
+    )
+
+def send_heartbeat(status):
+    if stub is None:
+        raise ConnectionError("No leader yet.")
+    stub.LobbyHeartbeat(status, timeout=1)
+
+heartbeat = Heartbeat(
+    lobby_status, send_heartbeat, interval=config["lobbies"]["heartbeat_interval"]
+)
+
 def request_generator():
     """Yield MainRequests from the outgoing_queue."""
     while True:
@@ -1114,5 +1357,7 @@ def send_connect_request():
 if __name__ == "__main__":
     server_thread = threading.Thread(target=serve, daemon=True)
     server_thread.start()
+    outbox.start()
     check_for_leader()
+    heartbeat.start()
     server_thread.join()
@@ -1,6 +1,8 @@
 import os
 import sqlite3
 
+from schema_helpers import migrate
+
 def reset_database(files) -> None:
     """
     Reset the database by deleting the file if it exists.
@@ -15,9 +17,11 @@ def reset_database(files) -> None:
     os.makedirs("data/r5", exist_ok=True)
 
     # delete everything in the data directory, including subdirectories
+    # a leftover WAL would be replayed into the next database with the same name
     for file in files:
-        if os.path.exists(file):
-            os.remove(file)
+        for suffix in ["", "-wal", "-shm"]:
+            if os.path.exists(file + suffix):
+                os.remove(file + suffix)
 
 
 def structure_tables(data_path="data/messenger.db") -> None:
@@ -25,36 +29,11 @@ def structure_tables(data_path="data/messenger.db") -> None:
     Create the tables for the database.
     """
 
-    with sqlite3.connect(data_path) as conn:
-        cursor = conn.cursor()
-
-        # set up users table in messenger.db file
-        cursor.execute(
-            """
-            CREATE TABLE users (
-                user_id INTEGER PRIMARY KEY,
-                username TEXT NOT NULL,
-                passhash TEXT NOT NULL,
-                moolah INTEGER DEFAULT 500
-            );
-            """
-        )
-
-        # set up games table in messenger.db file
-        cursor.execute(
-            """
-            CREATE TABLE game_history (
-                game_id INTEGER PRIMARY KEY,
-                player_id INTEGER NOT NULL,
-                money_won INTEGER DEFAULT 0,
-                game_type TEXT NOT NULL,
-                game_date DATETIME DEFAULT CURRENT_TIMESTAMP
-            );
-        """
-        )
-        conn.commit()
-        print(f"Created users table.")
-        print(f"Created game table.")
+    # tables and indexes are created by the versioned migrations
+    migrate(data_path)
+    print(f"Created users table.")
+    print(f"Created game table.")
+    print(f"Created saved games table.")
 
 
 def print_db(data_path="data/messenger.db") -> None:
@@ -0,0 +1,655 @@
+import base64
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent import futures
+
+import main_pb2
+from cache_helpers import BloomFilter, UserCache
+from leaderboard_helpers import Leaderboard
+
+# every query the servers run, kept constant so each connection's statement
+# cache compiles them once and reuses them afterwards
+USERNAME_EXISTS = "SELECT 1 FROM users WHERE username=?"
+GET_USER = "SELECT user_id, passhash, moolah FROM users WHERE username=?"
+GET_USER_BY_ID = "SELECT username, passhash, moolah FROM users WHERE user_id=?"
+# new users start at 0, their starting moolah is posted to the ledger
+INSERT_USER = "INSERT INTO users (username, passhash, moolah) VALUES (?, ?, 0)"
+GET_PASSHASH = "SELECT passhash FROM users WHERE username=?"
+DELETE_USER = "DELETE FROM users WHERE username=?"
+DELETE_STATS = "DELETE FROM player_stats WHERE player_id=?"
+GET_MOOLAH = "SELECT moolah FROM users WHERE user_id=?"
+GET_USER_ID = "SELECT user_id FROM users WHERE username=?"
+INSERT_GAME = "INSERT INTO game_history (player_id, game_type, money_won) VALUES (?, ?, ?)"
+ADD_MOOLAH = "UPDATE users SET moolah=moolah+? WHERE user_id=?"
+# ignored if the transaction was already posted for this user
+POST_LEDGER = "INSERT OR IGNORE INTO ledger (txn_id, user_id, amount, reason) VALUES (?, ?, ?, ?)"
+LEDGER_BALANCE = "SELECT COALESCE(SUM(amount), 0) FROM ledger WHERE user_id=?"
+MARK_SAVED = "INSERT OR IGNORE INTO saved_games (request_id) VALUES (?)"
+# count a game into the player's stats for its game type
+ADD_STATS = (
+    "INSERT INTO player_stats (player_id, game_type, games, wins, net_winnings, biggest_win) "
+    "VALUES (?, ?, 1, ?, ?, MAX(?, 0)) ON CONFLICT (player_id, game_type) DO UPDATE SET "
+    "games=games+1, wins=wins+excluded.wins, net_winnings=net_winnings+excluded.net_winnings, "
+    "biggest_win=MAX(biggest_win, excluded.biggest_win)"
+)
+PLAYER_STATS = (
+    "SELECT game_type, games, wins, net_winnings, biggest_win FROM player_stats "
+    "WHERE player_id=?"
+)
+ALL_MOOLAH = "SELECT username, moolah FROM users"
+ALL_USERNAMES = "SELECT username FROM users"
+ALL_NET_WINNINGS = (
+    "SELECT username, game_type, net_winnings FROM player_stats "
+    "JOIN users ON users.user_id=player_stats.player_id"
+)
+# one page of a player's games older than a game_id, newest first
+HISTORY_PAGE = (
+    "SELECT game_id, game_type, money_won, game_date FROM game_history "
+    "WHERE player_id=? AND game_id<? ORDER BY game_id DESC LIMIT ?"
+)
+
+# game types are stored by name
+GAME_TYPE_NAMES = {main_pb2.TEXAS: "TEXAS HOLD EM", main_pb2.FIVE_HAND: "5 CARD"}
+GAME_TYPE_IDS = {name: game_type for game_type, name in GAME_TYPE_NAMES.items()}
+
+# games per VIEW_HISTORY page when the client does not ask for a size, and the most allowed
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+# game_id bound of the first page, above every game
+FIRST_PAGE = 2**63 - 1
+
+# moolah of a new account, and the most LOAD_MONEY adds at once
+STARTING_MOOLAH = 500
+MAX_LOAD_MONEY = 10000
+
+
+def make_cursor(game_id):
+    """
+    Opaque cursor for the page of games older than game_id.
+    """
+    return base64.urlsafe_b64encode(str(game_id).encode()).decode()
+
+
+def read_cursor(cursor):
+    """
+    The game_id a cursor continues from, FIRST_PAGE for an empty cursor, or
+    None if the cursor is malformed.
+    """
+    if not cursor:
+        return FIRST_PAGE
+    try:
+        game_id = int(base64.urlsafe_b64decode(cursor.encode()))
+    except ValueError:
+        return None
+    # game ids fit in a signed 64-bit SQLite INTEGER
+    return game_id if 0 < game_id <= FIRST_PAGE else None
+
+
+# applied to every connection
+# WAL lets readers (VIEW_HISTORY, LOGIN) run while a commit is written, and
+# NORMAL only syncs at checkpoints, which is safe in WAL mode; a commit lost
+# to power failure is restored from the Raft log of the other replicas
+PRAGMAS = [
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    # in KiB when negative, 16 MiB of page cache per connection
+    "PRAGMA cache_size=-16384",
+    # read pages straight from the OS page cache, up to 256 MiB of the file
+    "PRAGMA mmap_size=268435456",
+]
+
+
+# write functions run inside Storage.write's transaction, and record in
+# changes what to apply to the leaderboard and user cache once it commits
+
+
+def post(conn, changes, txn_id, user_id, username, amount, reason):
+    """
+    Append a ledger entry and add its amount to the user's moolah, in the
+    database rather than read-modify-write. Returns False without changing
+    anything if the transaction was already posted for this user.
+    """
+    if conn.execute(POST_LEDGER, (txn_id, user_id, amount, reason)).rowcount != 1:
+        return False
+    conn.execute(ADD_MOOLAH, (amount, user_id))
+    changes.append(("moolah", username, conn.execute(GET_MOOLAH, (user_id,)).fetchone()[0]))
+    return True
+
+
+def register_user(conn, changes, username, passhash):
+    if conn.execute(USERNAME_EXISTS, (username,)).fetchone() is not None:
+        return None
+    user_id = conn.execute(INSERT_USER, (username, passhash)).lastrowid
+    changes.append(("user", username, user_id, passhash, 0))
+    post(conn, changes, uuid.uuid4().hex, user_id, username, STARTING_MOOLAH, "REGISTER")
+    return user_id
+
+
+def delete_user(conn, changes, username, passhash):
+    row = conn.execute(GET_PASSHASH, (username,)).fetchone()
+    if row is None or row[0] != passhash:
+        return False
+    player_id = conn.execute(GET_USER_ID, (username,)).fetchone()[0]
+    # entries are never deleted, so close the balance before the user goes
+    moolah = conn.execute(GET_MOOLAH, (player_id,)).fetchone()[0]
+    post(conn, changes, uuid.uuid4().hex, player_id, username, -moolah, "DELETE_ACCOUNT")
+    conn.execute(DELETE_USER, (username,))
+    conn.execute(DELETE_STATS, (player_id,))
+    changes.append(("remove", username))
+    return True
+
+
+def save_results(conn, changes, game_results, request_id):
+    # batches saved before the ledger existed have no entries to catch a retry
+    if request_id and conn.execute(MARK_SAVED, (request_id,)).rowcount != 1:
+        return False
+    # the request id is the transaction id, results without one cannot be retried safely
+    txn_id = request_id or uuid.uuid4().hex
+    for i, result in enumerate(game_results):
+        row = conn.execute(GET_USER_ID, (result.player,)).fetchone()
+        if row is None:
+            # account was deleted during the game
+            logging.error(f"[MAIN] Cannot save game for unknown player {result.player}")
+            continue
+        player_id = row[0]
+
+        # numbered, since a batch may hold several results of one player
+        if not post(conn, changes, f"{txn_id}:{i}", player_id, result.player, result.money_won, "GAME"):
+            # this player's result is already saved
+            continue
+        game_type = GAME_TYPE_NAMES.get(result.game_type, "5 CARD")
+        conn.execute(INSERT_GAME, (player_id, game_type, result.money_won))
+        # kept in the same transaction, so stats always match game_history
+        conn.execute(
+            ADD_STATS,
+            (player_id, game_type, int(result.money_won > 0), result.money_won, result.money_won),
+        )
+
+        total = 0
+        for stats_game_type, _, _, net_winnings, _ in conn.execute(PLAYER_STATS, (player_id,)):
+            total += net_winnings
+            if stats_game_type == game_type:
+                changes.append(
+                    ("net_winnings", result.player, GAME_TYPE_IDS[game_type], net_winnings)
+                )
+        changes.append(("net_winnings", result.player, main_pb2.NONE, total))
+    return True
+
+
+def load_user_money(conn, changes, username, amount, txn_id):
+    # checked on every replica, not only by the leader
+    if not 0 < amount <= MAX_LOAD_MONEY:
+        return None
+    row = conn.execute(GET_USER_ID, (username,)).fetchone()
+    if row is None:
+        return None
+    post(conn, changes, txn_id, row[0], username, amount, "LOAD_MONEY")
+    return conn.execute(GET_MOOLAH, (row[0],)).fetchone()[0]
+
+
+class Storage:
+    """
+    Typed access to a replica's poker.db.
+
+    Each thread keeps one long-lived connection instead of connecting for
+    every request, and the fixed SQL above is compiled once per connection
+    by its statement cache. If the database file is replaced (e.g. reset by
+    setup.py), threads reconnect to the new file.
+
+    Writes are group committed: they are handed to a single writer thread,
+    which runs every write that queued up while it was committing the last
+    group (plus any arriving within commit_window seconds) in one
+    transaction, each inside its own savepoint, and commits once. Callers
+    still only return after their write is committed.
+
+    Balances only change through post(), which appends to the ledger, so
+    retried and replayed transactions are applied once.
+
+    Every committed change is applied to the leaderboard and written through
+    to the user cache, in commit order, so both match the database without
+    reading it.
+    """
+
+    def __init__(self, db_path, wal=True, commit_window=0, max_batch=128, user_cache_size=10000):
+        """
+        Parameters:
+        - db_path:
+            path to the SQLite database
+        - wal:
+            open the database in WAL mode with the tuned PRAGMAS
+        - commit_window:
+            seconds the writer waits for more writes before committing, only
+            worth raising when commits are slow (e.g. synchronous=FULL),
+            None commits every write on its own in the calling thread
+        - max_batch:
+            most writes in one commit
+        - user_cache_size:
+            most users kept in the user cache
+        """
+        self.db_path = db_path
+        self.wal = wal
+        self.commit_window = commit_window
+        self.max_batch = max_batch
+        self.local = threading.local()
+        self.stale = []
+        self.writes = queue.Queue()
+        self.writer = None
+        self.writer_lock = threading.Lock()
+        # transactions committed, fewer than the writes when they are grouped
+        self.commits = 0
+        self.leaderboard = Leaderboard()
+        self.users = UserCache(user_cache_size)
+        # every registered username, built by load()
+        self.usernames = None
+
+    def file_id(self):
+        try:
+            stat = os.stat(self.db_path)
+            return stat.st_dev, stat.st_ino
+        except FileNotFoundError:
+            return None
+
+    def connection(self):
+        """
+        This thread's connection, opened on first use.
+        """
+        conn = getattr(self.local, "conn", None)
+        if conn is not None and self.local.file_id == self.file_id():
+            return conn
+        if conn is not None:
+            # the file was replaced, this connection still points at the old one
+            # it is kept open, since closing it would checkpoint the old WAL and
+            # delete the -wal file by name, which may now be the new file's
+            self.stale.append(conn)
+        # transactions are opened explicitly by write()
+        conn = sqlite3.connect(self.db_path, isolation_level=None)
+        if self.wal:
+            for pragma in PRAGMAS:
+                conn.execute(pragma)
+        replaced = getattr(self.local, "file_id", None) not in (None, self.file_id())
+        self.local.conn = conn
+        self.local.file_id = self.file_id()
+        if replaced:
+            # nothing cached from the old file holds for the new one
+            self.users.clear()
+            self.load()
+        return conn
+
+    def close(self):
+        """
+        Close this thread's connection.
+        """
+        conn = getattr(self.local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self.local.conn = None
+
+    def write(self, apply, *args):
+        """
+        Run apply(conn, changes, *args) in a transaction and return its result once committed.
+        An exception raised by apply rolls back only this write and is raised here.
+        """
+        if self.commit_window is None:
+            conn = self.connection()
+            changes = []
+            # held until the leaderboard is updated, so changes are applied in commit order
+            with self.writer_lock:
+                conn.execute("BEGIN IMMEDIATE")
+                try:
+                    result = apply(conn, changes, *args)
+                except BaseException:
+                    conn.execute("ROLLBACK")
+                    raise
+                conn.execute("COMMIT")
+                self.commits += 1
+                self.apply_changes(changes)
+            return result
+
+        with self.writer_lock:
+            if self.writer is None:
+                self.writer = threading.Thread(target=self.run_writer, daemon=True)
+                self.writer.start()
+        write = futures.Future()
+        self.writes.put((write, apply, args))
+        return write.result()
+
+    def run_writer(self):
+        """
+        Commit queued writes in groups, forever.
+        """
+        while True:
+            batch = [self.writes.get()]
+            deadline = time.monotonic() + self.commit_window
+            while len(batch) < self.max_batch:
+                try:
+                    batch.append(self.writes.get(timeout=max(0, deadline - time.monotonic())))
+                except queue.Empty:
+                    break
+            self.commit_batch(batch)
+
+    def commit_batch(self, batch):
+        """
+        Apply a group of writes in one transaction and resolve their futures.
+        """
+        results = []
+        committed_changes = []
+        try:
+            conn = self.connection()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                for write, apply, args in batch:
+                    # a failed write is undone without losing the rest of the group
+                    conn.execute("SAVEPOINT write")
+                    changes = []
+                    try:
+                        results.append((write, apply(conn, changes, *args), None))
+                        conn.execute("RELEASE write")
+                        committed_changes.extend(changes)
+                    except Exception as e:
+                        conn.execute("ROLLBACK TO write")
+                        conn.execute("RELEASE write")
+                        results.append((write, None, e))
+                conn.execute("COMMIT")
+                self.commits += 1
+            except BaseException:
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+                raise
+        except Exception as e:
+            logging.error(f"[MAIN] Group commit of {len(batch)} writes failed: {e}")
+            for write, _, _ in batch:
+                write.set_exception(e)
+            return
+        self.apply_changes(committed_changes)
+        for write, result, error in results:
+            if error is None:
+                write.set_result(result)
+            else:
+                write.set_exception(error)
+
+    def apply_changes(self, changes):
+        """
+        Bring the in-memory state up to date with a commit.
+        """
+        self.leaderboard.apply(changes)
+        self.users.apply(changes)
+        if self.usernames is not None:
+            for change in changes:
+                if change[0] == "user":
+                    self.usernames.add(change[1])
+            if self.usernames.count > self.usernames.capacity:
+                # full, rebuild it with room to grow before false positives pile up
+                self.load_usernames()
+
+    def load(self):
+        """
+        Rebuild the leaderboard and username filter from the database, when the replica starts.
+        """
+        self.load_usernames()
+        self.load_leaderboard()
+
+    def load_usernames(self):
+        usernames = [username for username, in self.connection().execute(ALL_USERNAMES)]
+        self.usernames = BloomFilter(max(1000, 2 * len(usernames)), items=usernames)
+
+    def load_leaderboard(self):
+        conn = self.connection()
+        moolah = conn.execute(ALL_MOOLAH).fetchall()
+        net_winnings = [
+            (username, GAME_TYPE_IDS[game_type], won)
+            for username, game_type, won in conn.execute(ALL_NET_WINNINGS)
+        ]
+        self.leaderboard.load(moolah, net_winnings)
+
+    def user(self, username):
+        """
+        Returns (user_id, passhash, moolah) of a user, or None if they do not exist.
+        """
+        user = self.users.get(username)
+        if user is not None:
+            return user
+        version = self.users.version
+        user = self.connection().execute(GET_USER, (username,)).fetchone()
+        if user is not None:
+            self.users.fill(username, *user, version)
+        return user
+
+    def user_by_id(self, user_id):
+        """
+        Returns (username, passhash, moolah) of a user, or None if they do not exist.
+        """
+        user = self.users.get_by_id(user_id)
+        if user is not None:
+            return user
+        version = self.users.version
+        user = self.connection().execute(GET_USER_BY_ID, (user_id,)).fetchone()
+        if user is not None:
+            username, passhash, moolah = user
+            self.users.fill(username, user_id, passhash, moolah, version)
+        return user
+
+    def check_session(self, session):
+        """
+        The (username, user_id) of a session token if that account still
+        exists, or None. Tokens of deleted accounts stop working here.
+        """
+        if session is None:
+            return None
+        user = self.user_by_id(session[1])
+        if user is None or user[0] != session[0]:
+            return None
+        return session
+
+    def username_exists(self, username):
+        # a username the filter has never seen is certainly free, without reading the database
+        if self.usernames is not None and username not in self.usernames:
+            return False
+        return self.user(username) is not None
+
+    def check_login(self, username, passhash):
+        """
+        Returns (user_id, moolah) if the password hash matches, otherwise None.
+        """
+        user = self.user(username)
+        if user is None or user[1] != passhash:
+            return None
+        return user[0], user[2]
+
+    def register(self, username, passhash):
+        """
+        Add a user. Returns their user_id, or None if the username is taken.
+        """
+        return self.write(register_user, username, passhash)
+
+    def delete_account(self, username, passhash):
+        """
+        Delete a user if the password hash matches. Returns True if they were deleted.
+        """
+        return self.write(delete_user, username, passhash)
+
+    def load_money(self, username, amount, txn_id):
+        """
+        Add moolah to a user's account through the ledger.
+
+        Parameters:
+        - amount:
+            moolah to add, more than 0 and at most MAX_LOAD_MONEY
+        - txn_id:
+            transaction id, a load already posted under it is not added again
+
+        Returns the user's moolah afterwards, or None if they do not exist or
+        the amount is out of range.
+        """
+        return self.write(load_user_money, username, amount, txn_id)
+
+    def ledger_balance(self, user_id):
+        """
+        Sum of the user's ledger entries, which always equals their moolah.
+        """
+        return self.connection().execute(LEDGER_BALANCE, (user_id,)).fetchone()[0]
+
+    def get_moolah(self, user_id):
+        """
+        Returns the user's moolah, or None if they do not exist.
+        """
+        user = self.user_by_id(user_id)
+        return user[2] if user is not None else None
+
+    def history_page(self, player_id, cursor="", page_size=0):
+        """
+        One page of the games a player played, newest first.
+
+        Parameters:
+        - player_id:
+            user_id of the player
+        - cursor:
+            next_cursor of the previous page, empty for the first page
+        - page_size:
+            games per page, DEFAULT_PAGE_SIZE if not positive, at most MAX_PAGE_SIZE
+
+        Returns ([(game_type, money_won, game_date)], next_cursor), where
+        next_cursor is empty after the last page, or None if the cursor is malformed.
+        """
+        before = read_cursor(cursor)
+        if before is None:
+            return None
+        if page_size <= 0:
+            page_size = DEFAULT_PAGE_SIZE
+        page_size = min(page_size, MAX_PAGE_SIZE)
+
+        # one extra row tells whether there is another page
+        rows = self.connection().execute(HISTORY_PAGE, (player_id, before, page_size + 1)).fetchall()
+        next_cursor = make_cursor(rows[page_size - 1][0]) if len(rows) > page_size else ""
+        games = [
+            (
+                main_pb2.TEXAS if game_type == "TEXAS HOLD EM" else main_pb2.FIVE_HAND,
+                money_won,
+                game_date,
+            )
+            for _, game_type, money_won, game_date in rows[:page_size]
+        ]
+        return games, next_cursor
+
+    def get_user_id(self, username):
+        """
+        Returns the user's user_id, or None if they do not exist.
+        """
+        user = self.user(username)
+        return user[0] if user is not None else None
+
+    def player_stats(self, player_id):
+        """
+        Returns (game_type, games, wins, net_winnings, biggest_win) for each game
+        type the player has played, read from player_stats instead of game_history.
+        """
+        rows = self.connection().execute(PLAYER_STATS, (player_id,)).fetchall()
+        return [
+            (main_pb2.TEXAS if game_type == "TEXAS HOLD EM" else main_pb2.FIVE_HAND, *stats)
+            for game_type, *stats in rows
+        ]
+
+    def save_games(self, game_results, request_id=""):
+        """
+        Save all results of a finished game in a single transaction.
+
+        Parameters:
+        - game_results:
+            GameHistoryEntry for each player in the game
+        - request_id:
+            idempotency key of the batch, a batch that was already saved is skipped
+
+        Returns True if the batch was applied, False if it was a duplicate.
+        """
+        return self.write(save_results, game_results, request_id)
+
+
+def history_response(storage, session, page_size=0, cursor=""):
+    """
+    VIEW_HISTORY response with one page of a player's games.
+
+    Parameters:
+    - storage:
+        Storage of this replica
+    - session:
+        (username, user_id) from the player's session token
+    - page_size, cursor:
+        as in Storage.history_page
+    """
+    username, player_id = session
+    page = storage.history_page(player_id, cursor, page_size)
+    if page is None:
+        return main_pb2.MainResponse(action=main_pb2.VIEW_HISTORY, result=False)
+    games, next_cursor = page
+    return main_pb2.MainResponse(
+        action=main_pb2.VIEW_HISTORY,
+        result=True,
+        game_history=[
+            main_pb2.GameHistoryEntry(
+                game_type=game_type, date=game_date, money_won=money_won, player=username
+            )
+            for game_type, money_won, game_date in games
+        ],
+        next_cursor=next_cursor,
+    )
+
+
+def stats_response(storage, session, username=""):
+    """
+    GET_STATS response with a player's totals and their stats per game type.
+
+    Parameters:
+    - storage:
+        Storage of this replica
+    - session:
+        (username, user_id) from the player's session token
+    - username:
+        player to show, the signed in player if empty
+    """
+    player_id = session[1]
+    if username and username != session[0]:
+        player_id = storage.get_user_id(username)
+        if player_id is None:
+            return main_pb2.MainResponse(action=main_pb2.GET_STATS, result=False)
+
+    game_type_stats = [
+        main_pb2.PlayerStats(
+            game_type=game_type,
+            games=games,
+            wins=wins,
+            net_winnings=net_winnings,
+            biggest_win=biggest_win,
+        )
+        for game_type, games, wins, net_winnings, biggest_win in storage.player_stats(player_id)
+    ]
+    total_stats = main_pb2.PlayerStats(
+        games=sum(stats.games for stats in game_type_stats),
+        wins=sum(stats.wins for stats in game_type_stats),
+        net_winnings=sum(stats.net_winnings for stats in game_type_stats),
+        biggest_win=max((stats.biggest_win for stats in game_type_stats), default=0),
+    )
+    return main_pb2.MainResponse(
+        action=main_pb2.GET_STATS,
+        result=True,
+        total_stats=total_stats,
+        game_type_stats=game_type_stats,
+    )
+
+
+# one Storage per database, shared by every thread
+storages = {}
+storages_lock = threading.Lock()
+
+
+def get_storage(db_path):
+    """
+    The shared Storage for db_path.
+    """
+    with storages_lock:
+        if db_path not in storages:
+            storages[db_path] = Storage(db_path)
+        return storages[db_path]
@@ -0,0 +1,355 @@
+import collections
+import logging
+import threading
+import time
+
+import grpc
+
+
+def broadcast(message, subscribers, key=None):
+    """
+    Serialize a message once and hand the same bytes to every subscriber.
+
+    Parameters:
+    - message:
+        the protobuf message to send
+    - subscribers:
+        iterable of objects with a send_message method (players, spectators)
+    - key:
+        set for state snapshots that a newer message with the same key supersedes
+
+    Returns the serialized bytes so callers can reuse them.
+    """
+    payload = message.SerializeToString()
+    for subscriber in subscribers:
+        subscriber.send_message(payload, key)
+    return payload
+
+
+class LatestMailbox:
+    """
+    Single-slot outbound buffer with drop-to-latest semantics.
+
+    A newer update replaces one that has not been sent yet, so a slow reader
+    only ever falls behind by one message and never slows down the sender.
+    """
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.pending = None
+        self.closed = False
+        self.dropped = 0
+
+    def send_message(self, message, key=None):
+        with self.condition:
+            if self.pending is not None:
+                self.dropped += 1
+            self.pending = message
+            self.condition.notify()
+
+    def get(self):
+        """
+        Block until an update is available. Returns None once the mailbox is closed.
+        """
+        with self.condition:
+            while self.pending is None and not self.closed:
+                self.condition.wait()
+            if self.closed:
+                return None
+            message, self.pending = self.pending, None
+            return message
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+
+class OutboundBuffer:
+    """
+    Bounded per-connection outbound buffer.
+
+    Messages sent with a key are state snapshots (e.g. SHOW_GAME): a newer
+    snapshot replaces one with the same key that is still waiting, as long as
+    no keyless message was queued after it, so ordering is kept. If the buffer
+    still fills up the reader cannot keep up, so the buffer closes and the
+    connection is dropped.
+    """
+
+    def __init__(self, maxsize=64, name=None):
+        """
+        Parameters:
+        - maxsize:
+            number of unsent messages allowed before the connection is dropped
+        - name:
+            label for metrics, usually the username
+        """
+        self.maxsize = maxsize
+        self.name = name
+        self.condition = threading.Condition()
+        # entries are [sequence number, key, message]
+        self.entries = collections.deque()
+        # latest unsent entry for each snapshot key
+        self.pending = {}
+        # sequence number of the last keyless message
+        self.barrier = 0
+        self.seq = 0
+        self.closed = False
+        self.overflowed = False
+        # closed by the reaper rather than by the client going away
+        self.reaped = False
+
+        # metrics
+        self.sent = 0
+        self.collapsed = 0
+        self.max_depth = 0
+
+    def send_message(self, message, key=None):
+        """
+        Queue a message. Returns False if the buffer is closed or overflowed.
+        """
+        with self.condition:
+            if self.closed:
+                return False
+            self.seq += 1
+            if key is not None:
+                entry = self.pending.get(key)
+                if entry is not None and entry[0] > self.barrier:
+                    # superseded snapshot, only the latest is sent
+                    entry[2] = message
+                    self.collapsed += 1
+                    return True
+            if len(self.entries) >= self.maxsize:
+                self.overflowed = True
+                self.closed = True
+                self.condition.notify_all()
+                return False
+
+            entry = [self.seq, key, message]
+            self.entries.append(entry)
+            if key is None:
+                self.barrier = self.seq
+            else:
+                self.pending[key] = entry
+            self.max_depth = max(self.max_depth, len(self.entries))
+            self.condition.notify()
+            return True
+
+    def put(self, message):
+        # same interface as queue.Queue for direct responses
+        self.send_message(message)
+
+    def get(self):
+        """
+        Block until a message is available. Returns None once the buffer is
+        closed and every queued message was sent, or right away if it overflowed.
+        """
+        with self.condition:
+            while not self.entries and not self.closed:
+                self.condition.wait()
+            # a closed buffer still delivers what was queued (e.g. the last reply)
+            if not self.entries or self.overflowed:
+                return None
+            entry = self.entries.popleft()
+            if entry[1] is not None and self.pending.get(entry[1]) is entry:
+                del self.pending[entry[1]]
+            self.sent += 1
+            return entry[2]
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def stats(self):
+        """
+        Queue-depth metrics for this connection.
+        """
+        with self.condition:
+            return {
+                "name": self.name or "",
+                "depth": len(self.entries),
+                "max_depth": self.max_depth,
+                "sent": self.sent,
+                "collapsed": self.collapsed,
+                "overflowed": self.overflowed,
+            }
+
+
+class StreamTracker:
+    """
+    Live gauge of open response streams, used to reclaim disconnected ones.
+
+    Every stream registers its outbound buffer. Closing the buffer is the
+    sentinel that wakes the response generator so its worker thread returns.
+    A stream counts as leaked when its client is gone (request side finished
+    or the RPC is no longer active) but its generator has not returned yet;
+    the reaper closes those, and streams idle for longer than idle_timeout.
+    Callers touch a stream on traffic in either direction, so a stream that
+    only receives is not idle.
+    """
+
+    def __init__(self, idle_timeout=0):
+        """
+        Parameters:
+        - idle_timeout:
+            seconds without traffic before a stream is reaped (0 disables)
+        """
+        self.idle_timeout = idle_timeout
+        self.lock = threading.Lock()
+        # buffer -> [context, last activity, request side finished]
+        self.streams = {}
+        self.opened = 0
+        self.reaped = 0
+        self.thread = None
+
+    def open(self, buffer, context):
+        """
+        Register a stream, closing its buffer as soon as the RPC terminates.
+        """
+        with self.lock:
+            self.streams[buffer] = [context, time.monotonic(), False]
+            self.opened += 1
+        context.add_callback(buffer.close)
+
+    def touch(self, buffer):
+        with self.lock:
+            if buffer in self.streams:
+                self.streams[buffer][1] = time.monotonic()
+
+    def requests_done(self, buffer):
+        """
+        The client stopped sending; wake the response generator.
+        """
+        with self.lock:
+            if buffer in self.streams:
+                self.streams[buffer][2] = True
+        buffer.close()
+
+    def close(self, buffer):
+        """
+        Called by the response generator once it returns.
+        """
+        with self.lock:
+            self.streams.pop(buffer, None)
+
+    def buffers(self):
+        with self.lock:
+            return list(self.streams)
+
+    def is_dead(self, entry, now):
+        context, last_active, requests_done = entry
+        if requests_done or not context.is_active():
+            return True
+        return bool(self.idle_timeout) and now - last_active > self.idle_timeout
+
+    def gauge(self):
+        now = time.monotonic()
+        with self.lock:
+            leaked = sum(1 for entry in self.streams.values() if self.is_dead(entry, now))
+            return {
+                "open": len(self.streams),
+                "leaked": leaked,
+                "opened": self.opened,
+                "reaped": self.reaped,
+            }
+
+    def reap(self):
+        """
+        Close the buffers of dead or idle streams. Returns how many were reaped.
+        """
+        now = time.monotonic()
+        with self.lock:
+            dead = [
+                buffer
+                for buffer, entry in self.streams.items()
+                if self.is_dead(entry, now) and not buffer.closed
+            ]
+            self.reaped += len(dead)
+        for buffer in dead:
+            buffer.reaped = True
+            buffer.close()
+        return len(dead)
+
+    def run(self, interval, prefix):
+        while True:
+            time.sleep(interval)
+            reaped = self.reap()
+            gauge = self.gauge()
+            logging.info(
+                f"{prefix} Streams: open={gauge['open']}, leaked={gauge['leaked']}, "
+                f"opened={gauge['opened']}, reaped={gauge['reaped']} (+{reaped})"
+            )
+
+    def start(self, interval=30, prefix="[MAIN]"):
+        """
+        Reap and log the gauge every interval seconds on a background thread.
+        """
+        if self.thread is None:
+            self.thread = threading.Thread(
+                target=self.run, args=(interval, prefix), daemon=True
+            )
+            self.thread.start()
+
+
+def shared_bytes_serializer(serializer):
+    """
+    Wrap a response serializer so that already serialized bytes pass through untouched.
+
+    Parameters:
+    - serializer:
+        the generated SerializeToString for the response type
+    """
+
+    def serialize(response):
+        if isinstance(response, bytes):
+            return response
+        return serializer(response)
+
+    return serialize
+
+
+class _SharedBytesServer:
+    """
+    Stand-in server handed to the generated add_*_to_server functions.
+
+    Swaps every response serializer for one that accepts pre-serialized bytes,
+    then registers the handlers on the real server.
+    """
+
+    def __init__(self, server):
+        self.server = server
+
+    def add_generic_rpc_handlers(self, generic_handlers):
+        # the handlers are registered in add_registered_method_handlers instead
+        pass
+
+    def add_registered_method_handlers(self, service_name, method_handlers):
+        handlers = {
+            name: handler._replace(
+                response_serializer=shared_bytes_serializer(handler.response_serializer)
+            )
+            for name, handler in method_handlers.items()
+        }
+        self.server.add_generic_rpc_handlers(
+            (grpc.method_handlers_generic_handler(service_name, handlers),)
+        )
+        self.server.add_registered_method_handlers(service_name, handlers)
+
+
+def add_servicer_to_server(add_servicer, servicer, server):
+    """
+    Register a servicer so its streams may yield pre-serialized bytes.
+
+    Parameters:
+    - add_servicer:
+        the generated add_*Servicer_to_server function
+    - servicer:
+        the servicer instance
+    - server:
+        the grpc server
+    """
+    add_servicer(servicer, _SharedBytesServer(server))
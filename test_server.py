@@ -19,13 +19,21 @@ import lobby_pb2_grpc
 import lobby_pb2
 import json
 import traceback
+from leader_helpers import missing_entries
 from replica_helpers import replicate_action
+from storage_helpers import MAX_LOAD_MONEY, get_storage, history_response, stats_response
+from leaderboard_helpers import leaderboard_response
+from token_helpers import make_session_token, make_token, read_session_token
 
 """
 Making sure the server is started with the correct arguments.
 """
 num_servers = 5
-num_lobbies = 2
+
+# signs session tokens and seat reservations
+token_secret = "test-secret"
+seat_ttl = 10
+session_ttl = 3600
 
 
 class TestServer:
@@ -37,6 +45,8 @@ class TestServer:
         self.leader = None
         self.name = name
         self.db_path = db_path
+        # rebuilt from the database on start, like server.py
+        get_storage(db_path).load()
         self.voted_for = None
         self.servers = None
         self.log = []
@@ -61,7 +71,9 @@ class TestServer:
 
         # look for new entires
         try:
-            new_entries = req.entries[len(self.log) :]
+            new_entries = missing_entries(self.log, req.entries)
+            if new_entries is None:
+                return raft_pb2.AppendEntriesResponse(term=req.term, success=False)
             for entry in new_entries:
                 # add to log and replicate action
                 self.log.append(entry)
@@ -95,61 +107,39 @@ class TestServer:
         
 
 
-def handle_requests(req, db_path, all_lobbies=None, username=None):
+def handle_requests(req, db_path, lobby_registry=None, username=None):
     client_queue = queue.Queue()
     clients = {}
+    storage = get_storage(db_path)
     if req.action == main_pb2.CHECK_USERNAME:
         # check if username is already in use
-        sqlcon = sqlite3.connect(db_path)
-        sqlcur = sqlcon.cursor()
-
-        sqlcur.execute(
-            "SELECT * FROM users WHERE username=?", (req.username,)
-        )
-
         # if username is already in use, send response with success=False
         # otherwise, send response with success=True
-        if sqlcur.fetchone():
-            client_queue.put(
-                main_pb2.MainResponse(
-                    action=main_pb2.CHECK_USERNAME, result=False
-                )
-            )
-        else:
-            client_queue.put(
-                main_pb2.MainResponse(
-                    action=main_pb2.CHECK_USERNAME, result=True
-                )
+        client_queue.put(
+            main_pb2.MainResponse(
+                action=main_pb2.CHECK_USERNAME,
+                result=not storage.username_exists(req.username),
             )
-        sqlcon.close()
+        )
 
     elif req.action == main_pb2.LOGIN:
         # check if username and password match
-        sqlcon = sqlite3.connect(db_path)
-        sqlcur = sqlcon.cursor()
-
         new_passhash = hashlib.sha256(req.passhash.encode()).hexdigest()
-
-        sqlcur.execute(
-            "SELECT * FROM users WHERE username=? AND passhash=?",
-            (req.username, new_passhash),
-        )
+        user = storage.check_login(req.username, new_passhash)
 
         # if username and password match, send response with success=True
         # otherwise, send response with success=False
-        if sqlcur.fetchone():
-
-            sqlcur.execute(
-                "SELECT moolah FROM users WHERE username=?",
-                (req.username,),
-            )
-
-            moolah = sqlcur.fetchone()[0]
+        if user:
+            user_id, moolah = user
 
+            # later requests show this token instead of credentials
             response = main_pb2.MainResponse(
                 action=main_pb2.LOGIN,
                 result=True,
                 moolah=moolah,
+                session_token=make_session_token(
+                    token_secret, req.username, user_id, session_ttl
+                ),
             )
 
             client_queue.put(response)
@@ -163,93 +153,61 @@ def handle_requests(req, db_path, all_lobbies=None, username=None):
                     action=main_pb2.LOGIN, result=False
                 )
             )
-        sqlcon.close()
 
     elif req.action == main_pb2.REGISTER:
-        sqlcon = sqlite3.connect(db_path)
-        sqlcur = sqlcon.cursor()
-
-        # check to make sure username is not already in use
-        sqlcur.execute(
-            "SELECT * FROM users WHERE username=?", (req.username,)
-        )
-        if sqlcur.fetchone():
+        # add new user to database, unless the username is already in use
+        new_passhash = hashlib.sha256(
+            req.passhash.encode()
+        ).hexdigest()
+        user_id = storage.register(req.username, new_passhash)
+        if user_id is None:
             client_queue.put(
                 main_pb2.MainResponse(
                     action=main_pb2.REGISTER, result=False
                 )
             )
         else:
-            # add new user to database
-            new_passhash = hashlib.sha256(
-                req.passhash.encode()
-            ).hexdigest()
-            sqlcur.execute(
-                "INSERT INTO users (username, passhash) VALUES (?, ?)",
-                (req.username, new_passhash),
-            )
-            sqlcon.commit()
             response = main_pb2.MainResponse(
-                action=main_pb2.REGISTER, result=True, moolah=500
+                action=main_pb2.REGISTER,
+                result=True,
+                moolah=500,
+                session_token=make_session_token(
+                    token_secret, req.username, user_id, session_ttl
+                ),
             )
 
             client_queue.put(response)
 
-        sqlcon.close()
-
         # add user to clients
         username = req.username
         clients[username] = client_queue
 
     elif req.action == main_pb2.DELETE_ACCOUNT:
         # delete account if params match
-        sqlcon = sqlite3.connect(db_path)
-        sqlcur = sqlcon.cursor()
-
         username = req.username
-        passhash = req.passhash
+        passhash = hashlib.sha256(req.passhash.encode()).hexdigest()
 
-        passhash = hashlib.sha256(passhash.encode()).hexdigest()
-        sqlcur.execute(
-            "SELECT passhash FROM users WHERE username=?", (username,)
-        )
-
-        result = sqlcur.fetchone()
-        if result:
-            # username exists and passhash matches
-            if result[0] == passhash:
-                sqlcur.execute(
-                    "DELETE FROM users WHERE username=?", (username,)
+        # username exists and passhash matches
+        if storage.delete_account(username, passhash):
+            client_queue.put(
+                main_pb2.MainResponse(
+                    action=main_pb2.DELETE_ACCOUNT, result=True
                 )
-                sqlcon.commit()
+            )
+            # tell server to ping users to update their chat, remove from connected users
 
-                client_queue.put(
-                    main_pb2.MainResponse(
-                        action=main_pb2.DELETE_ACCOUNT, result=True
-                    )
-                )
-                # tell server to ping users to update their chat, remove from connected users
-
-                # delete user from clients
-                if username in clients:
-                    del clients[username]
-
-            # username exists but passhash is wrong
-            else:
-                client_queue.put(
-                    main_pb2.MainResponse(
-                        action=main_pb2.DELETE_ACCOUNT, result=False
-                    )
-                )
+            # delete user from clients
+            if username in clients:
+                del clients[username]
+
+        # username doesn't exist or passhash is wrong
         else:
-            # username doesn't exist
             client_queue.put(
                 main_pb2.MainResponse(
                     action=main_pb2.DELETE_ACCOUNT, result=False
                 )
             )
 
-        sqlcon.close()
     elif req.action == main_pb2.CONNECT:
         # a new leader was chosen, client connected to new leader
         # add the user to the clients if they are signed in
@@ -264,69 +222,54 @@ def handle_requests(req, db_path, all_lobbies=None, username=None):
             connected_to_lobby = True
     elif req.action == main_pb2.SAVE_GAME:
         # save game to data base
-        player_name = req.game_history.player
-        game_type = req.game_history.game_type
-        money_won = req.game_history.money_won
-
-        game_type = (
-            "TEXAS HOLD EM" if game_type == main_pb2.TEXAS else "5 CARD"
-        )
-
-        # save game to database
-        sqlcon = sqlite3.connect(db_path)
-        sqlcur = sqlcon.cursor()
-        sqlcur.execute(
-            "SELECT user_id FROM users WHERE username=?", (player_name,)
-        )
-        player_id = sqlcur.fetchone()[0]
-
-        # add game to game history
-        sqlcur.execute(
-            "INSERT INTO game_history (player_id, game_type, money_won) VALUES (?, ?, ?)",
-            (player_id, game_type, money_won),
-        )
+        storage.save_games([req.game_history], req.request_id)
+        return
 
-        curr_money = sqlcur.execute(
-            "SELECT moolah FROM users WHERE username=?", (player_name,)
-        ).fetchone()[0]
+    elif req.action == main_pb2.LOAD_MONEY:
+        # add moolah through the ledger, a retry with the same
+        # request_id returns the balance without adding again
+        session = storage.check_session(read_session_token(token_secret, req.session_token))
+        moolah = None
+        if session is not None and 0 < req.money_to_add <= MAX_LOAD_MONEY:
+            moolah = storage.load_money(session[0], req.money_to_add, req.request_id)
+        if moolah is None:
+            client_queue.put(main_pb2.MainResponse(action=main_pb2.LOAD_MONEY, result=False))
+        else:
+            client_queue.put(
+                main_pb2.MainResponse(
+                    action=main_pb2.LOAD_MONEY,
+                    result=True,
+                    moolah=moolah,
+                    request_id=req.request_id,
+                )
+            )
 
-        # update moolah in users table
-        sqlcur.execute(
-            "UPDATE users SET moolah=? WHERE username=?",
-            (curr_money + money_won, player_name),
-        )
-        sqlcur.execute(
-            "SELECT moolah FROM users WHERE username=?", (player_name,)
+    elif req.action == main_pb2.SAVE_GAME_BATCH:
+        # save every result of a finished game in one transaction
+        storage.save_games(req.game_results, req.request_id)
+        client_queue.put(
+            main_pb2.MainResponse(
+                action=main_pb2.SAVE_GAME_BATCH,
+                result=True,
+                request_id=req.request_id,
+            )
         )
 
-        moolah = sqlcur.fetchone()[0]
-
-        sqlcon.commit()
-        sqlcon.close()
-        return
-
     elif req.action == main_pb2.GET_USER_INFO:
         # update user on how much money they have
-        username = req.username
-        sqlcon = sqlite3.connect(db_path)
-        sqlcur = sqlcon.cursor()
+        # the session token says who they are, so credentials are not checked again
+        session = storage.check_session(read_session_token(token_secret, req.session_token))
+        moolah = None
+        if session is not None:
+            moolah = storage.get_moolah(session[1])
 
-        # check if user exists
-        sqlcur.execute(
-            "SELECT * FROM users WHERE username=?", (username,)
-        )
-        if not sqlcur.fetchone():
+        if moolah is None:
             client_queue.put(
                 main_pb2.MainResponse(
                     action=main_pb2.GET_USER_INFO, result=False
                 )
             )
         else:
-            sqlcur.execute(
-                "SELECT moolah FROM users WHERE username=?", (username,)
-            )
-            moolah = sqlcur.fetchone()[0]
-
             client_queue.put(
                 main_pb2.MainResponse(
                     action=main_pb2.GET_USER_INFO,
@@ -335,28 +278,46 @@ def handle_requests(req, db_path, all_lobbies=None, username=None):
                 )
             )
 
+    elif req.action == main_pb2.GET_STATS:
+        # profile stats come from player_stats, not from the whole game history
+        # any signed in player may look at anyone's stats by username
+        session = storage.check_session(read_session_token(token_secret, req.session_token))
+        if session is None:
+            client_queue.put(
+                main_pb2.MainResponse(action=main_pb2.GET_STATS, result=False)
+            )
+        else:
+            client_queue.put(stats_response(storage, session, req.username))
+
+    elif req.action == main_pb2.GET_LEADERBOARD:
+        # served from memory, the database is not read
+        client_queue.put(
+            leaderboard_response(storage.leaderboard, req.board, req.game_type, req.top_k)
+        )
+
     elif req.action == main_pb2.JOIN_LOBBY:
-        # allow user to find available lobbies
-        game_type = req.game_type
-        # check if lobby is open
-        sent_lobby = False
-        for idx,_ in enumerate(all_lobbies):
-            if (
-                (not all_lobbies[idx]["active"])
-                and (all_lobbies[idx]["game_type"] == game_type)
-                and (all_lobbies[idx]["num_players"] < 4)
-            ):
-                # tell user it can join lobby
-                client_queue.put(
-                    main_pb2.MainResponse(
-                        action=main_pb2.JOIN_LOBBY,
-                        result=True,
-                        game_lobby=idx,
-                    )
+        # find an open lobby from the heartbeats lobbies sent
+        # only signed in players get a seat
+        session = storage.check_session(read_session_token(token_secret, req.session_token))
+        lobby = lobby_registry.find(req.game_type)
+        if (
+            session is not None
+            and lobby is not None
+            and lobby_registry.reserve(lobby.lobby_id, session[0], seat_ttl)
+        ):
+            # tell user it can join lobby, holding a seat for them
+            client_queue.put(
+                main_pb2.MainResponse(
+                    action=main_pb2.JOIN_LOBBY,
+                    result=True,
+                    game_lobby=lobby.lobby_id,
+                    lobby_address=lobby.address,
+                    seat_token=make_token(
+                        token_secret, ["seat", lobby.lobby_id, session[0]], seat_ttl
+                    ),
                 )
-                sent_lobby = True
-                break
-        if not sent_lobby:
+            )
+        else:
             client_queue.put(
                 main_pb2.MainResponse(
                     action=main_pb2.JOIN_LOBBY,
@@ -367,36 +328,14 @@ def handle_requests(req, db_path, all_lobbies=None, username=None):
 
     elif req.action == main_pb2.VIEW_HISTORY:
         # send history back to client
-        curr_username = req.username
-        sqlcon = sqlite3.connect(db_path)
-        sqlcur = sqlcon.cursor()
-        sqlcur.execute(
-            "SELECT user_id FROM users WHERE username=?", (curr_username,)
-        )
-        player_id = sqlcur.fetchone()[0]
-
-        sqlcur.execute(
-            "SELECT game_type, money_won FROM game_history WHERE player_id=? ORDER BY game_date DESC",
-            (player_id,),
-        )
-
-        game_history = sqlcur.fetchall()
-
-        games = []
-        for i in range(len(game_history)):
-            game = main_pb2.GameHistoryEntry(
-                game_type=main_pb2.TEXAS if game_history[i][0] == "TEXAS HOLD EM" else main_pb2.FIVE_HAND,
-                money_won=game_history[i][1],
-                player=curr_username,
-            )
-            games.append(game)
-        
-        client_queue.put(
-            main_pb2.MainResponse(
-                action=main_pb2.VIEW_HISTORY,
-                result=True,
-                game_history=games,
+        # the session token carries the user id, no lookup by username needed
+        session = storage.check_session(read_session_token(token_secret, req.session_token))
+        if session is None:
+            client_queue.put(
+                main_pb2.MainResponse(action=main_pb2.VIEW_HISTORY, result=False)
             )
-        )
-        sqlcon.close()
+        else:
+            # one page at a time, the client asks for the next one with next_cursor
+            client_queue.put(history_response(storage, session, req.page_size, req.cursor))
+
     return client_queue.get()
\ No newline at end of file
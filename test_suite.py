@@ -13,10 +13,65 @@ import random
 from setup import reset_database, structure_tables
 from test_server import handle_requests, TestServer
 from test_lobby import Deck, TestTexasHoldem
+from stream_helpers import (
+    LatestMailbox,
+    OutboundBuffer,
+    StreamTracker,
+    broadcast,
+    shared_bytes_serializer,
+)
+from lobby_helpers import (
+    GameOutbox,
+    Heartbeat,
+    LobbyRegistry,
+    Matchmaker,
+    RosterService,
+    SpectatorFeed,
+    TimerWheel,
+    timeout_move,
+)
+from replica_helpers import replicate_action
+from storage_helpers import DEFAULT_PAGE_SIZE, MAX_LOAD_MONEY, Storage, make_cursor
+from leaderboard_helpers import Leaderboard, Ranking
+from cache_helpers import BloomFilter
+from schema_helpers import LATEST_VERSION, migrate
+from leader_helpers import (
+    FollowerReads,
+    LeaderDiscovery,
+    LeaderLease,
+    ReplicaReads,
+    assign_request_id,
+    leader_hint,
+    missing_entries,
+    reject_not_leader,
+    without_credentials,
+)
+from token_helpers import make_session_token, make_token, read_session_token, read_token
+import threading
+import time
+import lobby_pb2
 
 unittest.TestLoader.sortTestMethodsUsing = None
 
 
+def lobby_registry(lobbies):
+    """
+    Registry holding a heartbeat from each lobby, in order, with ids by position.
+    """
+    registry = LobbyRegistry()
+    for lobby_id, lobby in enumerate(lobbies):
+        registry.heartbeat(
+            main_pb2.LobbyStatus(
+                lobby_id=lobby_id,
+                address=f"localhost:{60000 + lobby_id}",
+                game_type=lobby["game_type"],
+                seats_free=4 - lobby["num_players"],
+                active=lobby["active"],
+            )
+        )
+    return registry
+
+
 class TestDatabaseSetup(unittest.TestCase):
     """
     Tests "setup.py" file for resetting and structuring the database.
@@ -141,6 +196,8 @@ class TestServerProcessResponse(unittest.TestCase):
         if os.path.exists("data/r5/test_poker.db"):
             os.remove("data/r5/test_poker.db")
             print("Deleted test_poker.db")
+        # and any WAL left behind by the storage connections
+        reset_database([f"data/r{i}/test_poker.db" for i in range(1, 6)])
 
         # create the database
         structure_tables("data/r1/test_poker.db")
@@ -370,6 +427,13 @@ class TestServerProcessResponse(unittest.TestCase):
                 response = self.all_servers[server].AppendEntries(request)
                 self.assertEqual(response.success, True)
 
+    def login(self, username, password):
+        # log in and return the session token
+        request = main_pb2.MainRequest(
+            action=main_pb2.LOGIN, username=username, passhash=password
+        )
+        return handle_requests(request, db_path=self.server1.db_path).session_token
+
     def test_2a_get_user_info(self):
         # get user info, check if it exists in the database
         request = main_pb2.MainRequest(
@@ -381,7 +445,8 @@ class TestServerProcessResponse(unittest.TestCase):
     def test_2b_get_user_info(self):
         # get user info, check if it exists in the database
         request = main_pb2.MainRequest(
-            action = main_pb2.GET_USER_INFO, username="bar"
+            action = main_pb2.GET_USER_INFO, username="bar",
+            session_token=self.login("bar", "baz"),
         )
         response = handle_requests(request, db_path=self.server1.db_path)
         self.assertEqual(response.result, True)
@@ -390,72 +455,96 @@ class TestServerProcessResponse(unittest.TestCase):
     def test_2c_get_user_info(self):
         # get user info, check if it exists in the database
         request = main_pb2.MainRequest(
-            action = main_pb2.GET_USER_INFO, username="foo"
+            action = main_pb2.GET_USER_INFO, username="foo",
+            session_token=self.login("foo", "bar"),
         )
         response = handle_requests(request, db_path=self.server1.db_path)
         self.assertEqual(response.result, True)
         self.assertEqual(response.moolah, 500)
 
+    def test_2d_get_user_info_session(self):
+        # the session token from login identifies the user
+        session = read_session_token("test-secret", self.login("foo", "bar"))
+        self.assertEqual(session, ("foo", 1))
+
+        # no token or a forged token is rejected
+        for token in ["", make_session_token("wrong-secret", "foo", 1, 60)]:
+            request = main_pb2.MainRequest(
+                action=main_pb2.GET_USER_INFO, username="foo", session_token=token
+            )
+            response = handle_requests(request, db_path=self.server1.db_path)
+            self.assertEqual(response.result, False)
+
     def test_3a_join_lobby(self):
         # try to join a lobby, should return False, none available
         request = main_pb2.MainRequest(
-            action = main_pb2.JOIN_LOBBY, game_type=0
+            action = main_pb2.JOIN_LOBBY, game_type=0,
+            session_token=self.login("foo", "bar"),
         )
         response = handle_requests(request, db_path=self.server1.db_path,
-                                   all_lobbies = [])
+                                   lobby_registry = lobby_registry([]))
         self.assertEqual(response.result, False)
 
     def test_3b_join_lobby(self):
         # try to join a lobby, should return True
         request = main_pb2.MainRequest(
-            action = main_pb2.JOIN_LOBBY, game_type=0
+            action = main_pb2.JOIN_LOBBY, game_type=0,
+            session_token=self.login("foo", "bar"),
         )
         response = handle_requests(request, db_path=self.server1.db_path,
-                                   all_lobbies = [{"active": True, "game_type": 0, "num_players": 0},
-                                                  {"active": False, "game_type": 0, "num_players": 0}])
+                                   lobby_registry = lobby_registry([{"active": True, "game_type": 0, "num_players": 0},
+                                                  {"active": False, "game_type": 0, "num_players": 0}]))
         self.assertEqual(response.result, True)
         self.assertEqual(response.game_lobby, 1)
+        self.assertEqual(response.lobby_address, "localhost:60001")
+        self.assertEqual(read_token("test-secret", response.seat_token), ["seat", 1, "foo"])
 
     def test_3c_join_lobby(self):
         # try to join a lobby, should return False, none active
         request = main_pb2.MainRequest(
-            action = main_pb2.JOIN_LOBBY, game_type=0
+            action = main_pb2.JOIN_LOBBY, game_type=0,
+            session_token=self.login("foo", "bar"),
         )
         response = handle_requests(request, db_path=self.server1.db_path,
-                                   all_lobbies = [{"active": True, "game_type": 0, "num_players": 0},
-                                                  {"active": True, "game_type": 0, "num_players": 0}])
+                                   lobby_registry = lobby_registry([{"active": True, "game_type": 0, "num_players": 0},
+                                                  {"active": True, "game_type": 0, "num_players": 0}]))
         self.assertEqual(response.result, False)
 
     def test_3d_join_lobby(self):
         # try to join a lobby, should return False, none available of correct mode
         request = main_pb2.MainRequest(
-            action = main_pb2.JOIN_LOBBY, game_type=0
+            action = main_pb2.JOIN_LOBBY, game_type=0,
+            session_token=self.login("foo", "bar"),
         )
         response = handle_requests(request, db_path=self.server1.db_path,
-                                   all_lobbies = [{"active": True, "game_type": 0, "num_players": 0},
-                                                  {"active": False, "game_type": 1, "num_players": 0}])
+                                   lobby_registry = lobby_registry([{"active": True, "game_type": 0, "num_players": 0},
+                                                  {"active": False, "game_type": 1, "num_players": 0}]))
         self.assertEqual(response.result, False)
 
     def test_3e_join_lobby(self):
         # try to join a lobby, should return False, none available with enough space
         request = main_pb2.MainRequest(
-            action = main_pb2.JOIN_LOBBY, game_type=0
+            action = main_pb2.JOIN_LOBBY, game_type=0,
+            session_token=self.login("foo", "bar"),
         )
         response = handle_requests(request, db_path=self.server1.db_path,
-                                   all_lobbies = [{"active": True, "game_type": 0, "num_players": 0},
-                                                  {"active": False, "game_type": 0, "num_players": 4}])
+                                   lobby_registry = lobby_registry([{"active": True, "game_type": 0, "num_players": 0},
+                                                  {"active": False, "game_type": 0, "num_players": 4}]))
         self.assertEqual(response.result, False)
 
     def test_3f_join_lobby(self):
         # try to join a lobby, should return True, just enough space
         request = main_pb2.MainRequest(
-            action = main_pb2.JOIN_LOBBY, game_type=0
+            action = main_pb2.JOIN_LOBBY, game_type=0,
+            session_token=self.login("foo", "bar"),
         )
         response = handle_requests(request, db_path=self.server1.db_path,
-                                   all_lobbies = [{"active": True, "game_type": 0, "num_players": 0},
-                                                  {"active": False, "game_type": 0, "num_players": 3}])
+                                   lobby_registry = lobby_registry([{"active": True, "game_type": 0, "num_players": 0},
+                                                  {"active": False, "game_type": 0, "num_players": 3}]))
         self.assertEqual(response.result, True)
         self.assertEqual(response.game_lobby, 1)
+        self.assertEqual(response.lobby_address, "localhost:60001")
+        self.assertEqual(read_token("test-secret", response.seat_token), ["seat", 1, "foo"])
 
     def test_4a_save_game(self):
         # try to save game, won money
@@ -467,8 +556,9 @@ class TestServerProcessResponse(unittest.TestCase):
         )
         _ = handle_requests(request, db_path=self.server1.db_path)
         request1 = main_pb2.MainRequest(
-            action=main_pb2.GET_USER_INFO, username="bar"
-        )  
+            action=main_pb2.GET_USER_INFO, username="bar",
+            session_token=self.login("bar", "baz"),
+        )
         response1 = handle_requests(request1, db_path=self.server1.db_path)
         self.assertEqual(response1.moolah, 600)
 
@@ -482,24 +572,190 @@ class TestServerProcessResponse(unittest.TestCase):
         )
         _ = handle_requests(request, db_path=self.server1.db_path)
         request1 = main_pb2.MainRequest(
-            action=main_pb2.GET_USER_INFO, username="bar"
-        )  
+            action=main_pb2.GET_USER_INFO, username="bar",
+            session_token=self.login("bar", "baz"),
+        )
         response1 = handle_requests(request1, db_path=self.server1.db_path)
         self.assertEqual(response1.moolah, 500)
 
     def test_4c_view_history(self):
         request = main_pb2.MainRequest(
-            action=main_pb2.VIEW_HISTORY, username="bar"
+            action=main_pb2.VIEW_HISTORY, username="bar",
+            session_token=self.login("bar", "baz"),
         )
         response = handle_requests(request, db_path=self.server1.db_path)
         self.assertEqual(response.result, True)
         self.assertEqual(len(response.game_history), 2)
-        self.assertEqual(response.game_history[0].game_type, 1)
-        self.assertEqual(response.game_history[0].money_won, 100)
+        # newest first
+        self.assertEqual(response.game_history[0].game_type, 2)
+        self.assertEqual(response.game_history[0].money_won, -100)
         self.assertEqual(response.game_history[0].player, "bar")
-        self.assertEqual(response.game_history[1].game_type, 2)
-        self.assertEqual(response.game_history[1].money_won, -100)
+        self.assertEqual(response.game_history[1].game_type, 1)
+        self.assertEqual(response.game_history[1].money_won, 100)
         self.assertEqual(response.game_history[1].player, "bar")
+        self.assertEqual(response.next_cursor, "")
+
+    def test_4c_view_history_pages(self):
+        request = main_pb2.MainRequest(
+            action=main_pb2.VIEW_HISTORY, session_token=self.login("bar", "baz"), page_size=1
+        )
+        response = handle_requests(request, db_path=self.server1.db_path)
+        self.assertEqual([game.money_won for game in response.game_history], [-100])
+        self.assertNotEqual(response.next_cursor, "")
+
+        request.cursor = response.next_cursor
+        response = handle_requests(request, db_path=self.server1.db_path)
+        self.assertEqual([game.money_won for game in response.game_history], [100])
+        self.assertEqual(response.next_cursor, "")
+
+        request.cursor = "not a cursor"
+        response = handle_requests(request, db_path=self.server1.db_path)
+        self.assertFalse(response.result)
+
+    def test_4c_get_stats(self):
+        request = main_pb2.MainRequest(
+            action=main_pb2.GET_STATS, session_token=self.login("bar", "baz")
+        )
+        response = handle_requests(request, db_path=self.server1.db_path)
+        self.assertTrue(response.result)
+        self.assertEqual(response.total_stats.games, 2)
+        self.assertEqual(response.total_stats.wins, 1)
+        self.assertEqual(response.total_stats.net_winnings, 0)
+        self.assertEqual(response.total_stats.biggest_win, 100)
+        by_type = {stats.game_type: stats for stats in response.game_type_stats}
+        self.assertEqual(by_type[main_pb2.TEXAS].net_winnings, 100)
+        self.assertEqual(by_type[main_pb2.FIVE_HAND].net_winnings, -100)
+        self.assertEqual(by_type[main_pb2.FIVE_HAND].biggest_win, 0)
+
+        # another player's stats, by username
+        request.username = "nobody"
+        response = handle_requests(request, db_path=self.server1.db_path)
+        self.assertFalse(response.result)
+
+    def test_4c_get_leaderboard(self):
+        request = main_pb2.MainRequest(action=main_pb2.GET_LEADERBOARD, board=main_pb2.MOOLAH)
+        response = handle_requests(request, db_path=self.server1.db_path)
+        self.assertTrue(response.result)
+        self.assertEqual(
+            [(entry.rank, entry.username, entry.score) for entry in response.leaderboard][:1],
+            [(1, "bar", 500)],
+        )
+
+        request = main_pb2.MainRequest(
+            action=main_pb2.GET_LEADERBOARD, board=main_pb2.NET_WINNINGS, game_type=main_pb2.TEXAS
+        )
+        response = handle_requests(request, db_path=self.server1.db_path)
+        self.assertEqual(
+            [(entry.username, entry.score) for entry in response.leaderboard], [("bar", 100)]
+        )
+
+        # moolah is not kept per game type
+        request.board = main_pb2.MOOLAH
+        response = handle_requests(request, db_path=self.server1.db_path)
+        self.assertFalse(response.result)
+
+    def test_4d_save_game_batch(self):
+        # save all results of a game at once, unknown players are skipped
+        request = main_pb2.MainRequest(
+            action=main_pb2.SAVE_GAME_BATCH,
+            game_results=[
+                main_pb2.GameHistoryEntry(game_type=1, money_won=30, player="bar"),
+                main_pb2.GameHistoryEntry(game_type=1, money_won=-30, player="ghost"),
+            ],
+        )
+        # the leader names the batch before logging it
+        assign_request_id(request)
+        self.assertTrue(request.request_id)
+        log_copy = raft_pb2.LogEntry(
+            action=request.action,
+            request_id=request.request_id,
+            game_results=[
+                raft_pb2.GameHistoryEntry(
+                    game_type=result.game_type,
+                    money_won=result.money_won,
+                    player=result.player,
+                )
+                for result in request.game_results
+            ],
+            term=1,
+        )
+        _ = handle_requests(request, db_path=self.server1.db_path)
+        self.server1.log.append(log_copy)
+
+        request = raft_pb2.AppendEntriesRequest(
+            term=1, leader_address="s1", entries=self.server1.log
+        )
+        for server in self.all_servers:
+            if server != "s1":
+                response = self.all_servers[server].AppendEntries(request)
+                self.assertEqual(response.success, True)
+
+        # applied as one entry on every replica
+        for server in self.all_servers:
+            conn = sqlite3.connect(self.all_servers[server].db_path)
+            cursor = conn.cursor()
+            cursor.execute("SELECT moolah FROM users WHERE username='bar';")
+            self.assertEqual(cursor.fetchone()[0], 530)
+            conn.close()
+
+        # a re-delivered entry is applied once
+        replicate_action(log_copy, self.server2.db_path)
+        conn = sqlite3.connect(self.server2.db_path)
+        self.assertEqual(
+            conn.execute("SELECT moolah FROM users WHERE username='bar';").fetchone()[0], 530
+        )
+        conn.close()
+
+    def test_4e_load_money(self):
+        request = main_pb2.MainRequest(
+            action=main_pb2.LOAD_MONEY,
+            session_token=self.login("bar", "baz"),
+            money_to_add=70,
+            request_id="load-1",
+        )
+        response = handle_requests(request, db_path=self.server1.db_path)
+        self.assertTrue(response.result)
+        self.assertEqual(response.moolah, 600)
+        # a retried load is acknowledged but not added again
+        response = handle_requests(request, db_path=self.server1.db_path)
+        self.assertTrue(response.result)
+        self.assertEqual(response.moolah, 600)
+
+        # nothing to load, or no session
+        for money_to_add, token in [(0, request.session_token), (70, "")]:
+            bad = main_pb2.MainRequest(
+                action=main_pb2.LOAD_MONEY,
+                session_token=token,
+                money_to_add=money_to_add,
+                request_id="load-2",
+            )
+            self.assertFalse(handle_requests(bad, db_path=self.server1.db_path).result)
+
+        # a replica applies a re-delivered log entry once
+        entry = raft_pb2.LogEntry(
+            action=raft_pb2.LOAD_MONEY, username="bar", money_to_add=70, request_id="load-1"
+        )
+        replicate_action(entry, self.server2.db_path)
+        replicate_action(entry, self.server2.db_path)
+        # replicas check the amount themselves
+        for money_to_add in [-100000, 10**9]:
+            bad = raft_pb2.LogEntry(
+                action=raft_pb2.LOAD_MONEY, username="bar", money_to_add=money_to_add, request_id="load-3"
+            )
+            replicate_action(bad, self.server2.db_path)
+        for db_path in [self.server1.db_path, self.server2.db_path]:
+            conn = sqlite3.connect(db_path)
+            self.assertEqual(
+                conn.execute("SELECT moolah FROM users WHERE username='bar'").fetchone()[0], 600
+            )
+            # the ledger adds up to the balance
+            self.assertEqual(
+                conn.execute(
+                    "SELECT SUM(amount) FROM ledger JOIN users USING (user_id) WHERE username='bar'"
+                ).fetchone()[0],
+                600,
+            )
+            conn.close()
 
     def test_5b_delete_account_invalid_pass(self):
         # delete account with invalid password, should return False
@@ -828,3 +1084,1126 @@ class TestEvaluateHand(unittest.TestCase):
         # two straights: 3-7 and 5-9 → pick 5-9
         best = ['5♠','6♥','7♣','8♦','9♥']
         self.assertBest(cards, best)
+
+
+class TestBroadcast(unittest.TestCase):
+    """
+    Tests "stream_helpers.py" for serializing updates once per event.
+    """
+
+    class Subscriber:
+        def __init__(self):
+            self.messages = []
+
+        def send_message(self, message, key=None):
+            self.messages.append(message)
+
+    def test_broadcast_shares_bytes(self):
+        subscribers = [self.Subscriber() for _ in range(4)]
+        response = lobby_pb2.LobbyResponse(
+            action=lobby_pb2.SHOW_GAME,
+            result=True,
+            game_state=lobby_pb2.GameState(players=["foo", "bar"], pot=3),
+        )
+        payload = broadcast(response, subscribers)
+        for subscriber in subscribers:
+            self.assertEqual(len(subscriber.messages), 1)
+            # every subscriber gets the very same bytes object
+            self.assertIs(subscriber.messages[0], payload)
+        self.assertEqual(lobby_pb2.LobbyResponse.FromString(payload), response)
+
+    def test_serializer_passes_bytes_through(self):
+        serialize = shared_bytes_serializer(lobby_pb2.LobbyResponse.SerializeToString)
+        response = lobby_pb2.LobbyResponse(action=lobby_pb2.KICK_PLAYER, result=True)
+        payload = response.SerializeToString()
+        self.assertIs(serialize(payload), payload)
+        self.assertEqual(serialize(response), payload)
+
+
+class TestRosterService(unittest.TestCase):
+    """
+    Tests "lobby_helpers.py" for coalescing lobby roster updates.
+    """
+
+    class Player:
+        def __init__(self, username):
+            self.username = username
+            self.messages = []
+
+        def get_user_information(self):
+            return lobby_pb2.UserInformation(username=self.username, moolah=100)
+
+        def send_message(self, message, key=None):
+            self.messages.append(message)
+
+    def test_burst_is_coalesced(self):
+        players = [self.Player(name) for name in ["foo", "bar", "baz"]]
+        roster = RosterService(lambda: players, window=0.05)
+        for _ in range(10):
+            roster.mark_dirty()
+        time.sleep(0.2)
+
+        for player in players:
+            self.assertEqual(len(player.messages), 1)
+        response = lobby_pb2.LobbyResponse.FromString(players[0].messages[0])
+        self.assertEqual(response.action, lobby_pb2.SHOW_LOBBY)
+        self.assertEqual(response.roster_version, 10)
+        self.assertEqual([u.username for u in response.user_info], ["foo", "bar", "baz"])
+
+    def test_flush_sends_immediately(self):
+        players = [self.Player("foo"), self.Player("bar")]
+        roster = RosterService(lambda: players, window=10)
+        roster.mark_dirty()
+        self.assertEqual(roster.flush(), 1)
+        self.assertEqual(len(players[0].messages), 1)
+        # nothing pending, nothing sent
+        self.assertIsNone(roster.flush())
+        self.assertEqual(len(players[1].messages), 1)
+
+
+class TestSpectatorFeed(unittest.TestCase):
+    """
+    Tests "lobby_helpers.py" spectator fan-out with drop-to-latest mailboxes.
+    """
+
+    def game_update(self, pot):
+        return lobby_pb2.LobbyResponse(
+            action=lobby_pb2.SHOW_GAME,
+            result=True,
+            game_state=lobby_pb2.GameState(players=["foo", "bar"], pot=pot),
+        )
+
+    def test_slow_spectator_gets_latest(self):
+        feed = SpectatorFeed()
+        mailbox = feed.subscribe()
+        for pot in range(1, 6):
+            feed.publish(self.game_update(pot))
+
+        # only the newest state is kept for a spectator that has not read
+        update = lobby_pb2.LobbyResponse.FromString(mailbox.get())
+        self.assertEqual(update.game_state.pot, 5)
+        self.assertEqual(mailbox.dropped, 4)
+
+    def test_new_spectator_gets_current_state(self):
+        feed = SpectatorFeed()
+        feed.publish(self.game_update(3))
+        mailbox = feed.subscribe()
+        update = lobby_pb2.LobbyResponse.FromString(mailbox.get())
+        self.assertEqual(update.game_state.pot, 3)
+
+    def test_many_spectators_share_bytes(self):
+        feed = SpectatorFeed()
+        mailboxes = [feed.subscribe() for _ in range(1000)]
+        feed.publish(self.game_update(7))
+        payloads = {id(mailbox.get()) for mailbox in mailboxes}
+        self.assertEqual(len(payloads), 1)
+
+    def test_end_of_game(self):
+        feed = SpectatorFeed()
+        mailbox = feed.subscribe()
+        feed.publish(self.game_update(4))
+        feed.end(lobby_pb2.LobbyResponse(action=lobby_pb2.KICK_PLAYER, result=True))
+        # the spectator hears the game ended, and late spectators get no stale table
+        update = lobby_pb2.LobbyResponse.FromString(mailbox.get())
+        self.assertEqual(update.action, lobby_pb2.KICK_PLAYER)
+        self.assertEqual(len(feed), 1)
+        late = feed.subscribe()
+        feed.publish(self.game_update(1))
+        self.assertEqual(lobby_pb2.LobbyResponse.FromString(late.get()).game_state.pot, 1)
+
+    def test_unsubscribe_closes_mailbox(self):
+        feed = SpectatorFeed()
+        mailbox = feed.subscribe()
+        feed.unsubscribe(mailbox)
+        self.assertEqual(len(feed), 0)
+        self.assertIsNone(mailbox.get())
+
+
+class TestTimeoutMove(unittest.TestCase):
+    """
+    Tests "lobby_helpers.py" moves made for players who run out of time.
+    """
+
+    class Player:
+        def __init__(self, current_bet):
+            self.current_bet = current_bet
+
+    def test_check_if_free(self):
+        move = timeout_move(self.Player(2), min_bet=2)
+        self.assertEqual(move.player_action, lobby_pb2.CHECK_CALL)
+
+    def test_fold_if_behind(self):
+        move = timeout_move(self.Player(1), min_bet=2)
+        self.assertEqual(move.player_action, lobby_pb2.FOLD)
+
+    def test_exchange_keeps_every_card(self):
+        # the exchange turn ends instead of checking, which would leave it open
+        move = timeout_move(self.Player(1), min_bet=2, exchanging=True)
+        self.assertEqual(move.action, lobby_pb2.PLAY_MOVE)
+        self.assertEqual(move.player_action, lobby_pb2.EXCHANGE)
+        self.assertFalse(any(move.card_exchange_idx))
+
+
+class TestTimerWheel(unittest.TestCase):
+    """
+    Tests "lobby_helpers.py" hashed timer wheel used for turn clocks.
+    """
+
+    def test_timer_fires_on_time(self):
+        wheel = TimerWheel(tick=1, num_slots=8)
+        fired = []
+        wheel.schedule(3, lambda: fired.append("a"))
+        wheel.advance()
+        wheel.advance()
+        self.assertEqual(fired, [])
+        wheel.advance()
+        self.assertEqual(fired, ["a"])
+
+    def test_timer_longer_than_wheel(self):
+        wheel = TimerWheel(tick=1, num_slots=4)
+        fired = []
+        wheel.schedule(10, lambda: fired.append("a"))
+        for _ in range(9):
+            wheel.advance()
+        self.assertEqual(fired, [])
+        wheel.advance()
+        self.assertEqual(fired, ["a"])
+        # fires only once
+        for _ in range(8):
+            wheel.advance()
+        self.assertEqual(fired, ["a"])
+
+    def test_cancel(self):
+        wheel = TimerWheel(tick=1, num_slots=8)
+        fired = []
+        handle = wheel.schedule(2, lambda: fired.append("a"))
+        wheel.schedule(2, lambda: fired.append("b"))
+        wheel.cancel(handle)
+        wheel.cancel(None)
+        wheel.advance()
+        wheel.advance()
+        self.assertEqual(fired, ["b"])
+
+    def test_many_timers(self):
+        wheel = TimerWheel(tick=1, num_slots=64)
+        fired = []
+        for seat in range(5000):
+            wheel.schedule(seat % 100 + 1, lambda seat=seat: fired.append(seat))
+        for _ in range(100):
+            wheel.advance()
+        self.assertEqual(len(fired), 5000)
+
+
+class TestOutboundBuffer(unittest.TestCase):
+    """
+    Tests "stream_helpers.py" bounded outbound buffers for slow clients.
+    """
+
+    def test_snapshots_collapse_to_latest(self):
+        buffer = OutboundBuffer(maxsize=4)
+        for i in range(100):
+            self.assertTrue(buffer.send_message(f"game{i}", lobby_pb2.SHOW_GAME))
+        self.assertEqual(len(buffer), 1)
+        self.assertEqual(buffer.get(), "game99")
+        self.assertEqual(buffer.stats()["collapsed"], 99)
+
+    def test_snapshots_do_not_jump_keyless_messages(self):
+        buffer = OutboundBuffer(maxsize=8)
+        buffer.send_message("game1", lobby_pb2.SHOW_GAME)
+        buffer.send_message("game2", lobby_pb2.SHOW_GAME)
+        buffer.put("kick")
+        buffer.send_message("game3", lobby_pb2.SHOW_GAME)
+        self.assertEqual(
+            [buffer.get() for _ in range(3)], ["game2", "kick", "game3"]
+        )
+
+    def test_overflow_closes_buffer(self):
+        buffer = OutboundBuffer(maxsize=2)
+        self.assertTrue(buffer.send_message("a"))
+        self.assertTrue(buffer.send_message("b"))
+        self.assertFalse(buffer.send_message("c"))
+        self.assertTrue(buffer.overflowed)
+        self.assertIsNone(buffer.get())
+        self.assertFalse(buffer.send_message("d"))
+
+    def test_close_drains_queued_messages(self):
+        buffer = OutboundBuffer(maxsize=8)
+        buffer.put("reply")
+        buffer.put("kick")
+        buffer.close()
+        self.assertFalse(buffer.send_message("late"))
+        self.assertEqual([buffer.get() for _ in range(3)], ["reply", "kick", None])
+
+    def test_stats(self):
+        buffer = OutboundBuffer(maxsize=8, name="foo")
+        buffer.put("a")
+        buffer.put("b")
+        buffer.get()
+        stats = buffer.stats()
+        self.assertEqual(stats["name"], "foo")
+        self.assertEqual(stats["depth"], 1)
+        self.assertEqual(stats["max_depth"], 2)
+        self.assertEqual(stats["sent"], 1)
+
+
+class TestStreamTracker(unittest.TestCase):
+    """
+    Tests "stream_helpers.py" stream lifecycle tracking and reaping.
+    """
+
+    class Context:
+        def __init__(self):
+            self.active = True
+            self.callbacks = []
+
+        def is_active(self):
+            return self.active
+
+        def add_callback(self, callback):
+            self.callbacks.append(callback)
+
+        def cancel(self):
+            self.active = False
+            for callback in self.callbacks:
+                callback()
+
+    def test_cancel_wakes_stream(self):
+        streams = StreamTracker()
+        buffer = OutboundBuffer()
+        context = self.Context()
+        streams.open(buffer, context)
+        self.assertEqual(streams.gauge()["open"], 1)
+
+        # a blocked response loop is released when the client disconnects
+        results = []
+        thread = threading.Thread(target=lambda: results.append(buffer.get()))
+        thread.start()
+        context.cancel()
+        thread.join(timeout=1)
+        self.assertFalse(thread.is_alive())
+        self.assertEqual(results, [None])
+
+        self.assertEqual(streams.gauge()["leaked"], 1)
+        streams.close(buffer)
+        self.assertEqual(streams.gauge(), {"open": 0, "leaked": 0, "opened": 1, "reaped": 0})
+
+    def test_requests_done_closes_buffer(self):
+        streams = StreamTracker()
+        buffer = OutboundBuffer()
+        streams.open(buffer, self.Context())
+        streams.requests_done(buffer)
+        self.assertIsNone(buffer.get())
+
+    def test_reap_dead_and_idle(self):
+        streams = StreamTracker(idle_timeout=0.05)
+        dead, idle, live = OutboundBuffer(), OutboundBuffer(), OutboundBuffer()
+        dead_context = self.Context()
+        streams.open(dead, dead_context)
+        streams.open(idle, self.Context())
+        streams.open(live, self.Context())
+        # the RPC ended without the callback closing the buffer
+        dead_context.active = False
+        time.sleep(0.1)
+        streams.touch(live)
+
+        self.assertEqual(streams.gauge()["leaked"], 2)
+        self.assertEqual(streams.reap(), 2)
+        self.assertTrue(dead.closed)
+        self.assertTrue(idle.closed)
+        self.assertFalse(live.closed)
+        # reaped streams are ended with an error, so their clients reconnect
+        self.assertTrue(idle.reaped)
+        self.assertFalse(live.reaped)
+        # already closed streams are not reaped twice
+        self.assertEqual(streams.reap(), 0)
+
+
+class TestGameOutbox(unittest.TestCase):
+    """
+    Tests "lobby_helpers.py" durable outbox for game results, and that main
+    only applies a batch once.
+    """
+
+    outbox_path = "data/lobbies/test_outbox.db"
+    db_path = "data/r1/test_outbox_poker.db"
+
+    def setUp(self):
+        for path in [self.outbox_path, self.db_path]:
+            for suffix in ["", "-wal", "-shm"]:
+                if os.path.exists(path + suffix):
+                    os.remove(path + suffix)
+        self.sent = []
+
+    tearDown = setUp
+
+    def batch(self, money_won=10):
+        return main_pb2.MainRequest(
+            action=main_pb2.SAVE_GAME_BATCH,
+            game_results=[
+                main_pb2.GameHistoryEntry(game_type=1, money_won=money_won, player="foo")
+            ],
+        )
+
+    def test_drain_retry_and_ack(self):
+        outbox = GameOutbox(self.outbox_path, self.sent.append, retry_after=0.05)
+        request_id = outbox.add(self.batch())
+        self.assertEqual(outbox.drain(), 1)
+        self.assertEqual(self.sent[0].request_id, request_id)
+
+        # not resent until the backoff expires
+        self.assertEqual(outbox.drain(), 0)
+        time.sleep(0.1)
+        self.assertEqual(outbox.drain(), 1)
+
+        outbox.ack(request_id)
+        self.assertEqual(outbox.pending(), 0)
+        time.sleep(0.2)
+        self.assertEqual(outbox.drain(), 0)
+
+    def test_survives_restart(self):
+        outbox = GameOutbox(self.outbox_path, self.sent.append)
+        request_id = outbox.add(self.batch())
+        outbox.sqlcon.close()
+
+        outbox = GameOutbox(self.outbox_path, self.sent.append)
+        self.assertEqual(outbox.pending(), 1)
+        outbox.drain()
+        self.assertEqual(self.sent[0].request_id, request_id)
+        outbox.sqlcon.close()
+
+    def test_retried_batch_applied_once(self):
+        structure_tables(self.db_path)
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("INSERT INTO users (username, passhash) VALUES ('foo', 'x')")
+        conn.commit()
+
+        request = self.batch(money_won=25)
+        request.request_id = "batch-1"
+        storage = Storage(self.db_path)
+        self.assertTrue(storage.save_games(request.game_results, request.request_id))
+        self.assertFalse(storage.save_games(request.game_results, request.request_id))
+
+        self.assertEqual(
+            conn.execute("SELECT moolah FROM users WHERE username='foo'").fetchone()[0], 525
+        )
+        self.assertEqual(conn.execute("SELECT COUNT(*) FROM game_history").fetchone()[0], 1)
+        conn.close()
+
+
+class TestLeaderboard(unittest.TestCase):
+    """
+    Tests "leaderboard_helpers.py" rankings, and that Storage keeps them in step with the database.
+    """
+
+    db_path = "data/r1/test_leaderboard_poker.db"
+
+    def setUp(self):
+        reset_database([self.db_path])
+        structure_tables(self.db_path)
+
+    def tearDown(self):
+        reset_database([self.db_path])
+
+    def test_ranking(self):
+        ranking = Ranking([("a", 5), ("b", 7)])
+        ranking.set("c", 7)
+        ranking.set("a", 9)
+        # ties are broken by username
+        self.assertEqual(ranking.top(10), [("a", 9), ("b", 7), ("c", 7)])
+        self.assertEqual(ranking.top(1), [("a", 9)])
+        ranking.remove("b")
+        ranking.remove("nobody")
+        self.assertEqual(ranking.top(10), [("a", 9), ("c", 7)])
+        self.assertEqual(len(ranking), 2)
+
+    def test_incremental_matches_rebuild(self):
+        storage = Storage(self.db_path)
+        for i in range(20):
+            storage.register(f"p{i}", "hash")
+        for _ in range(50):
+            players = random.sample(range(20), 3)
+            storage.save_games(
+                [
+                    main_pb2.GameHistoryEntry(
+                        game_type=random.choice([1, 2]),
+                        money_won=random.randint(-100, 100),
+                        player=f"p{i}",
+                    )
+                    for i in players
+                ]
+            )
+        storage.delete_account("p0", "hash")
+
+        rebuilt = Storage(self.db_path)
+        rebuilt.load()
+        for board, game_type in [
+            (main_pb2.MOOLAH, main_pb2.NONE),
+            (main_pb2.NET_WINNINGS, main_pb2.NONE),
+            (main_pb2.NET_WINNINGS, main_pb2.TEXAS),
+            (main_pb2.NET_WINNINGS, main_pb2.FIVE_HAND),
+        ]:
+            top = storage.leaderboard.top(board, game_type, 100)
+            self.assertEqual(top, rebuilt.leaderboard.top(board, game_type, 100))
+            self.assertNotIn("p0", [username for username, _ in top])
+
+    def test_top_k_bounds(self):
+        leaderboard = Leaderboard()
+        leaderboard.load([(f"p{i}", i) for i in range(500)], [])
+        self.assertEqual(len(leaderboard.top(main_pb2.MOOLAH)), 10)
+        self.assertEqual(len(leaderboard.top(main_pb2.MOOLAH, k=1000)), 100)
+        self.assertEqual(leaderboard.top(main_pb2.MOOLAH, k=1), [("p499", 499)])
+
+
+class TestStorage(unittest.TestCase):
+    """
+    Tests "storage_helpers.py" typed queries and per-thread connections.
+    """
+
+    db_path = "data/r1/test_storage_poker.db"
+
+    def setUp(self):
+        reset_database([self.db_path])
+        structure_tables(self.db_path)
+        self.storage = Storage(self.db_path)
+
+    def tearDown(self):
+        self.storage.close()
+        reset_database([self.db_path])
+
+    def test_register_and_login(self):
+        user_id = self.storage.register("foo", "hash")
+        self.assertIsNotNone(user_id)
+        self.assertIsNone(self.storage.register("foo", "other"))
+        self.assertTrue(self.storage.username_exists("foo"))
+        self.assertEqual(self.storage.check_login("foo", "hash"), (user_id, 500))
+        self.assertIsNone(self.storage.check_login("foo", "wrong"))
+
+        self.assertFalse(self.storage.delete_account("foo", "wrong"))
+        self.assertTrue(self.storage.delete_account("foo", "hash"))
+        self.assertFalse(self.storage.username_exists("foo"))
+
+    def test_ledger(self):
+        user_id = self.storage.register("foo", "hash")
+        self.assertEqual(self.storage.load_money("foo", 100, "t1"), 600)
+        # the same transaction again is a no-op
+        self.assertEqual(self.storage.load_money("foo", 100, "t1"), 600)
+        self.assertIsNone(self.storage.load_money("ghost", 100, "t2"))
+        for amount in [0, -100, MAX_LOAD_MONEY + 1]:
+            self.assertIsNone(self.storage.load_money("foo", amount, "t4"))
+
+        entry = main_pb2.GameHistoryEntry(game_type=1, money_won=-50, player="foo")
+        self.assertTrue(self.storage.save_games([entry], "g1"))
+        self.assertFalse(self.storage.save_games([entry], "g1"))
+        self.assertEqual(self.storage.get_moolah(user_id), 550)
+        self.assertEqual(self.storage.ledger_balance(user_id), 550)
+        self.assertEqual(len(self.storage.history_page(user_id)[0]), 1)
+
+        # deleting closes the balance
+        self.assertTrue(self.storage.delete_account("foo", "hash"))
+        self.assertEqual(self.storage.ledger_balance(user_id), 0)
+
+        # entries cannot be changed or removed
+        conn = sqlite3.connect(self.db_path)
+        with self.assertRaises(sqlite3.IntegrityError):
+            conn.execute("UPDATE ledger SET amount=0")
+        with self.assertRaises(sqlite3.IntegrityError):
+            conn.execute("DELETE FROM ledger")
+        conn.close()
+
+    def test_deleted_account_session(self):
+        user_id = self.storage.register("alice", "hash")
+        session = ("alice", user_id)
+        self.assertEqual(self.storage.check_session(session), session)
+        self.assertTrue(self.storage.delete_account("alice", "hash"))
+        # ids are never given out again, so alice's token cannot read bob's account
+        bob_id = self.storage.register("bob", "hash")
+        self.assertNotEqual(bob_id, user_id)
+        self.assertIsNone(self.storage.check_session(session))
+        # nor a new account that takes the same username
+        self.storage.register("alice", "hash")
+        self.assertIsNone(self.storage.check_session(session))
+        self.assertIsNone(self.storage.check_session(("alice", bob_id)))
+        self.assertIsNone(self.storage.check_session(None))
+
+    def test_history_pages(self):
+        user_id = self.storage.register("foo", "hash")
+        self.storage.save_games(
+            [main_pb2.GameHistoryEntry(game_type=1, money_won=i, player="foo") for i in range(45)]
+        )
+
+        games, cursor = self.storage.history_page(user_id)
+        self.assertEqual(len(games), DEFAULT_PAGE_SIZE)
+        self.assertEqual(games[0][1], 44)
+
+        # walking every page returns every game once, newest first
+        won, cursor = [], ""
+        while True:
+            games, cursor = self.storage.history_page(user_id, cursor, page_size=7)
+            won += [money_won for _, money_won, _ in games]
+            if not cursor:
+                break
+        self.assertEqual(won, list(range(44, -1, -1)))
+
+        self.assertEqual(len(self.storage.history_page(user_id, page_size=1000)[0]), 45)
+        self.assertIsNone(self.storage.history_page(user_id, "bad"))
+        # out of SQLite's integer range
+        self.assertIsNone(self.storage.history_page(user_id, make_cursor(2**63)))
+        self.assertIsNone(self.storage.history_page(user_id, make_cursor(0)))
+
+    def test_player_stats(self):
+        user_id = self.storage.register("foo", "hash")
+        won = [random.randint(-100, 100) for _ in range(30)]
+        for money_won in won:
+            self.storage.save_games(
+                [main_pb2.GameHistoryEntry(game_type=1, money_won=money_won, player="foo")]
+            )
+        self.assertEqual(
+            self.storage.player_stats(user_id),
+            [(main_pb2.TEXAS, 30, sum(w > 0 for w in won), sum(won), max(max(won), 0))],
+        )
+
+        self.storage.delete_account("foo", "hash")
+        self.assertEqual(self.storage.player_stats(user_id), [])
+
+    def test_user_cache(self):
+        user_id = self.storage.register("foo", "hash")
+        self.storage.users.clear()
+
+        self.assertEqual(self.storage.check_login("foo", "hash"), (user_id, 500))
+        self.assertEqual(self.storage.get_moolah(user_id), 500)
+        self.assertEqual(self.storage.users.stats()["hits"], 1)
+
+        # written through by the commit, not read back
+        self.storage.save_games([main_pb2.GameHistoryEntry(game_type=1, money_won=50, player="foo")])
+        self.assertEqual(self.storage.users.get("foo"), (user_id, "hash", 550))
+        self.storage.delete_account("foo", "hash")
+        self.assertIsNone(self.storage.users.get("foo"))
+        self.assertFalse(self.storage.username_exists("foo"))
+
+    def test_user_cache_eviction(self):
+        storage = Storage(self.db_path, user_cache_size=2)
+        for username in ["a", "b", "c"]:
+            storage.register(username, "hash")
+        self.assertIsNone(storage.users.get("a"))
+        self.assertEqual(storage.users.stats()["evictions"], 1)
+
+        # a miss is read from the database and cached again
+        self.assertIsNotNone(storage.check_login("a", "hash"))
+        self.assertIsNotNone(storage.users.get("a"))
+        self.assertIsNone(storage.users.get("b"))
+
+    def test_username_filter(self):
+        self.storage.register("foo", "hash")
+        self.storage.load()
+        self.storage.register("bar", "hash")
+        self.assertIn("foo", self.storage.usernames)
+        self.assertIn("bar", self.storage.usernames)
+
+        # a definite negative is answered without a lookup
+        misses = self.storage.users.stats()["misses"]
+        self.assertFalse(self.storage.username_exists("nobody"))
+        self.assertEqual(self.storage.users.stats()["misses"], misses)
+        self.assertTrue(self.storage.username_exists("bar"))
+
+        # deleted usernames stay in the filter, the database has the last word
+        self.storage.delete_account("foo", "hash")
+        self.assertFalse(self.storage.username_exists("foo"))
+
+    def test_bloom_filter(self):
+        bloom = BloomFilter(capacity=1000, error_rate=0.01, items=[f"user{i}" for i in range(1000)])
+        self.assertTrue(all(f"user{i}" in bloom for i in range(1000)))
+        false_positives = sum(f"other{i}" in bloom for i in range(10000))
+        self.assertLess(false_positives, 300)
+
+    def test_connection_per_thread(self):
+        conn = self.storage.connection()
+        self.assertIs(self.storage.connection(), conn)
+
+        other = []
+        thread = threading.Thread(target=lambda: other.append(self.storage.connection()))
+        thread.start()
+        thread.join()
+        self.assertIsNot(other[0], conn)
+
+    def test_group_commit(self):
+        storage = Storage(self.db_path, commit_window=0.05)
+        threads = [
+            threading.Thread(target=storage.register, args=(f"p{i}", "hash")) for i in range(10)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertTrue(all(storage.username_exists(f"p{i}") for i in range(10)))
+        self.assertLess(storage.commits, 10)
+
+    def test_failed_write_keeps_group(self):
+        def fail(conn, changes):
+            conn.execute("INSERT INTO users (username, passhash) VALUES ('bar', 'x')")
+            raise ValueError("bad write")
+
+        storage = Storage(self.db_path, commit_window=0.05)
+        thread = threading.Thread(target=storage.register, args=("foo", "hash"))
+        thread.start()
+        with self.assertRaises(ValueError):
+            storage.write(fail)
+        thread.join()
+        self.assertTrue(storage.username_exists("foo"))
+        self.assertFalse(storage.username_exists("bar"))
+
+    def test_reconnects_to_replaced_file(self):
+        self.storage.register("foo", "hash")
+        reset_database([self.db_path])
+        structure_tables(self.db_path)
+
+        # the new file is empty, and what was cached from the old one is dropped
+        self.assertIsNotNone(self.storage.register("foo", "other"))
+        self.assertIsNone(self.storage.check_login("foo", "hash"))
+        self.assertEqual(self.storage.leaderboard.top(main_pb2.MOOLAH), [("foo", 500)])
+
+
+class TestSchemaMigrations(unittest.TestCase):
+    """
+    Tests "schema_helpers.py" versioned migrations.
+    """
+
+    db_path = "data/r1/test_schema_poker.db"
+
+    def setUp(self):
+        if os.path.exists(self.db_path):
+            os.remove(self.db_path)
+
+    tearDown = setUp
+
+    def test_fresh_database(self):
+        self.assertEqual(migrate(self.db_path), list(range(1, LATEST_VERSION + 1)))
+        self.assertEqual(migrate(self.db_path), [])
+
+        conn = sqlite3.connect(self.db_path)
+        plan = conn.execute(
+            "EXPLAIN QUERY PLAN SELECT user_id FROM users WHERE username=?", ("foo",)
+        ).fetchall()
+        self.assertIn("users_username", str(plan))
+        plan = conn.execute(
+            "EXPLAIN QUERY PLAN SELECT game_type, money_won FROM game_history "
+            "WHERE player_id=? ORDER BY game_date DESC",
+            (1,),
+        ).fetchall()
+        self.assertIn("game_history_player_date", str(plan))
+        conn.close()
+
+    def test_upgrade_in_place(self):
+        # a replica made before migrations, with a duplicate username and no saved_games
+        conn = sqlite3.connect(self.db_path)
+        conn.execute(
+            "CREATE TABLE users (user_id INTEGER PRIMARY KEY, username TEXT NOT NULL, "
+            "passhash TEXT NOT NULL, moolah INTEGER DEFAULT 500)"
+        )
+        conn.execute(
+            "CREATE TABLE game_history (game_id INTEGER PRIMARY KEY, player_id INTEGER NOT NULL, "
+            "money_won INTEGER DEFAULT 0, game_type TEXT NOT NULL, "
+            "game_date DATETIME DEFAULT CURRENT_TIMESTAMP)"
+        )
+        conn.execute("INSERT INTO users (username, passhash) VALUES ('foo', 'a')")
+        conn.execute("INSERT INTO users (username, passhash) VALUES ('foo', 'b')")
+        conn.execute("INSERT INTO game_history (player_id, game_type) VALUES (1, '5 CARD')")
+        conn.execute(
+            "INSERT INTO game_history (player_id, game_type, money_won) VALUES (2, 'TEXAS HOLD EM', 40)"
+        )
+        # games of an account deleted before the upgrade
+        conn.execute("INSERT INTO game_history (player_id, game_type) VALUES (5, '5 CARD')")
+        conn.commit()
+
+        migrate(self.db_path)
+        # the duplicate's games and winnings moved to the first account
+        self.assertEqual(conn.execute("SELECT passhash, moolah FROM users").fetchall(), [("a", 540)])
+        self.assertEqual(
+            conn.execute(
+                "SELECT game_type, games, net_winnings FROM player_stats WHERE player_id=1 "
+                "ORDER BY game_type"
+            ).fetchall(),
+            [("5 CARD", 1, 0), ("TEXAS HOLD EM", 1, 40)],
+        )
+        self.assertEqual(conn.execute("SELECT COUNT(*) FROM game_history").fetchone()[0], 3)
+        self.assertEqual(conn.execute("SELECT COUNT(*) FROM saved_games").fetchone()[0], 0)
+        # the deleted account's id is not given out again
+        conn.execute("INSERT INTO users (username, passhash) VALUES ('bar', 'c')")
+        self.assertEqual(
+            conn.execute("SELECT user_id FROM users WHERE username='bar'").fetchone()[0], 6
+        )
+        conn.execute("DELETE FROM users WHERE username='bar'")
+        # existing balances open the ledger
+        self.assertEqual(
+            conn.execute("SELECT txn_id, user_id, amount FROM ledger").fetchall(),
+            [("opening:1", 1, 540)],
+        )
+        with self.assertRaises(sqlite3.IntegrityError):
+            conn.execute("INSERT INTO users (username, passhash) VALUES ('foo', 'c')")
+        conn.close()
+
+
+class TestLeaderDiscovery(unittest.TestCase):
+    """
+    Tests "leader_helpers.py" parallel leader discovery.
+    """
+
+    servers = ["127.0.0.1:1", "127.0.0.1:2", "127.0.0.1:3"]
+
+    def discovery(self, answers, **kwargs):
+        discovery = LeaderDiscovery(self.servers, **kwargs)
+        self.probes = []
+
+        def probe(server):
+            self.probes.append(server)
+            return answers.get(server, "")
+
+        discovery.probe = probe
+        return discovery
+
+    def test_only_leader_confirms(self):
+        # a follower still pointing at a dead leader is ignored
+        discovery = self.discovery(
+            {"127.0.0.1:1": "127.0.0.1:9", "127.0.0.1:2": "127.0.0.1:3", "127.0.0.1:3": "127.0.0.1:3"}
+        )
+        self.assertEqual(discovery.find_leader(), "127.0.0.1:3")
+        self.assertEqual(discovery.leader, "127.0.0.1:3")
+
+    def test_cached_leader_probed_first(self):
+        discovery = self.discovery({"127.0.0.1:2": "127.0.0.1:2"})
+        discovery.leader = "127.0.0.1:2"
+        self.assertEqual(discovery.find_leader(), "127.0.0.1:2")
+        self.assertEqual(self.probes, ["127.0.0.1:2"])
+
+    def test_hint_probed_first(self):
+        discovery = self.discovery({"127.0.0.1:3": "127.0.0.1:3"})
+        self.assertEqual(discovery.discover(hint="127.0.0.1:3"), "127.0.0.1:3")
+        self.assertEqual(self.probes, ["127.0.0.1:3"])
+
+    def test_unknown_hint_ignored(self):
+        # a hint outside the replica list has no channel, real probes are used
+        discovery = LeaderDiscovery(
+            self.servers, probe_timeout=0.05, initial_backoff=0.01, max_backoff=0.02
+        )
+        self.assertIsNone(discovery.discover(deadline=0.1, hint="127.0.0.1:9"))
+        self.assertIsNone(discovery.leader)
+
+    def test_gives_up_after_deadline(self):
+        discovery = self.discovery({}, initial_backoff=0.01, max_backoff=0.02)
+        start = time.monotonic()
+        self.assertIsNone(discovery.discover(deadline=0.1))
+        self.assertLess(time.monotonic() - start, 1)
+        # retried several rounds with backoff
+        self.assertGreater(len(self.probes), len(self.servers))
+
+    def test_not_leader_redirect(self):
+        # a follower rejects a write with the leader's address in trailing metadata
+        class Follower(main_pb2_grpc.MainServiceServicer):
+            def Main(self, request_iterator, context):
+                for req in request_iterator:
+                    reject_not_leader(context, "127.0.0.1:9", req)
+                    yield main_pb2.MainResponse()
+
+        server = grpc.server(futures.ThreadPoolExecutor(max_workers=2))
+        main_pb2_grpc.add_MainServiceServicer_to_server(Follower(), server)
+        port = server.add_insecure_port("127.0.0.1:0")
+        server.start()
+        try:
+            with grpc.insecure_channel(f"127.0.0.1:{port}") as channel:
+                stub = main_pb2_grpc.MainServiceStub(channel)
+                request = main_pb2.MainRequest(
+                    action=main_pb2.REGISTER, username="foo", passhash="secret"
+                )
+                with self.assertRaises(grpc.RpcError) as error:
+                    list(stub.Main(iter([request])))
+            hint, rejected = leader_hint(error.exception)
+            self.assertEqual(hint, "127.0.0.1:9")
+            # the password hash is not sent back
+            self.assertEqual(rejected, main_pb2.MainRequest(action=main_pb2.REGISTER, username="foo"))
+            self.assertEqual(without_credentials(request), rejected)
+        finally:
+            server.stop(0)
+
+
+class TestFollowerReads(unittest.TestCase):
+    """
+    Tests "leader_helpers.py" leader leases and reads served by followers.
+    """
+
+    def test_lease(self):
+        lease = LeaderLease(0.25)
+        self.assertFalse(lease.valid(now=0))
+        # runs from the start of the heartbeat round, not its end
+        lease.renew(10)
+        self.assertTrue(lease.valid(now=10.2))
+        self.assertFalse(lease.valid(now=10.25))
+        lease.renew(10)
+        lease.revoke()
+        self.assertFalse(lease.valid(now=10.1))
+
+    def test_stale_reads_bounded(self):
+        reads = FollowerReads(max_staleness=1)
+        no_index = lambda: self.fail("stale reads do not ask the leader")
+        # never heard from a leader
+        self.assertFalse(reads.can_read(main_pb2.CHECK_USERNAME, no_index, now=0))
+        reads.heard_from_leader(3, now=10)
+        self.assertTrue(reads.can_read(main_pb2.CHECK_USERNAME, no_index, now=10.5))
+        self.assertTrue(reads.can_read(main_pb2.GET_LEADERBOARD, no_index, now=11))
+        self.assertFalse(reads.can_read(main_pb2.CHECK_USERNAME, no_index, now=11.5))
+
+    def test_linearizable_read_applied(self):
+        reads = FollowerReads()
+        reads.heard_from_leader(5)
+        self.assertTrue(reads.can_read(main_pb2.VIEW_HISTORY, lambda: 5))
+        self.assertTrue(reads.can_read(main_pb2.GET_USER_INFO, lambda: 4))
+
+    def test_linearizable_read_waits(self):
+        # the read waits for the next heartbeat to apply the leader's entries
+        reads = FollowerReads(read_timeout=2)
+        reads.heard_from_leader(1)
+        timer = threading.Timer(0.05, reads.heard_from_leader, args=(3,))
+        timer.start()
+        start = time.monotonic()
+        self.assertTrue(reads.can_read(main_pb2.GET_STATS, lambda: 3))
+        self.assertLess(time.monotonic() - start, 1)
+        timer.join()
+
+    def test_linearizable_read_times_out(self):
+        reads = FollowerReads(read_timeout=0.05)
+        reads.heard_from_leader(1)
+        self.assertFalse(reads.can_read(main_pb2.VIEW_HISTORY, lambda: 2))
+
+    def test_no_read_index(self):
+        # no leader, or its lease expired, so the read goes to the leader
+        reads = FollowerReads()
+        reads.heard_from_leader(5)
+        self.assertFalse(reads.can_read(main_pb2.VIEW_HISTORY, lambda: None))
+
+    def test_missed_round_then_read(self):
+        leader_log = [
+            raft_pb2.LogEntry(action=raft_pb2.REGISTER, username=f"p{i}", term=1)
+            for i in range(4)
+        ]
+        # the follower missed the heartbeat that carried entries 2 and 3
+        follower_log = leader_log[:2]
+        reads = FollowerReads(read_timeout=0.05)
+        reads.heard_from_leader(len(follower_log) - 1)
+        read_index = lambda: len(leader_log) - 1
+        self.assertFalse(reads.can_read(main_pb2.VIEW_HISTORY, read_index))
+
+        # the next heartbeat brings it level with the leader's read index
+        new_entries = missing_entries(follower_log, leader_log)
+        self.assertEqual(new_entries, leader_log[2:])
+        follower_log.extend(new_entries)
+        reads.heard_from_leader(len(follower_log) - 1)
+        self.assertTrue(reads.can_read(main_pb2.VIEW_HISTORY, read_index))
+        self.assertEqual(missing_entries(follower_log, leader_log), [])
+
+    def test_diverged_log_not_applied(self):
+        leader_log = [raft_pb2.LogEntry(username="a", term=1), raft_pb2.LogEntry(username="b", term=2)]
+        stale = raft_pb2.LogEntry(username="c", term=1)
+        self.assertIsNone(missing_entries([leader_log[0], stale], leader_log))
+        self.assertIsNone(missing_entries(leader_log + [stale], leader_log))
+
+    def test_writes_never_served(self):
+        reads = FollowerReads()
+        reads.heard_from_leader(5)
+        self.assertFalse(reads.can_read(main_pb2.REGISTER, lambda: 5))
+
+    def test_replica_reads_round_robin(self):
+        # a follower serves one read and rejects the next, which the caller sends to the leader
+        class Replica(main_pb2_grpc.MainServiceServicer):
+            def __init__(self, serve):
+                self.serve = serve
+                self.reads = 0
+
+            def Read(self, request, context):
+                self.reads += 1
+                if not self.serve:
+                    reject_not_leader(context, "127.0.0.1:9", request)
+                return main_pb2.MainResponse(action=request.action, result=True)
+
+        replicas = [Replica(True), Replica(False)]
+        servers = []
+        addresses = []
+        for replica in replicas:
+            server = grpc.server(futures.ThreadPoolExecutor(max_workers=2))
+            main_pb2_grpc.add_MainServiceServicer_to_server(replica, server)
+            port = server.add_insecure_port("127.0.0.1:0")
+            server.start()
+            servers.append(server)
+            addresses.append(f"127.0.0.1:{port}")
+        try:
+            reads = ReplicaReads(addresses)
+            request = main_pb2.MainRequest(action=main_pb2.CHECK_USERNAME, username="foo")
+            response = reads.read(request)
+            self.assertTrue(response.result)
+            self.assertIsNone(reads.read(request))
+            self.assertEqual([replica.reads for replica in replicas], [1, 1])
+        finally:
+            for server in servers:
+                server.stop(None)
+
+
+class TestLobbyRegistry(unittest.TestCase):
+    """
+    Tests "lobby_helpers.py" registry of lobby heartbeats kept by main.
+    """
+
+    def status(self, lobby_id, seats_free=4, active=False, game_type=main_pb2.TEXAS):
+        return main_pb2.LobbyStatus(
+            lobby_id=lobby_id, game_type=game_type, seats_free=seats_free, active=active
+        )
+
+    def test_find_by_game_type(self):
+        registry = LobbyRegistry()
+        registry.heartbeat(self.status(0, game_type=main_pb2.FIVE_HAND))
+        registry.heartbeat(self.status(1))
+        self.assertEqual(registry.find(main_pb2.TEXAS).lobby_id, 1)
+        self.assertEqual(registry.find(main_pb2.FIVE_HAND).lobby_id, 0)
+
+    def test_full_or_active_not_joinable(self):
+        registry = LobbyRegistry()
+        registry.heartbeat(self.status(0))
+        registry.heartbeat(self.status(0, seats_free=0))
+        self.assertIsNone(registry.find(main_pb2.TEXAS))
+        registry.heartbeat(self.status(0, active=True))
+        self.assertIsNone(registry.find(main_pb2.TEXAS))
+        # a player left after the game ended
+        registry.heartbeat(self.status(0, seats_free=1))
+        self.assertEqual(registry.find(main_pb2.TEXAS).lobby_id, 0)
+        self.assertEqual(len(registry), 1)
+
+    def test_stale_lobbies_evicted(self):
+        registry = LobbyRegistry(ttl=10)
+        registry.heartbeat(self.status(0), now=0)
+        registry.heartbeat(self.status(1), now=5)
+        # lobby 0 missed its heartbeats, lobby 1 did not
+        self.assertEqual(registry.find(main_pb2.TEXAS, now=12).lobby_id, 1)
+        self.assertEqual(len(registry), 1)
+
+        registry.heartbeat(self.status(2, seats_free=0), now=5)
+        self.assertEqual(registry.sweep(now=20), 2)
+        self.assertEqual(len(registry), 0)
+
+
+class TestSeatReservations(unittest.TestCase):
+    """
+    Tests seat reservations in "lobby_helpers.py" and the tokens for them in "token_helpers.py".
+    """
+
+    def test_reserved_seats_not_given_twice(self):
+        registry = LobbyRegistry()
+        registry.heartbeat(main_pb2.LobbyStatus(lobby_id=0, seats_free=2), now=0)
+        self.assertTrue(registry.reserve(0, "foo", ttl=10, now=0))
+        self.assertEqual(registry.find(0, now=1).seats_free, 1)
+        self.assertTrue(registry.reserve(0, "bar", ttl=10, now=1))
+        self.assertFalse(registry.reserve(0, "baz", ttl=10, now=1))
+
+        # a heartbeat sent before either player connected keeps the seats taken
+        registry.heartbeat(main_pb2.LobbyStatus(lobby_id=0, seats_free=2), now=2)
+        self.assertIsNone(registry.find(0, now=2))
+
+        # foo took their seat, bar's reservation expired
+        registry.heartbeat(main_pb2.LobbyStatus(lobby_id=0, seats_free=1, players=["foo"]), now=12)
+        self.assertEqual(registry.find(0, now=12).seats_free, 1)
+
+    def test_tokens(self):
+        token = make_token("secret", ["seat", 1, "foo"], ttl=10, now=0)
+        self.assertEqual(read_token("secret", token, now=5), ["seat", 1, "foo"])
+        # expired, forged and malformed tokens are rejected
+        self.assertIsNone(read_token("secret", token, now=11))
+        self.assertIsNone(read_token("other", token, now=5))
+        self.assertIsNone(read_token("secret", token.replace(".", "x."), now=5))
+        self.assertIsNone(read_token("secret", "", now=5))
+
+
+class TestHeartbeat(unittest.TestCase):
+    """
+    Tests "lobby_helpers.py" heartbeats pushed from lobbies to main.
+    """
+
+    def test_changes_sent_immediately(self):
+        sent = []
+        heartbeat = Heartbeat(lambda: len(sent), sent.append, interval=60)
+        heartbeat.start()
+        time.sleep(0.05)
+        heartbeat.changed()
+        time.sleep(0.05)
+        self.assertEqual(sent, [0, 1])
+
+    def test_unreachable_main(self):
+        def send(status):
+            raise ConnectionError("No leader yet.")
+
+        heartbeat = Heartbeat(lambda: None, send)
+        self.assertFalse(heartbeat.beat())
+
+
+class TestMatchmaker(unittest.TestCase):
+    """
+    Tests "lobby_helpers.py" batch matchmaking queue.
+    """
+
+    def setUp(self):
+        self.registry = LobbyRegistry(ttl=60)
+        self.seats = []
+        self.matchmaker = Matchmaker(
+            self.registry, lambda username, lobby: self.seats.append((username, lobby.lobby_id))
+        )
+
+    def lobby(self, lobby_id, seats_free=4, game_type=main_pb2.TEXAS):
+        self.registry.heartbeat(
+            main_pb2.LobbyStatus(lobby_id=lobby_id, game_type=game_type, seats_free=seats_free),
+            now=0,
+        )
+
+    def test_batches_spread_over_lobbies(self):
+        self.lobby(0)
+        self.lobby(1)
+        for i in range(6):
+            self.matchmaker.add(f"p{i}", main_pb2.TEXAS, now=i)
+        self.matchmaker.form_tables(now=10)
+        # longest waiting first, a full table before the next lobby is used
+        self.assertEqual(
+            self.seats,
+            [("p0", 0), ("p1", 0), ("p2", 0), ("p3", 0), ("p4", 1), ("p5", 1)],
+        )
+        self.assertEqual(self.matchmaker.stats()["waiting"], 0)
+
+    def test_table_needs_two_players(self):
+        self.lobby(0)
+        self.matchmaker.add("p0", main_pb2.TEXAS, now=0)
+        self.matchmaker.form_tables(now=1)
+        self.assertEqual(self.seats, [])
+
+        # someone already waiting at the table counts
+        self.lobby(0, seats_free=3)
+        self.matchmaker.form_tables(now=2)
+        self.assertEqual(self.seats, [("p0", 0)])
+
+    def test_queues_by_game_type_and_stake(self):
+        self.lobby(0)
+        self.matchmaker.add("p0", main_pb2.TEXAS, stake=100, now=0)
+        self.matchmaker.add("p1", main_pb2.TEXAS, stake=500, now=0)
+        self.matchmaker.add("p2", main_pb2.FIVE_HAND, stake=100, now=0)
+        self.matchmaker.form_tables(now=1)
+        self.assertEqual(self.seats, [])
+
+    def test_removed_players_skipped(self):
+        self.lobby(0)
+        for i in range(3):
+            self.matchmaker.add(f"p{i}", main_pb2.TEXAS, now=i)
+        self.assertFalse(self.matchmaker.add("p1", main_pb2.TEXAS))
+        self.assertTrue(self.matchmaker.remove("p0"))
+        self.matchmaker.form_tables(now=3)
+        self.assertEqual(self.seats, [("p1", 0), ("p2", 0)])
+
+    def test_time_to_seat(self):
+        self.lobby(0, seats_free=4)
+        self.matchmaker.add("p0", main_pb2.TEXAS, now=0)
+        self.matchmaker.add("p1", main_pb2.TEXAS, now=2)
+        self.matchmaker.form_tables(now=4)
+        stats = self.matchmaker.stats()
+        self.assertEqual(stats["seated"], 2)
+        self.assertEqual(stats["p50_time_to_seat"], 2)
+        self.assertEqual(stats["p99_time_to_seat"], 4)
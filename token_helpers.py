@@ -0,0 +1,60 @@
+import base64
+import hashlib
+import hmac
+import json
+import time
+
+
+def make_token(secret, fields, ttl, now=None):
+    """
+    Sign fields into a token that expires after ttl seconds.
+
+    Parameters:
+    - secret:
+        key shared by every process that checks the token
+    - fields:
+        list of JSON values the token vouches for
+    - ttl:
+        seconds the token is valid for
+    """
+    now = time.time() if now is None else now
+    payload = base64.urlsafe_b64encode(json.dumps([now + ttl] + list(fields)).encode())
+    signature = hmac.new(secret.encode(), payload, hashlib.sha256).hexdigest()
+    return f"{payload.decode()}.{signature}"
+
+
+def read_token(secret, token, now=None):
+    """
+    Check a token made by make_token.
+
+    Returns its fields, or None if the token is malformed, forged or expired.
+    """
+    now = time.time() if now is None else now
+    payload, _, signature = token.encode().partition(b".")
+    expected = hmac.new(secret.encode(), payload, hashlib.sha256).hexdigest()
+    if not hmac.compare_digest(signature, expected.encode()):
+        return None
+    try:
+        expires, *fields = json.loads(base64.urlsafe_b64decode(payload))
+    except ValueError:
+        return None
+    if now > expires:
+        return None
+    return fields
+
+
+def make_session_token(secret, username, user_id, ttl):
+    """
+    Token issued at LOGIN and REGISTER, proving who the holder is.
+    """
+    return make_token(secret, ["session", username, user_id], ttl)
+
+
+def read_session_token(secret, token):
+    """
+    Returns (username, user_id) of a valid session token, or None.
+    """
+    fields = read_token(secret, token)
+    if fields is None or len(fields) != 3 or fields[0] != "session":
+        return None
+    return fields[1], fields[2]